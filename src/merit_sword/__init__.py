@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# __init__.py
+# ******************************************************************************
+
+# Purpose:
+# The merit_sword package holds the processing steps of MERIT-SWORD as
+# importable functions operating on layers and translations already loaded in
+# memory. The ms_*.py scripts read files, call these functions, and write
+# their results.
+
+# Author:
+# Jeffrey Wade, 2024
+
+
+# ******************************************************************************
+# Import package modules
+# ******************************************************************************
+from merit_sword.layer import Layer, concat_layers
+from merit_sword.overlap import region_overlap
+from merit_sword.trace import trace_region, trace_seeds, trace_network
+from merit_sword.translate import Translated, translate_region, \
+    update_region
+from merit_sword.diagnose import diagnose_region
+from merit_sword.transpose import transpose_table
+from merit_sword.transfer import transfer_values
+from merit_sword.antimeridian import spans_antimeridian, normalize_longitudes
+from merit_sword.sword_diff import diff_sword
+
+__all__ = ['Layer', 'concat_layers', 'region_overlap', 'trace_region',
+           'trace_seeds', 'trace_network',
+           'Translated', 'translate_region', 'update_region',
+           'diagnose_region', 'transpose_table', 'transfer_values',
+           'spans_antimeridian', 'normalize_longitudes', 'diff_sword']
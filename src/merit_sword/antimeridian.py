@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# antimeridian.py
+# ******************************************************************************
+
+# Purpose:
+# This module identifies geometries crossing the -180/180 meridian, whose
+# bounding boxes then span nearly the whole globe, and shifts longitudes into a
+# single convention: 'east' (longitudes beyond 180, as used by MERIT-Basins in
+# pfaf 35) or 'west' (longitudes beyond -180). Once a feature of a layer
+# crosses, all features on the far side of the antimeridian are shifted, so
+# that crossing features stay connected to their neighbours.
+
+# Author:
+# Jeffrey Wade, 2024
+
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import numpy as np
+import shapely
+
+
+# ******************************************************************************
+# Longitude conventions
+# ******************************************************************************
+def _east_lon(crd):
+    """Shift negative longitudes east of 180."""
+
+    crd = crd.copy()
+    east = crd[:, 0] < 0
+    crd[east, 0] = 180 + -1*(-180 - crd[east, 0])
+
+    return crd
+
+
+def _west_lon(crd):
+    """Shift positive longitudes west of -180."""
+
+    crd = crd.copy()
+    west = crd[:, 0] > 0
+    crd[west, 0] = -180 + -1*(180 - crd[west, 0])
+
+    return crd
+
+
+CONVENTIONS = {'east': _east_lon, 'west': _west_lon}
+
+
+# ******************************************************************************
+# Detect geometries crossing the antimeridian
+# ******************************************************************************
+def spans_antimeridian(geoms):
+    """Return a boolean array, True for geometries whose bounding box spans
+    more than 180 degrees of longitude. Missing and empty geometries are
+    False."""
+
+    bnd = shapely.bounds(geoms)
+    with np.errstate(invalid='ignore'):
+        return (bnd[:, 2] - bnd[:, 0]) > 180
+
+
+# ******************************************************************************
+# Normalize longitudes
+# ******************************************************************************
+def normalize_longitudes(geoms, convention='east', select=None):
+    """Return (geoms, modified): geometries with the longitudes of selected
+    features shifted into convention ('east' or 'west'), and a boolean array
+    of the features actually modified.
+
+    select is a boolean array of the features to shift, by default all
+    features if any spans the antimeridian, and none otherwise. Only selected
+    features with coordinates on the side being shifted are modified. Other
+    geometries are returned unchanged. Raises ValueError for an unknown
+    convention.
+    """
+
+    if convention not in CONVENTIONS:
+        raise ValueError('Unknown longitude convention: ' + str(convention))
+
+    geoms = np.array(geoms, dtype=object)
+    if select is None:
+        select = np.full(len(geoms), spans_antimeridian(geoms).any())
+    select = np.asarray(select, dtype=bool)
+
+    # Features with at least one coordinate on the side being shifted
+    crd, idx = shapely.get_coordinates(geoms, return_index=True)
+    side = crd[:, 0] < 0 if convention == 'east' else crd[:, 0] > 0
+    modified = select & (np.bincount(idx[side], minlength=len(geoms)) > 0)
+
+    # Shift coordinates of all modified features at once
+    if modified.any():
+        geoms[modified] = shapely.transform(geoms[modified],
+                                            CONVENTIONS[convention])
+
+    return geoms, modified
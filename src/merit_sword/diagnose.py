@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# diagnose.py
+# ******************************************************************************
+
+# Purpose:
+# This module flags the translations of a region between MERIT-Basins and
+# SWORD: translated reaches that are not topologically connected (1), reaches
+# with no translation (2), untranslated reaches intersecting translation
+# catchments (21), and SWORD reaches outside of the MERIT-Basins coastline
+# (22).
+
+# Author:
+# Jeffrey Wade, 2024
+
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+from collections import Counter
+import numpy as np
+import pandas as pd
+import shapely.prepared
+import rtree
+import ms_timing
+from merit_sword import pairs
+
+
+# ******************************************************************************
+# Diagnostics of a region
+# ******************************************************************************
+def diagnose_region(ms_trans, sm_trans, riv_ms, cat_mb, cat_sw, cat_dis_mb,
+                    sword, pfaf, threads=None):
+    """Return the (ms_flag, sm_flag) integer arrays of diagnostic flags of the
+    MB-to-SWORD and SWORD-to-MB translations of a region, aligned with
+    ms_trans.index and sm_trans.index.
+
+    ms_trans and sm_trans are ms_translation.Translation objects, riv_ms the
+    MERIT-SWORD reach layer of the region (COMID, NextDownID, up1 to up4),
+    cat_mb and cat_sw the MB-to-SWORD and SWORD-to-MB translation catchment
+    layers (COMID), and cat_dis_mb and sword dictionaries relating pfaf
+    regions to dissolved MB catchment layers and SWORD reach layers
+    (reach_id, rch_id_up, rch_id_dn). They must hold the regions referenced
+    by the translations, and sword the region pfaf itself. Given threads,
+    the pairs of the intersection diagnostics are found with bulk queries of
+    STRtrees (merit_sword.pairs) instead of a query of an R-tree per reach;
+    their predicates are evaluated by the queries themselves.
+    """
+
+    # --------------------------------------------------------------------------
+    # Generate connectivity dataframe for MB reach topology
+    # --------------------------------------------------------------------------
+    # Topological connections of MERIT-SWORD reaches, which may belong to
+    # other regions than the translated reaches
+    riv_con = pd.DataFrame(np.column_stack(
+        [riv_ms[x] for x in ['NextDownID', 'up1', 'up2', 'up3', 'up4']]),
+        index=riv_ms['COMID'])
+
+    # Translated reaches without connections are given zero values
+    con_df = pd.DataFrame(0, index=ms_trans.index, columns=range(5))
+    con_df = pd.concat([con_df[~con_df.index.isin(riv_con.index)], riv_con])
+
+    sm_flag = _diagnose_sm(sm_trans, con_df, cat_sw, cat_dis_mb,
+                           sword[pfaf], threads)
+    ms_flag = _diagnose_ms(ms_trans, cat_mb, sword, threads)
+
+    return ms_flag, sm_flag
+
+
+def _diagnose_sm(sm_trans, con_df, cat_sw, cat_dis_mb, sword_lay,
+                 threads=None):
+    """Flags of the SWORD-to-MB translation."""
+
+    sm_ids = sm_trans.ids[:, :40]
+    reach_id = sm_trans.index
+    sm_flag = np.zeros(len(reach_id), dtype='int64')
+
+    # Retrieve dissolved MERIT-Basins catchments for related regions
+    cat_dis_mb_lays = [cat_dis_mb[x] for x in sorted(cat_dis_mb) if x in
+                       sm_trans.regions()]
+
+    # Relate catchment id to bounds of feature geometry
+    ms_timing.phase('index')
+    ms_timing.count('features', len(cat_sw))
+    cat_sw_index = rtree.index.Index()
+    dis_cat_index = rtree.index.Index()
+    if threads is None:
+        cat_bnd = cat_sw.bounds
+        for cat_fid in range(len(cat_sw)):
+            cat_sw_index.insert(cat_fid, tuple(cat_bnd[cat_fid]))
+
+        # Relate pfaf id to bounds of feature geometry
+        for i in range(len(cat_dis_mb_lays)):
+            for cat_bnd in cat_dis_mb_lays[i].bounds:
+                dis_cat_index.insert(i, tuple(cat_bnd))
+
+    # Relate reach_id to index position
+    sword_row = dict(zip(sword_lay['reach_id'].tolist(),
+                         range(len(sword_lay))))
+
+    # --------------------------------------------------------------------------
+    # Confirm topology of MB translations
+    # --------------------------------------------------------------------------
+    # MB reaches referenced to each SWORD reach should be topologically
+    # connected
+    ms_timing.phase('topology')
+    ms_timing.count('features', len(reach_id))
+    for i in range(len(reach_id)):
+
+        # Retrieve referenced MB reaches from SWORD reach, removing zeroes
+        mb_ref = sm_ids[i]
+        mb_ref = mb_ref[mb_ref > 0].tolist()
+
+        # If there are 0 or 1 referenced MB reaches, diagnostic not possible
+        if len(mb_ref) > 1:
+
+            # Loop through MB reaches
+            for mb_id in mb_ref:
+
+                # Retrieve connected MB reaches, drop zeros
+                con_rch = con_df.loc[mb_id, :]
+                con_rch = con_rch[con_rch != 0]
+
+                # If MB reach is not connected to other referenced reaches
+                if not con_rch.isin(mb_ref).any():
+
+                    # Check for shared downstream neighbors with other
+                    # reaches, identifying duplicate downstream id values
+                    mb_ref_dn = [con_df.loc[x][0] for x in mb_ref]
+                    dn_cnt = Counter(mb_ref_dn)
+                    dup_dn = [x for x, val in dn_cnt.items() if val > 1]
+
+                    # If MB doesn't share downstream neighbor with another
+                    # selected reach, flag SWORD reach with 1
+                    if not con_df.loc[mb_id][0] in dup_dn:
+                        sm_flag[i] = 1
+
+                        # Proceed to next sword reach
+                        break
+
+    # --------------------------------------------------------------------------
+    # Run absent translation diagnostic
+    # --------------------------------------------------------------------------
+    # Flag reaches with 2 that do not have a corresponding translation
+    sword_notrans = np.where(sm_ids[:, 0] == 0)[0] if sm_ids.shape[1] > 0 \
+        else np.array([], dtype='int64')
+    sm_flag[sword_notrans] = 2
+
+    # --------------------------------------------------------------------------
+    # Run SWORD absent reach flow accumulation diagnostic
+    # --------------------------------------------------------------------------
+    # Flag SWORD reaches with no translation that intersect with MERIT-SWORD
+    # catchments, as their translation was removed with flow accumulation
+    ms_timing.phase('intersect')
+    ms_timing.count('features', len(sword_notrans))
+    n_pair = 0
+
+    if threads is not None:
+        return _diagnose_sm_pairs(sm_flag, sword_notrans, reach_id, sword_row,
+                                  sword_lay, cat_sw, cat_dis_mb_lays)
+
+    for i in sword_notrans:
+
+        # Retrieve SWORD geometry
+        sword_shy = sword_lay.geom(sword_row[int(reach_id[i])])
+
+        # Create prepared geometric object to allow for faster processing
+        sword_pre = shapely.prepared.prep(sword_shy)
+
+        # Filter MERIT-SWORD catchment bounding boxes with SWORD reaches
+        cat_int_fid = [int(x) for x in
+                       list(cat_sw_index.intersection(sword_shy.bounds))]
+        n_pair += len(cat_int_fid)
+
+        # If any SWORD reaches intersects with catchment, flag reach
+        for cat_fid in cat_int_fid:
+            if sword_pre.intersects(cat_sw.geom(cat_fid)):
+                sm_flag[i] = 21
+                break
+
+    # --------------------------------------------------------------------------
+    # Run SWORD ocean diagnostic
+    # --------------------------------------------------------------------------
+    # Flag SWORD reaches that don't have a MB counterpart and are located
+    # outside of the MB coastline
+    dis_shys = [x.geom(0) for x in cat_dis_mb_lays]
+
+    for i in sword_notrans:
+
+        sword_shy = sword_lay.geom(sword_row[int(reach_id[i])])
+
+        # Filter dissolved MB region bounding boxes with SWORD reaches
+        sword_int_fid = [int(x) for x in
+                         list(dis_cat_index.intersection(sword_shy.bounds))]
+        n_pair += len(sword_int_fid)
+
+        # If reach is outside MB region boundary
+        # (assumed to be ocean), flag reach with '22'
+        for j in sword_int_fid:
+            if not dis_shys[j].contains(sword_shy):
+                sm_flag[i] = 22
+
+    ms_timing.count('pairs', n_pair)
+
+    return sm_flag
+
+
+def _diagnose_sm_pairs(sm_flag, sword_notrans, reach_id, sword_row,
+                       sword_lay, cat_sw, cat_dis_mb_lays):
+    """Flags 21 and 22 of _diagnose_sm, with the pairs of SWORD reaches and
+    catchments of each flag found at once."""
+
+    sword_geom = sword_lay.geoms()[[sword_row[int(reach_id[i])] for i in
+                                    sword_notrans]]
+
+    # Flag SWORD reaches with no translation intersecting with catchments
+    row, _ = pairs.candidates(cat_sw.geoms(), sword_geom, 'intersects')
+    sm_flag[sword_notrans[row]] = 21
+    n_pair = len(row)
+
+    # Flag SWORD reaches outside of the MB coastline with '22': reaches
+    # within the bounds of a dissolved region but not contained by it
+    dis_geom = np.empty(len(cat_dis_mb_lays), dtype=object)
+    dis_geom[:] = [x.geom(0) for x in cat_dis_mb_lays]
+    row, fid = pairs.candidates(dis_geom, sword_geom)
+    dis_row, sword_in = pairs.candidates(sword_geom, dis_geom, 'contains')
+    out = ~np.isin(row * len(dis_geom) + fid,
+                   sword_in * len(dis_geom) + dis_row)
+    sm_flag[sword_notrans[row[out]]] = 22
+    n_pair += len(row)
+
+    ms_timing.count('pairs', n_pair)
+
+    return sm_flag
+
+
+def _diagnose_ms(ms_trans, cat_mb, sword, threads=None):
+    """Flags of the MB-to-SWORD translation."""
+
+    ms_ids = ms_trans.ids[:, :40]
+    comid = ms_trans.index
+    ms_flag = np.zeros(len(comid), dtype='int64')
+
+    # Retrieve SWORD layers of related regions
+    sword_lays = [sword[x] for x in sorted(sword) if x in ms_trans.regions()]
+
+    # Relate catchment id to bounds of feature geometry
+    ms_timing.phase('index')
+    ms_timing.count('features', len(cat_mb) + sum(len(x) for x in sword_lays))
+    cat_index = rtree.index.Index()
+    sword_index = rtree.index.Index()
+    if threads is None:
+        cat_bnd = cat_mb.bounds
+        for cat_fid in range(len(cat_mb)):
+            cat_index.insert(cat_fid, tuple(cat_bnd[cat_fid]))
+
+        # Relate sword id to bounds of feature geometry
+        # Create counter to store the index of the corresponding SWORD region
+        # Counter is shifted by 1, as leading zeros deleted as integer
+        ct = 1
+        for sword_lay in sword_lays:
+            sword_bnd = sword_lay.bounds
+            for j in range(len(sword_lay)):
+                # Index of sword layer stored as first digit
+                sword_fid = int(str(ct) + str(j))
+                sword_index.insert(sword_fid, tuple(sword_bnd[j]))
+            ct = ct + 1
+
+    # --------------------------------------------------------------------------
+    # Create lookup tables for SWORD connectivity
+    # --------------------------------------------------------------------------
+    ms_timing.phase('topology')
+    ms_timing.count('features', len(comid))
+    s_con_dn = {}
+    s_con_up = {}
+
+    # Link SWORD reach_ids to their reach connections
+    for sword_lay in sword_lays:
+        for id_up, id_dn, rch_id in zip(sword_lay['rch_id_up'],
+                                        sword_lay['rch_id_dn'],
+                                        sword_lay['reach_id'].tolist()):
+
+            # Catch empty id_up or id_dn
+            if id_up is not None:
+                up_list = id_up.split(" ")
+            if id_dn is not None:
+                dn_list = id_dn.split(" ")
+
+            # Add ids as integers to dictionary
+            s_con_up[rch_id] = [int(x) for x in up_list]
+            s_con_dn[rch_id] = [int(x) for x in dn_list]
+
+    # --------------------------------------------------------------------------
+    # Confirm topology of SWORD translations
+    # --------------------------------------------------------------------------
+    # SWORD reaches referenced to each MB reach should be topologically
+    # connected
+    for i in range(len(comid)):
+
+        # Retrieve referenced SWORD reaches from MB reach, removing zeroes
+        sword_ref = ms_ids[i]
+        sword_ref = sword_ref[sword_ref > 0].tolist()
+
+        # If there are 0 or 1 referenced SWORD reaches, diagnostic not
+        # possible
+        if len(sword_ref) > 1:
+
+            # Loop through SWORD reaches
+            for sword_id in sword_ref:
+
+                # Retrieve connected SWORD reaches, drop zeros
+                con_rch = pd.Series(s_con_dn[sword_id] + s_con_up[sword_id])
+                con_rch = con_rch[con_rch != 0]
+
+                # If SWORD reach is not connected to other referenced reaches
+                if not con_rch.isin(sword_ref).any():
+
+                    # Check for shared downstream and upstream neighbors with
+                    # other reaches, identifying duplicate id values
+                    sword_ref_dn = []
+                    sword_ref_up = []
+                    for x in sword_ref:
+                        sword_ref_dn.extend(s_con_dn[x])
+                        sword_ref_up.extend(s_con_up[x])
+
+                    dn_cnt = Counter(sword_ref_dn)
+                    dup_dn = [x for x, val in dn_cnt.items() if val > 1]
+                    up_cnt = Counter(sword_ref_up)
+                    dup_up = [x for x, val in up_cnt.items() if val > 1]
+
+                    # If MB doesn't share downstream  or upstream neighbor
+                    # with another selected reach, flag SWORD reach with 1
+                    if not any(val in s_con_dn[sword_id] for val in dup_dn) \
+                       and not any(val in s_con_up[sword_id] for val in
+                                   dup_up):
+                        ms_flag[i] = 1
+
+                        # Proceed to next sword reach
+                        break
+
+    # --------------------------------------------------------------------------
+    # Run absent translation diagnostic
+    # --------------------------------------------------------------------------
+    # Flag reaches with 2 that do not have a corresponding translation
+    ms_notrans = np.where(ms_ids[:, 0] == 0)[0] if ms_ids.shape[1] > 0 \
+        else np.array([], dtype='int64')
+    ms_flag[ms_notrans] = 2
+
+    # --------------------------------------------------------------------------
+    # Run MB absent reach flow accumulation diagnostic
+    # --------------------------------------------------------------------------
+    # Flag MB reaches with no translation that intersect with SWORD reaches,
+    # as their translation was removed with flow accumulation
+    ms_timing.phase('intersect')
+    ms_timing.count('features', len(ms_notrans))
+    ms_row = dict(zip(comid.tolist(), range(len(comid))))
+    notrans = set(comid[ms_notrans].tolist())
+    n_pair = 0
+
+    if threads is not None:
+        return _diagnose_ms_pairs(ms_flag, ms_row, notrans, cat_mb,
+                                  sword_lays)
+
+    for cat_fid in range(len(cat_mb)):
+
+        # Check if MB reach has no translation
+        mb_id = int(cat_mb['COMID'][cat_fid])
+        if mb_id not in notrans:
+            continue
+
+        # Retrieve translation cat geometry
+        cat_shy = cat_mb.geom(cat_fid)
+
+        # Create prepared geometric object to allow for faster processing
+        cat_pre = shapely.prepared.prep(cat_shy)
+
+        # Filter SWORD reach bounding boxes with MB Catchments
+        sword_int_fid = [int(x) for x in
+                         list(sword_index.intersection(cat_shy.bounds))]
+        n_pair += len(sword_int_fid)
+
+        # Intersect of filtered SWORD reaches
+        for i in range(len(sword_int_fid)):
+
+            # Load relevant sword layer
+            # sword layer integer shifted by 1 to prevent leading zero from
+            # being deleted
+            sword_lay = sword_lays[int(str(sword_int_fid[i])[0])-1]
+
+            # Retrieve SWORD geometry corresponding to intersect fid
+            sword_shy = sword_lay.geom(int(str(sword_int_fid[i])[1:]))
+
+            # If any SWORD reaches intersects with catchment, flag reach
+            if cat_pre.intersects(sword_shy):
+                ms_flag[ms_row[mb_id]] = 21
+                break
+
+    ms_timing.count('pairs', n_pair)
+
+    return ms_flag
+
+
+def _diagnose_ms_pairs(ms_flag, ms_row, notrans, cat_mb, sword_lays):
+    """Flag 21 of _diagnose_ms, with the SWORD reaches intersected by all
+    catchments found at once."""
+
+    # Catchments of MB reaches with no translation
+    cat_row = [x for x in range(len(cat_mb)) if int(cat_mb['COMID'][x]) in
+               notrans]
+    cat_geom = cat_mb.geoms()[cat_row]
+
+    # SWORD reaches of all regions
+    sword_geom = np.empty(sum(len(x) for x in sword_lays), dtype=object)
+    sword_geom[:] = [x for y in sword_lays for x in y.geoms()]
+
+    # If any SWORD reaches intersects with catchment, flag reach
+    row, _ = pairs.candidates(sword_geom, cat_geom, 'intersects')
+    for i in np.unique(row):
+        ms_flag[ms_row[int(cat_mb['COMID'][cat_row[i]])]] = 21
+
+    ms_timing.count('pairs', len(row))
+
+    return ms_flag
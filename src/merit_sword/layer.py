@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# layer.py
+# ******************************************************************************
+
+# Purpose:
+# This module defines the in-memory layers passed to the functions of the
+# merit_sword package. A layer holds the attribute columns of a shapefile as
+# NumPy arrays, and its geometries either as WKB read by ms_io.py, as a
+# memory-mapped geometry store from ms_geom_store.py, or as views of a layer
+# published in shared memory by ms_shared.py.
+
+# Author:
+# Jeffrey Wade, 2024
+
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import shapely
+import ms_io
+import ms_geom_store
+import ms_shared
+
+
+# ******************************************************************************
+# Layer
+# ******************************************************************************
+class Layer:
+    """Attribute columns and geometries of a layer, in feature order."""
+
+    def __init__(self, meta, fields, geometry=None, store=None):
+        self.meta = meta
+        self.fields = fields
+        self.geometry = geometry
+        self.store = store
+        self._geoms = None
+
+    @classmethod
+    def read(cls, shp, columns=None, store_id=None, read_geometry=True):
+        """Read shp, keeping geometries as WKB, or in the memory-mapped
+        geometry store keyed by store_id if given. Layers published in shared
+        memory are read as views of their segment."""
+
+        shared = ms_shared.attach(shp)
+        if shared is not None:
+            meta, fields, _ = shared.read(columns, read_geometry=False)
+            return cls(meta, fields,
+                       store=shared.store(store_id) if read_geometry or
+                       store_id is not None else None)
+
+        if store_id is None:
+            return cls(*ms_io.read_layer(shp, columns,
+                                         read_geometry=read_geometry))
+
+        meta, fields, _ = ms_io.read_layer(shp, columns, read_geometry=False)
+        return cls(meta, fields,
+                   store=ms_geom_store.open_store(shp, store_id))
+
+    def __len__(self):
+        if self.store is not None:
+            return len(self.store)
+        if self.geometry is not None:
+            return len(self.geometry)
+        return len(next(iter(self.fields.values())))
+
+    def __getitem__(self, name):
+        return self.fields[name]
+
+    def geom(self, i):
+        """Return the shapely geometry of feature i."""
+
+        if self._geoms is not None:
+            return self._geoms[i]
+        if self.store is not None:
+            return self.store.geom(i)
+        return shapely.from_wkb(self.geometry[i])
+
+    def geoms(self):
+        """Return an array of the shapely geometries of all features."""
+
+        if self._geoms is None:
+            if self.store is not None:
+                self._geoms = self.store.geoms()
+            else:
+                self._geoms = shapely.from_wkb(self.geometry)
+        return self._geoms
+
+    @property
+    def bounds(self):
+        """Array of (minx, miny, maxx, maxy) bounds of all features."""
+
+        if self.store is not None:
+            return self.store.bounds
+        return shapely.bounds(self.geoms()).reshape(-1, 4)
+
+    def wkb(self):
+        """Return an object array of the WKB geometries of all features."""
+
+        if self.geometry is None:
+            self.geometry = self.store.wkb_array()
+        return self.geometry
+
+    def subset(self, keep):
+        """Return the features selected by the boolean array keep."""
+
+        # Geometries of a geometry store stay views of the store
+        return Layer(self.meta, {name: col[keep] for name, col in
+                                 self.fields.items()}, self.wkb()[keep])
+
+    def write(self, shp, meta=None):
+        """Write the layer to shp, with the metadata of another layer if
+        given."""
+
+        ms_io.write_layer(shp, self.meta if meta is None else meta,
+                          self.fields, self.wkb())
+
+
+def concat_layers(layers):
+    """Concatenate layers sharing the same fields, keeping the metadata of the
+    first layer."""
+
+    return Layer(*ms_io.concat_layers([(x.meta, x.fields, x.wkb()) for x in
+                                       layers]))
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# overlap.py
+# ******************************************************************************
+
+# Purpose:
+# This module identifies the MERIT-Basins regions overlapped by the reaches of
+# each SWORD region, and the SWORD regions overlapping each MERIT-Basins region.
+
+# Author:
+# Jeffrey Wade, 2024
+
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import numpy as np
+import pandas as pd
+import shapely.prepared
+import ms_timing
+
+
+# ******************************************************************************
+# Region overlap
+# ******************************************************************************
+def region_overlap(sword, dis_mb, pfaf_srt):
+    """Return the (sw_to_mb_reg, mb_to_sw_reg) overlap tables.
+
+    sword and dis_mb are lists of SWORD reach layers and dissolved MB
+    catchment layers, both aligned with the sorted Series of pfaf regions
+    pfaf_srt.
+    """
+
+    # --------------------------------------------------------------------------
+    # Identify mapping of SWORD regions to overlapping MB regions
+    # --------------------------------------------------------------------------
+    # Prepare geometries of each MERIT-Basins catchment boundary
+    ms_timing.phase('index')
+    dis_pre_all = [shapely.prepared.prep(x.geom(0)) for x in dis_mb]
+
+    # Initalize list to store MB regions corresponding to each sword region
+    ms_timing.phase('intersect')
+    sw_to_mb_id = []
+    n_pair = 0
+
+    # Loop through pfaf regions
+    for j in range(len(pfaf_srt)):
+
+        # Retrieve prepared MERIT-Basins region boundary for each pfaf
+        dis_pre = dis_pre_all[j]
+
+        # Retrieve all MERIT-Basins regions except for current loop iteration
+        dis_pre_else = dis_pre_all[:j] + dis_pre_all[j+1:]
+        pfaf_else = pfaf_srt.drop(j).tolist()
+
+        # Initialize list to store corresponding MERIT-Basins region ids
+        id_list = [pfaf_srt[j]]
+
+        # Loop through SWORD reaches
+        for sword_shy in sword[j].geoms():
+
+            # If reach is outside correct MERIT-Basins region boundary
+            n_pair += 1
+            if not dis_pre.contains(sword_shy):
+                n_pair += len(dis_pre_else)
+
+                # Check if reach is contained by another MERIT-Basins region
+                for i in range(len(dis_pre_else)):
+
+                    # If reach is within another MB catchment, flag region
+                    if dis_pre_else[i].intersects(sword_shy):
+
+                        # Append region to list
+                        id_list.append(pfaf_else[i])
+
+        # Append unique regions to mb_id list
+        sw_to_mb_id.append(sorted(list(set(id_list))))
+        ms_timing.count('features', len(sword[j]))
+
+    ms_timing.count('pairs', n_pair)
+
+    # --------------------------------------------------------------------------
+    # SWORD region to overlapping MB regions
+    # --------------------------------------------------------------------------
+    # Find max overlapping regions for a single region
+    max_mb = max(len(x) for x in sw_to_mb_id)
+
+    # Pad lists to the same length
+    sw_to_mb_pad = [x + [np.nan] * (max_mb - len(x)) for x in sw_to_mb_id]
+
+    # Convert to df, with index set to pfaf_srt
+    sw_to_mb_reg = pd.DataFrame(sw_to_mb_pad)
+    sw_to_mb_reg.index = pfaf_srt
+
+    # Rename columns
+    sw_to_mb_reg.index.name = 'sword'
+    sw_to_mb_reg.columns = ['mb'+str(x) for x in range(max_mb)]
+
+    # --------------------------------------------------------------------------
+    # MB region to overlapping SWORD regions
+    # --------------------------------------------------------------------------
+    # Convert mb_ind to dictionary
+    sw_to_mb_dict = {}
+
+    for j in range(len(sw_to_mb_id)):
+        sw_to_mb_dict[pfaf_srt[j]] = sw_to_mb_id[j]
+
+    # Reverse dictionary to map MB regions to overlapping SWORD regions
+    mb_to_sw_dict = {}
+
+    for key, val in sw_to_mb_dict.items():
+        for reg in val:
+            if reg not in mb_to_sw_dict:
+                mb_to_sw_dict[reg] = []
+            mb_to_sw_dict[reg].append(key)
+
+    # Sort dictionary
+    mb_to_sw_dict = {key: mb_to_sw_dict[key] for key in sorted(mb_to_sw_dict)}
+
+    # Find max overlapping regions for a single region
+    max_sw = max(len(x) for x in mb_to_sw_dict.values())
+
+    # Pad lists to the same length
+    mb_to_sw_pad = {x: y + [np.nan] * (max_sw - len(y)) for x, y in
+                    mb_to_sw_dict.items()}
+
+    # Convert to df
+    mb_to_sw_reg = pd.DataFrame.from_dict(mb_to_sw_pad, orient='index')
+
+    # Rename columns
+    mb_to_sw_reg.index.name = 'mb'
+    mb_to_sw_reg.columns = ['sword'+str(x) for x in range(max_sw)]
+
+    return sw_to_mb_reg, mb_to_sw_reg
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# pairs.py
+# ******************************************************************************
+
+# Purpose:
+# This module finds the pairs of geometries satisfying a predicate (e.g. SWORD
+# reaches and the MERIT-Basins catchments they intersect) with a single bulk
+# query of a shapely STRtree, and evaluates intersections on arrays of pairs
+# with the vectorized functions of shapely, which release the GIL. Pairs are
+# split into chunks processed by a pool of threads, sharing the geometries of
+# the process without copying. Predicates are evaluated by the query, so that
+# threads never use prepared geometries, which are not thread-safe.
+
+# Author:
+# Jeffrey Wade, 2024
+
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import concurrent.futures
+import numpy as np
+import shapely
+
+
+# ******************************************************************************
+# Pair parameters
+# ******************************************************************************
+# Number of candidate pairs processed at once by a thread
+CHUNK = 10000
+
+
+# ******************************************************************************
+# Evaluate pairs in threads
+# ******************************************************************************
+def map_pairs(func, a, b, threads=None, chunk=CHUNK):
+    """Return func(a, b) for the arrays a and b of geometries of pairs,
+    computed in chunks of chunk pairs by up to threads threads (default:
+    number of CPUs).
+
+    func is built on vectorized shapely functions not using prepared
+    geometries (e.g. intersection), and returns an array or a tuple of
+    arrays, concatenated over chunks.
+    """
+
+    if len(a) == 0:
+        return func(a, b)
+
+    def run(k):
+        return func(a[k:k + chunk], b[k:k + chunk])
+
+    with concurrent.futures.ThreadPoolExecutor(threads) as pool:
+        res = list(pool.map(run, range(0, len(a), chunk)))
+
+    if isinstance(res[0], tuple):
+        return tuple(np.concatenate(x) for x in zip(*res))
+    return np.concatenate(res)
+
+
+def intersection_lengths(lines, polys):
+    """Return the lengths of the lines within the polygons of arrays of
+    intersecting pairs of lines and polygons. Invalid polygons are buffered
+    by 0 before their intersection."""
+
+    polys = polys.copy()
+    bad = ~shapely.is_valid(polys)
+    polys[bad] = shapely.buffer(polys[bad], 0)
+
+    return shapely.length(shapely.intersection(lines, polys))
+
+
+# ******************************************************************************
+# Find pairs with a bulk query
+# ******************************************************************************
+def candidates(tree_geoms, geoms, predicate=None):
+    """Return the (row, fid) arrays of the pairs of the geometries geoms
+    (row) and tree_geoms (fid) for which predicate(geoms[row],
+    tree_geoms[fid]) is True (e.g. 'intersects', or None for overlapping
+    bounds), in order of row then fid. All pairs are found with a single
+    query of an STRtree of tree_geoms, with geoms prepared."""
+
+    if len(geoms) == 0 or len(tree_geoms) == 0:
+        return np.zeros(0, dtype='int64'), np.zeros(0, dtype='int64')
+
+    row, fid = shapely.STRtree(tree_geoms).query(geoms, predicate=predicate)
+    srt = np.lexsort((fid, row))
+
+    return row[srt].astype('int64'), fid[srt].astype('int64')
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# sword_diff.py
+# ******************************************************************************
+
+# Purpose:
+# This module compares two versions of the SWORD reaches of a region by
+# reach_id and geometry hash, and classifies the reaches that differ as added,
+# removed, geometry-changed or attribute-only changed, so that only the
+# affected reaches are traced and translated again.
+
+# Author:
+# Jeffrey Wade, 2024
+
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import hashlib
+import numpy as np
+import pandas as pd
+
+
+# ******************************************************************************
+# Classes of changed reaches
+# ******************************************************************************
+ADDED = 'added'
+REMOVED = 'removed'
+GEOMETRY = 'geometry'
+ATTRIBUTE = 'attribute'
+
+
+# ******************************************************************************
+# Compare SWORD versions
+# ******************************************************************************
+def geom_hash(wkb):
+    """Return an array of the hashes of an array of WKB geometries, with
+    missing geometries hashed as empty bytes."""
+
+    return np.array([hashlib.blake2b(b'' if x is None else bytes(x),
+                                     digest_size=16).hexdigest() for x in wkb],
+                    dtype=object)
+
+
+def _differs(a, b):
+    """Return a boolean array, True where arrays a and b differ, with NaN
+    values equal to each other."""
+
+    if a.dtype.kind == 'f' and b.dtype.kind == 'f':
+        return ~((a == b) | (np.isnan(a) & np.isnan(b)))
+    return np.asarray(a != b, dtype=bool)
+
+
+def diff_sword(old, new):
+    """Return a DataFrame of the reach_ids and classes (ADDED, REMOVED,
+    GEOMETRY or ATTRIBUTE) of the SWORD reaches that differ between layers
+    old and new, sorted by reach_id.
+
+    Reaches are matched by reach_id. Matched reaches with different geometry
+    hashes are GEOMETRY changes, and reaches with identical geometries but
+    different values of any attribute of both layers are ATTRIBUTE changes.
+    """
+
+    old_id = np.asarray(old['reach_id'], dtype='int64')
+    new_id = np.asarray(new['reach_id'], dtype='int64')
+
+    # Matched reaches
+    _, old_row, new_row = np.intersect1d(old_id, new_id, assume_unique=True,
+                                         return_indices=True)
+
+    # Geometry changes
+    geo = geom_hash(old.wkb()[old_row]) != geom_hash(new.wkb()[new_row])
+
+    # Attribute changes among reaches of unchanged geometry
+    att = np.zeros(len(old_row), dtype=bool)
+    for name in old.fields:
+        if name != 'reach_id' and name in new.fields:
+            att |= _differs(np.asarray(old[name])[old_row],
+                            np.asarray(new[name])[new_row])
+    att &= ~geo
+
+    diff = pd.DataFrame({
+        'reach_id': np.concatenate([np.setdiff1d(new_id, old_id),
+                                    np.setdiff1d(old_id, new_id),
+                                    old_id[old_row[geo]],
+                                    old_id[old_row[att]]]),
+        'status': [ADDED] * len(np.setdiff1d(new_id, old_id)) +
+        [REMOVED] * len(np.setdiff1d(old_id, new_id)) +
+        [GEOMETRY] * int(geo.sum()) + [ATTRIBUTE] * int(att.sum())})
+
+    return diff.sort_values('reach_id', ignore_index=True)
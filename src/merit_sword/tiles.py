@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# tiles.py
+# ******************************************************************************
+
+# Purpose:
+# This module splits the reaches of a region into square spatial tiles, so
+# that a large region is processed by several worker processes. Reaches are
+# assigned to the tile holding the center of their bounds, and each tile is
+# given the other features (e.g. catchments) overlapping its halo: the tile
+# extended by the bounds of its own reaches, so that every feature whose
+# bounds overlap one of its reaches is available to the worker.
+
+# Author:
+# Jeffrey Wade, 2024
+
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import concurrent.futures
+import numpy as np
+import ms_timing
+
+
+# ******************************************************************************
+# Bounding boxes
+# ******************************************************************************
+def overlaps(bnd, box):
+    """Return a boolean array, True where the bounds bnd overlap box."""
+
+    return (bnd[:, 0] <= box[2]) & (bnd[:, 2] >= box[0]) & \
+        (bnd[:, 1] <= box[3]) & (bnd[:, 3] >= box[1])
+
+
+def extent(bnd):
+    """Return the (minx, miny, maxx, maxy) box holding all bounds bnd."""
+
+    return np.concatenate([bnd[:, :2].min(axis=0), bnd[:, 2:].max(axis=0)])
+
+
+# ******************************************************************************
+# Tiles
+# ******************************************************************************
+def tile_rows(bnd, tile_deg):
+    """Return the rows of bounds bnd in each square tile of tile_deg degrees
+    holding the center of their bounds, as boolean arrays in order of tiles
+    (by latitude, then longitude). Empty tiles are skipped."""
+
+    if len(bnd) == 0:
+        return []
+
+    # Tile of the center of each bounds, relative to the lower left corner of
+    # the region
+    ctr = (bnd[:, :2] + bnd[:, 2:]) / 2
+    ij = np.floor((ctr - ctr.min(axis=0)) / tile_deg).astype('int64')
+    key = ij[:, 1] * (ij[:, 0].max() + 1) + ij[:, 0]
+
+    return [key == x for x in np.unique(key)]
+
+
+def run_tiles(func, args, workers=None):
+    """Return the results of func for the arguments args of each tile, in
+    order of tiles, computed in up to workers processes (default: number of
+    CPUs). Phases recorded by the workers are merged into the run."""
+
+    if workers == 1 or len(args) <= 1:
+        return [func(*x) for x in args]
+
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        return ms_timing.worker_map(pool, func, *zip(*args))
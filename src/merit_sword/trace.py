@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# trace.py
+# ******************************************************************************
+
+# Purpose:
+# This module identifies the MERIT-Basins reaches corresponding to the reaches
+# of a SWORD region: MERIT-Basins catchments intersected by SWORD reaches are
+# selected, traced down-network, and filtered by distance to SWORD.
+
+# Author:
+# Jeffrey Wade, 2024
+
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import numpy as np
+import shapely
+import shapely.ops
+import shapely.prepared
+import rtree
+import ms_timing
+from merit_sword import pairs
+from merit_sword.tiles import overlaps, extent, tile_rows, run_tiles
+
+
+# ******************************************************************************
+# Trace MERIT-SWORD network of a region
+# ******************************************************************************
+def _seeds(sword, cat_mb, threads=None):
+    """Return the (reach_id, COMID) arrays of the MB reaches selected by the
+    SWORD reaches of sword in each of the catchment layers cat_mb, and the
+    number of candidate catchments. Given threads, pairs of reaches and
+    catchments are found without R-trees, and intersected in up to threads
+    threads."""
+
+    # --------------------------------------------------------------------------
+    # Create spatial index for bounds of each MERIT-Basins catchment
+    # --------------------------------------------------------------------------
+    # Initialize list to store index for each pfaf region
+    ms_timing.phase('index')
+    cat_index = []
+
+    # Loop through overlapping pfaf regions
+    for cat_lay in cat_mb:
+        ms_timing.count('features', len(cat_lay))
+        if threads is not None:
+            continue
+
+        # Relate catchment id to bounds of feature geometry
+        cat_index_j = rtree.index.Index()
+        cat_bnd = cat_lay.bounds
+        for cat_fid in range(len(cat_lay)):
+            cat_index_j.insert(cat_fid, tuple(cat_bnd[cat_fid]))
+
+        # Append to list
+        cat_index.append(cat_index_j)
+
+    # --------------------------------------------------------------------------
+    # Identify MERIT-Basins catchments intersected by SWORD reaches
+    # --------------------------------------------------------------------------
+    ms_timing.phase('intersect')
+    sword_geom = sword.geoms()
+    sword_id = sword['reach_id'].tolist() if 'reach_id' in sword.fields \
+        else [0] * len(sword_geom)
+    seed_id = []
+    riv_out = []
+    n_pair = 0
+
+    # Loop through relevant MERIT-Basins regions
+    for i in range(len(cat_mb)):
+
+        if threads is not None:
+            sel_id, sel_out, n = _seeds_pairs(sword_geom, sword_id, cat_mb[i],
+                                              threads)
+            seed_id.extend(sel_id)
+            riv_out.extend(sel_out)
+            n_pair += n
+            continue
+
+        for j, sword_shy in enumerate(sword_geom):
+
+            # Create prepared geometric object to allow for faster processing
+            sword_pre = shapely.prepared.prep(sword_shy)
+
+            # Filter MB catchment bounding boxes with SWORD reach
+            riv_int_fid = [int(x) for x in
+                           list(cat_index[i].intersection(sword_shy.bounds))]
+            n_pair += len(riv_int_fid)
+
+            # Intersect index filtered MB catchments with SWORD reaches
+            comid_dict = {}
+
+            for t in range(len(riv_int_fid)):
+
+                # Retrieve MB cat geometry corresponding to intersect fid
+                cat_shy = cat_mb[i].geom(riv_int_fid[t])
+                cat_comid = int(cat_mb[i]['COMID'][riv_int_fid[t]])
+
+                # If catchment intersects with reach, extract properties
+                if sword_pre.intersects(cat_shy):
+
+                    # Check for valid catchment geometry (self-ring
+                    # intersects)
+                    if not cat_shy.is_valid:
+
+                        # Zero distance buffer for invalid geometries
+                        cat_shy = cat_shy.buffer(0)
+
+                    # Catch errors where SWORD reaches have 0 length
+                    if sword_shy.length > 0:
+                        # Store frac of SWORD reach contained by intersect cat
+                        # Key is fractional intersection value
+                        comid_dict[sword_shy.intersection(cat_shy).length /
+                                   sword_shy.length] = cat_comid
+                    else:
+                        comid_dict[0] = cat_comid
+
+            # Order MB comids by fraction of SWORD reach contained within cat
+            cat_ord = [comid_dict[x] for x in
+                       sorted(comid_dict.keys(), reverse=True)]
+
+            if len(cat_ord) > 0:
+                # Add cat with highest proportion of intersection to list
+                seed_id.append(sword_id[j])
+                riv_out.append(cat_ord[0])
+
+    return np.array(seed_id, dtype='int64'), \
+        np.array(riv_out, dtype='int64'), n_pair
+
+
+def _seeds_pairs(sword_geom, sword_id, cat_lay, threads):
+    """Return the (reach_id, COMID) lists of the MB reaches selected by the
+    SWORD reaches sword_geom in the catchment layer cat_lay, and the number
+    of intersected catchments, with the catchments intersected by all SWORD
+    reaches found at once, and intersected in threads (as in _seeds).
+    Catchments holding equal fractions of a reach are taken in order of
+    their rows."""
+
+    # Catchments intersected by each SWORD reach
+    cat_geom = cat_lay.geoms()
+    row, fid = pairs.candidates(cat_geom, sword_geom, 'intersects')
+
+    # Length of SWORD reaches within intersected catchments
+    length = pairs.map_pairs(pairs.intersection_lengths, sword_geom[row],
+                             cat_geom[fid], threads)
+    sword_len = shapely.length(sword_geom)
+    start = np.searchsorted(row, np.arange(len(sword_geom) + 1))
+
+    seed_id = []
+    riv_out = []
+    for j in range(len(sword_geom)):
+
+        # Fraction of SWORD reach contained by each intersected catchment
+        comid_dict = {}
+        for k in range(start[j], start[j + 1]):
+            frac = float(length[k]) / float(sword_len[j]) if \
+                sword_len[j] > 0 else 0
+            comid_dict[frac] = int(cat_lay['COMID'][fid[k]])
+
+        # Add cat with highest proportion of intersection to list
+        if len(comid_dict) > 0:
+            seed_id.append(sword_id[j])
+            riv_out.append(comid_dict[max(comid_dict)])
+
+    return seed_id, riv_out, len(row)
+
+
+def trace_seeds(sword, riv_mb, cat_mb, tile_deg=None, workers=None,
+                threads=None):
+    """Return the (reach_id, COMID) arrays of the MB reaches selected by the
+    SWORD reaches of a region: in each overlapping MB region, the reach whose
+    catchment holds the largest fraction of the SWORD reach.
+
+    sword is the layer of SWORD reaches (reach_id) of the region, and riv_mb
+    and cat_mb are lists of MB reach and catchment (COMID) layers of the MB
+    regions overlapping it, in the same order. Given tile_deg, SWORD reaches
+    are split into square tiles of tile_deg degrees processed in up to
+    workers processes, each with the catchments overlapping the halo of its
+    tile, and the selections are merged in order of tiles. Given threads,
+    the candidate pairs of SWORD reaches and catchments are intersected in up
+    to threads threads (of each worker).
+    """
+
+    if tile_deg is None:
+        seed_id, riv_out, n_pair = _seeds(sword, cat_mb, threads)
+
+    else:
+        ms_timing.phase('intersect')
+        sword_bnd = sword.bounds
+        args = []
+        for rows in tile_rows(sword_bnd, tile_deg):
+            box = extent(sword_bnd[rows])
+            args.append((sword.subset(rows),
+                         [x.subset(overlaps(x.bounds, box)) for x in cat_mb],
+                         threads))
+        res = run_tiles(_seeds, args, workers)
+        seed_id = np.concatenate([x[0] for x in res] +
+                                 [np.array([], dtype='int64')])
+        riv_out = np.concatenate([x[1] for x in res] +
+                                 [np.array([], dtype='int64')])
+        n_pair = sum(x[2] for x in res)
+
+    ms_timing.count('features', len(sword))
+    ms_timing.count('pairs', n_pair)
+
+    return seed_id, riv_out
+
+
+def trace_network(seeds, sword, riv_mb, rem_buf=.09):
+    """Return the COMIDs of the MERIT-SWORD network traced downstream from
+    the MB reaches seeds, keeping reaches within rem_buf (degrees) of the
+    SWORD reaches of sword. riv_mb is the list of MB reach layers (COMID,
+    NextDownID) of the overlapping MB regions."""
+
+    # --------------------------------------------------------------------------
+    # Trace selected MERIT-Basins reaches down-network using ID links
+    # --------------------------------------------------------------------------
+    # Remove duplicate values
+    ms_timing.phase('trace')
+    mb_sel = list(set(np.asarray(seeds).tolist()))
+
+    # Initialize list to store selected MERIT-Basins reaches
+    riv_trace = []
+    riv_trace.extend(mb_sel)
+
+    # Create dictionary of MB reaches and their next downstream ID
+    nd_dict = {}
+    for riv_lay in riv_mb:
+        nd_dict.update(zip(riv_lay['COMID'].tolist(),
+                           riv_lay['NextDownID'].tolist()))
+
+    # Loop through mb_sel reaches
+    for rch in mb_sel:
+
+        # Retrieve ID of first downstream reach
+        nextid = nd_dict[rch]
+        riv_trace.append(nextid)
+
+        # Continue finding next downstream reach until end of network
+        while nextid != 0:
+            nextid = nd_dict[nextid]
+            riv_trace.append(nextid)
+
+    # Remove duplicates and zeroes from riv_trace list
+    riv_trace = [i for i in set(riv_trace) if i != 0]
+
+    # --------------------------------------------------------------------------
+    # Remove MERIT-Basins reaches outside of buffer of SWORD reaches
+    # --------------------------------------------------------------------------
+    # Merge sword into single feature to speed up distance calculation
+    ms_timing.phase('filter')
+    ms_timing.count('features', len(riv_trace))
+    sword_merge = shapely.ops.unary_union(list(sword.geoms()))
+
+    # Keep traced reaches within buffer distance of sword network
+    riv_fil = []
+    for riv_lay in riv_mb:
+        riv_sel = np.where(np.isin(riv_lay['COMID'], riv_trace))[0]
+        sword_dis = shapely.distance(sword_merge,
+                                     shapely.from_wkb(riv_lay.wkb()[riv_sel]))
+        riv_fil.append(riv_lay['COMID'][riv_sel[sword_dis < rem_buf]])
+
+    return np.concatenate(riv_fil) if len(riv_fil) > 0 else \
+        np.array([], dtype='int64')
+
+
+def trace_region(sword, riv_mb, cat_mb, rem_buf=.09, tile_deg=None,
+                 workers=None, threads=None):
+    """Return the COMIDs of the MERIT-SWORD network of a SWORD region.
+
+    sword is the layer of SWORD reaches of the region, and riv_mb and cat_mb
+    are lists of MB reach (COMID, NextDownID) and catchment (COMID) layers
+    of the MB regions overlapping it, in the same order. rem_buf is the
+    distance to SWORD (degrees) beyond which traced reaches are removed.
+    tile_deg, workers and threads are those of trace_seeds.
+    """
+
+    _, seeds = trace_seeds(sword, riv_mb, cat_mb, tile_deg, workers, threads)
+
+    return trace_network(seeds, sword, riv_mb, rem_buf)
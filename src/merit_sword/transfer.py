@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# transfer.py
+# ******************************************************************************
+
+# Purpose:
+# This module transfers attribute values between MERIT-Basins and SWORD
+# reaches through a translation, as averages weighted by the partial lengths
+# of the translated reaches.
+
+# Author:
+# Jeffrey Wade, 2024
+
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import numpy as np
+
+
+# ******************************************************************************
+# Transfer values through a translation
+# ******************************************************************************
+def transfer_values(ids, part_len, src_id, src_val):
+    """Return the weighted average of the values src_val of the reaches src_id
+    translated to each row of ids, weighted by part_len.
+
+    ids and part_len are the (n, 40) translation arrays of
+    ms_translation.Translation. Rows without translated reaches return NaN
+    values. Raises KeyError if a translated reach is absent from src_id.
+    """
+
+    # Sort by ID to allow lookups with a binary search
+    src_id = np.asarray(src_id)
+    src_val = np.asarray(src_val, dtype='float64')
+    src_srt = np.argsort(src_id)
+    src_id = src_id[src_srt]
+    src_val = src_val[src_srt]
+
+    # Ignore zero values
+    id_val = ids > 0
+    part_len = np.where(id_val, part_len, 0.)
+
+    # Retrieve values for translated reaches
+    val_i = np.zeros(ids.shape)
+
+    if id_val.any():
+
+        # Locate each translated reach in the sorted arrays
+        ind = np.searchsorted(src_id, ids[id_val])
+        ind = np.minimum(ind, len(src_id) - 1)
+
+        if len(src_id) == 0 or not np.array_equal(src_id[ind], ids[id_val]):
+            raise KeyError('Translated reaches missing from source values')
+
+        val_i[id_val] = src_val[ind]
+
+    # Calculate weighted average of values by partial length
+    # Rows without translated reaches return NaN values
+    with np.errstate(invalid='ignore', divide='ignore'):
+        part_frac = part_len / part_len.sum(axis=1)[:, None]
+        val_avg = np.sum(val_i * part_frac, axis=1)
+    val_avg[~id_val.any(axis=1)] = np.nan
+
+    return val_avg
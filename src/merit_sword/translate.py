@@ -0,0 +1,706 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# translate.py
+# ******************************************************************************
+
+# Purpose:
+# This module establishes one-to-many links (i.e. translations) between the
+# reaches of MERIT-Basins and SWORD in a region, from the intersections of
+# SWORD reaches with the MERIT-Basins catchments of MERIT-SWORD reaches.
+
+# Author:
+# Jeffrey Wade, 2024
+
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import collections
+import numpy as np
+import pandas as pd
+import shapely.prepared
+import rtree
+import ms_translation
+import ms_timing
+from merit_sword import pairs
+from merit_sword.layer import concat_layers
+from merit_sword.tiles import overlaps, extent, tile_rows, run_tiles
+
+
+# ******************************************************************************
+# Translation of a region
+# ******************************************************************************
+Translated = collections.namedtuple('Translated', ['cat_sw', 'cat_mb',
+                                                   'sword_to_mb',
+                                                   'mb_to_sword'])
+
+
+def _table(cat, length, prefix):
+    """Return the translation table of dictionaries of padded IDs and
+    lengths, sorted by index."""
+
+    # If no translated reaches, return empty table
+    if len(cat) == 0:
+        return pd.DataFrame()
+
+    # Convert dictionaries to dataframes
+    cat_df = pd.DataFrame(cat).T.sort_index()
+    len_df = pd.DataFrame(length).T.sort_index()
+
+    # Rename columns
+    cat_df.columns = [prefix + str(x) for x in range(1, 41)]
+    len_df.columns = ['part_len_' + str(x) for x in range(1, 41)]
+
+    # Combine dataframes for output
+    return cat_df.join(len_df, how='inner')
+
+
+def _fa_filter(ref_fa, fa, cat_ord, len_ord):
+    """Keep translated reaches whose flow accumulation is within one order of
+    magnitude of the flow accumulation ref_fa of the translated reach."""
+
+    fa_valid = [ind for ind in range(len(cat_ord)) if
+                (ref_fa / fa[ind] < 10) & (ref_fa / fa[ind] > 0.1)]
+
+    return [cat_ord[ind] for ind in fa_valid], \
+        [len_ord[ind] for ind in fa_valid]
+
+
+def _pad_row(part, ref_fa, fa):
+    """Return the padded IDs and lengths of the dictionary part of lengths by
+    translated ID, ordered by decreasing length then ID, and filtered by flow
+    accumulation fa of translated IDs against ref_fa (a function returning
+    the flow accumulation of the translated reach)."""
+
+    # Order IDs by length of reach contained within cat
+    # Sort by ID if tie in intersecting length
+    cat_ord = sorted(part, key=lambda x: (-part[x], -x))
+    len_ord = [part[x] for x in cat_ord]
+
+    # Compare flow accumulation values between translated reaches
+    if len(cat_ord) > 0:
+        cat_ord, len_ord = _fa_filter(ref_fa(), [fa[x] for x in cat_ord],
+                                      cat_ord, len_ord)
+
+    # Pad lists to reach desired length
+    return cat_ord + [0] * (40 - len(cat_ord)), \
+        len_ord + [0] * (40 - len(len_ord))
+
+
+def _fa_lookup(riv_ms, sword, regs):
+    """Return dictionaries of the flow accumulation (km2) of each MERIT-SWORD
+    reach (mfa) and SWORD reach (sfa) of regions regs."""
+
+    mfa = {}
+    sfa = {}
+    for reg in sorted(set(regs)):
+        # Store flow accumulation for each MS and SWORD reach (km2)
+        mfa.update(zip(riv_ms[reg]['COMID'].tolist(),
+                       riv_ms[reg]['uparea'].tolist()))
+        sfa.update(zip(sword[reg]['reach_id'].tolist(),
+                       sword[reg]['facc'].tolist()))
+
+    return mfa, sfa
+
+
+def _cat_index(cat_sw, keep=None):
+    """Return an R-tree of the bounds of the catchments of cat_sw, or of
+    those selected by the boolean array keep."""
+
+    cat_index = rtree.index.Index()
+    cat_bnd = cat_sw.bounds
+    for cat_fid in range(len(cat_sw)):
+        if keep is None or keep[cat_fid]:
+            cat_index.insert(cat_fid, tuple(cat_bnd[cat_fid]))
+
+    return cat_index
+
+
+def _sword_index(sword, sw_reg, keep=None):
+    """Return an R-tree of the bounds of the SWORD reaches of regions sw_reg,
+    or of those selected by the boolean arrays keep of each region."""
+
+    sword_index = rtree.index.Index()
+    # Create counter to store the index of the corresponding SWORD region
+    # Counter is shifted by 1, as leading zeros deleted as integer
+    ct = 1
+    for x in sw_reg:
+        sword_bnd = sword[x].bounds
+        ms_timing.count('features', len(sword[x]))
+        for j in range(len(sword[x])):
+            if keep is None or keep[x][j]:
+                # Index of sword layer stored as first digit
+                sword_fid = int(str(ct) + str(j))
+                sword_index.insert(sword_fid, tuple(sword_bnd[j]))
+        ct = ct + 1
+
+    return sword_index
+
+
+def _sword_geoms(sword, sw_reg):
+    """Return the geometries of the SWORD reaches of regions sw_reg, with
+    the position in sw_reg of the region and the row of each reach."""
+
+    n_rch = [len(sword[x]) for x in sw_reg]
+    sword_geom = np.empty(sum(n_rch), dtype=object)
+    sword_geom[:] = [x for y in sw_reg for x in sword[y].geoms()]
+
+    return sword_geom, np.repeat(np.arange(len(sw_reg)), n_rch), \
+        np.concatenate([np.arange(x) for x in n_rch] +
+                       [np.zeros(0, dtype='int64')])
+
+
+def _sword_row(sword_lay, j, cat_sw, cat_index, sfa, mfa):
+    """Return the padded MB COMIDs and partial lengths translated to SWORD
+    reach j of sword_lay, and the number of candidate catchments."""
+
+    # Create shapely and prepared geometric objects for each sword reach
+    sword_shy = sword_lay.geom(j)
+    sword_pre = shapely.prepared.prep(sword_shy)
+    sword_id = int(sword_lay['reach_id'][j])
+
+    # Filter MERIT catchments bounding boxes with SWORD reach
+    cat_int_fid = [int(x) for x in
+                   list(cat_index.intersection(sword_shy.bounds))]
+
+    # Intersect index filtered MERIT-SWORD catchments with SWORD reach
+    comid_dict = {}
+
+    for i in range(len(cat_int_fid)):
+
+        # Retrieve translation cat geometry corresponding to intersect fid
+        cat_shy = cat_sw.geom(cat_int_fid[i])
+        cat_comid = int(cat_sw['COMID'][cat_int_fid[i]])
+
+        # If catchment intersects with reach, extract COMID
+        if sword_pre.intersects(cat_shy):
+
+            # Check for valid catchment geometry (self-ring intersects)
+            if not cat_shy.is_valid:
+
+                # Zero distance buffer for invalid geometries
+                cat_shy = cat_shy.buffer(0)
+
+            # Catch errors where SWORD reaches have 0 length
+            if sword_shy.length > 0:
+                # Store length of SWORD reach contained by intersect cat
+                # Multiply by sword length in km so we don't need to...
+                # reproject shapefiles
+                # Round length to 2 decimal places
+                comid_dict[cat_comid] = \
+                    round(float(sword_lay['reach_len'][j]) *
+                          (sword_shy.intersection(cat_shy).length /
+                           sword_shy.length), 2)
+            else:
+                comid_dict[cat_comid] = 0
+
+    # Order MB comids by length of SWORD reach contained within cat, and
+    # compare flow accumulation values between translated reaches
+    return _pad_row(comid_dict, lambda: sfa[sword_id], mfa) + \
+        (len(cat_int_fid),)
+
+
+def _mb_row(cat_shy, cat_comid, sword, sw_reg, sword_index, sfa, mfa):
+    """Return the padded SWORD reach_ids and partial lengths translated to
+    the MB catchment cat_shy of reach cat_comid, and the number of candidate
+    SWORD reaches."""
+
+    # Create prepared geometric object for catchment
+    cat_pre = shapely.prepared.prep(cat_shy)
+
+    # Filter MERIT catchments bounding boxes with SWORD buffer
+    sword_int_fid = [int(x) for x in
+                     list(sword_index.intersection(cat_shy.bounds))]
+
+    # Intersect index filtered SWORD reaches with MERIT-SWORD catchments
+    sword_dict = {}
+
+    for i in range(len(sword_int_fid)):
+
+        # Load relevant sword layer
+        # sword layer integer shifted by 1 to prevent leading zero from
+        # being deleted
+        sword_lay = sword[sw_reg[int(str(sword_int_fid[i])[0])-1]]
+
+        # Retrieve SWORD geometry corresponding to intersect fid
+        sword_row = int(str(sword_int_fid[i])[1:])
+        sword_shy = sword_lay.geom(sword_row)
+        sword_rch_id = int(sword_lay['reach_id'][sword_row])
+
+        # If catchment intersects with reach, extract COMID
+        if cat_pre.intersects(sword_shy):
+
+            # Check for valid catchment geometry (self-ring intersects)
+            if not cat_shy.is_valid:
+
+                # Zero distance buffer for invalid geometries
+                cat_shy = cat_shy.buffer(0)
+
+            # Catch errors where SWORD reaches have 0 length
+            if sword_shy.length > 0:
+                # Store parttion of SWORD reach contained by intersect cat
+                sword_dict[sword_rch_id] = \
+                    round(float(sword_lay['reach_len'][sword_row]) *
+                          (sword_shy.intersection(cat_shy).length /
+                           sword_shy.length), 2)
+            else:
+                sword_dict[sword_rch_id] = 0
+
+    # Order SWORD reach_ids by parttion of SWORD reach contained within
+    # cat, and compare flow accumulation values between translated reaches
+    return _pad_row(sword_dict, lambda: mfa[cat_comid], sfa) + \
+        (len(sword_int_fid),)
+
+
+def _translation_cats(pfaf, cat_mb, riv_ms, mb_reg, sw_reg):
+    """Return the MB catchments of the MERIT-SWORD reaches of region pfaf
+    overlapping the SWORD region (cat_sw) and within the MB region
+    (cat_mb_sel)."""
+
+    # Keep MB catchments corresponding to MERIT-SWORD reaches
+    ms_list = riv_ms[pfaf]['COMID']
+    cat_sw = concat_layers([cat_mb[x].subset(np.isin(cat_mb[x]['COMID'],
+                                                     ms_list))
+                            for x in mb_reg])
+
+    # Retrieve MERIT-SWORD reach COMIDs of target region
+    ms_list = np.concatenate([riv_ms[x]['COMID'] for x in sw_reg] +
+                             [np.array([], dtype='int64')])
+    ms_list = ms_list[ms_translation.id_pfaf(ms_list) == int(pfaf)]
+
+    # Keep MB catchments of target region corresponding to MERIT-SWORD reaches
+    cat_mb_sel = cat_mb[pfaf].subset(np.isin(cat_mb[pfaf]['COMID'], ms_list))
+
+    return cat_sw, cat_mb_sel
+
+
+def _sword_rows(sword_lay, cat_sw, cat_index, sfa, mfa, threads=None):
+    """Return the SWORD-to-MB rows of all reaches of sword_lay, as
+    dictionaries of padded COMIDs and lengths by reach_id, and the number of
+    candidate catchments. Given threads, pairs of reaches and catchments are
+    found without the R-tree cat_index (which may be None), and intersected
+    in up to threads threads."""
+
+    if threads is not None:
+        return _sword_rows_pairs(sword_lay, cat_sw, sfa, mfa, threads)
+
+    sw_cat = {}
+    sw_len = {}
+    n_pair = 0
+
+    for j in range(len(sword_lay)):
+        sword_id = int(sword_lay['reach_id'][j])
+        sw_cat[sword_id], sw_len[sword_id], n = _sword_row(
+            sword_lay, j, cat_sw, cat_index, sfa, mfa)
+        n_pair += n
+
+    return sw_cat, sw_len, n_pair
+
+
+def _mb_rows(comids, cat_mb_sel, cat_mb_row, sword, sw_reg, sword_index, sfa,
+             mfa, threads=None):
+    """Return the MB-to-SWORD rows of MB reaches comids, as dictionaries of
+    padded reach_ids and lengths by COMID, and the number of candidate SWORD
+    reaches. Given threads, pairs of catchments and reaches are found without
+    the R-tree sword_index (which may be None), and intersected in up to
+    threads threads."""
+
+    if threads is not None:
+        return _mb_rows_pairs(comids, cat_mb_sel, cat_mb_row, sword, sw_reg,
+                              sfa, mfa, threads)
+
+    m_cat = {}
+    m_len = {}
+    n_pair = 0
+
+    for cat_comid in comids:
+
+        # If MB reach not in MERIT-SWORD network, it has no translation
+        if cat_comid not in cat_mb_row:
+
+            # Pad lists to reach desired length and insert to dictionary
+            m_cat[cat_comid] = [0] * 40
+            m_len[cat_comid] = [0] * 40
+            continue
+
+        m_cat[cat_comid], m_len[cat_comid], n = _mb_row(
+            cat_mb_sel.geom(cat_mb_row[cat_comid]), cat_comid, sword, sw_reg,
+            sword_index, sfa, mfa)
+        n_pair += n
+
+    return m_cat, m_len, n_pair
+
+
+def _sword_rows_pairs(sword_lay, cat_sw, sfa, mfa, threads):
+    """Return the rows of _sword_rows, with the catchments intersected by
+    all SWORD reaches found at once, and intersected in threads."""
+
+    # Catchments intersected by each SWORD reach
+    sword_geom = sword_lay.geoms()
+    cat_geom = cat_sw.geoms()
+    row, fid = pairs.candidates(cat_geom, sword_geom, 'intersects')
+
+    # Length of SWORD reaches within intersected catchments
+    length = pairs.map_pairs(pairs.intersection_lengths, sword_geom[row],
+                             cat_geom[fid], threads)
+    sword_len = shapely.length(sword_geom)
+    start = np.searchsorted(row, np.arange(len(sword_geom) + 1))
+
+    sw_cat = {}
+    sw_len = {}
+    for j in range(len(sword_geom)):
+        sword_id = int(sword_lay['reach_id'][j])
+
+        # Length of SWORD reach contained by each intersected catchment
+        comid_dict = {}
+        for k in range(start[j], start[j + 1]):
+            comid_dict[int(cat_sw['COMID'][fid[k]])] = \
+                round(float(sword_lay['reach_len'][j]) *
+                      (float(length[k]) / float(sword_len[j])), 2) if \
+                sword_len[j] > 0 else 0
+
+        sw_cat[sword_id], sw_len[sword_id] = _pad_row(
+            comid_dict, lambda: sfa[sword_id], mfa)
+
+    return sw_cat, sw_len, len(row)
+
+
+def _mb_rows_pairs(comids, cat_mb_sel, cat_mb_row, sword, sw_reg, sfa, mfa,
+                   threads):
+    """Return the rows of _mb_rows, with the SWORD reaches intersected by
+    all catchments found at once, and intersected in threads."""
+
+    # SWORD reaches of all regions, with the region and row of each
+    sword_all, reg_all, row_all = _sword_geoms(sword, sw_reg)
+
+    # SWORD reaches intersected by each catchment
+    cat_row = [cat_mb_row[x] for x in comids if x in cat_mb_row]
+    cat_geom = cat_mb_sel.geoms()[cat_row]
+    row, fid = pairs.candidates(sword_all, cat_geom, 'intersects')
+    reg = reg_all[fid]
+    sword_row = row_all[fid]
+    sword_geom = sword_all[fid]
+
+    # Length of SWORD reaches within intersected catchments
+    length = pairs.map_pairs(pairs.intersection_lengths, sword_geom,
+                             cat_geom[row], threads)
+    sword_len = shapely.length(sword_geom)
+    start = np.searchsorted(row, np.arange(len(cat_geom) + 1))
+
+    net_cat = {}
+    net_len = {}
+    for i in range(len(cat_geom)):
+        cat_comid = int(cat_mb_sel['COMID'][cat_row[i]])
+
+        # Partition of each intersected SWORD reach contained by catchment
+        sword_dict = {}
+        for k in range(start[i], start[i + 1]):
+            sword_lay = sword[sw_reg[reg[k]]]
+            sword_dict[int(sword_lay['reach_id'][sword_row[k]])] = \
+                round(float(sword_lay['reach_len'][sword_row[k]]) *
+                      (float(length[k]) / float(sword_len[k])), 2) if \
+                sword_len[k] > 0 else 0
+
+        net_cat[cat_comid], net_len[cat_comid] = _pad_row(
+            sword_dict, lambda: mfa[cat_comid], sfa)
+
+    # MB reaches outside of the MERIT-SWORD network have no translation
+    m_cat = {x: net_cat.get(x, [0] * 40) for x in comids}
+    m_len = {x: net_len.get(x, [0] * 40) for x in comids}
+
+    return m_cat, m_len, len(row)
+
+
+def _sword_tile(sword_lay, cat_sw, sfa, mfa, threads=None):
+    """Return the SWORD-to-MB rows of the reaches of a tile, translated with
+    the catchments overlapping its halo (worker of translate_region)."""
+
+    return _sword_rows(sword_lay, cat_sw, _cat_index(cat_sw) if threads is
+                       None else None, sfa, mfa, threads)
+
+
+def _mb_tile(cat_mb_sel, sword, sw_reg, sfa, mfa, threads=None):
+    """Return the MB-to-SWORD rows of the catchments of a tile, translated
+    with the SWORD reaches overlapping its halo (worker of
+    translate_region)."""
+
+    cat_mb_row = dict(zip(cat_mb_sel['COMID'].tolist(),
+                          range(len(cat_mb_sel))))
+
+    return _mb_rows(cat_mb_sel['COMID'].tolist(), cat_mb_sel, cat_mb_row,
+                    sword, sw_reg, _sword_index(sword, sw_reg) if threads is
+                    None else None, sfa, mfa, threads)
+
+
+def _merge_rows(res):
+    """Merge the rows and numbers of candidates of tiles, in order of tiles.
+    """
+
+    cat = {}
+    length = {}
+    n_pair = 0
+    for tile_cat, tile_len, n in res:
+        cat.update(tile_cat)
+        length.update(tile_len)
+        n_pair += n
+
+    return cat, length, n_pair
+
+
+def translate_region(pfaf, riv_mb, cat_mb, riv_ms, sword, mb_reg, sw_reg,
+                     tile_deg=None, workers=None, threads=None):
+    """Translate the reaches of a region between MERIT-Basins and SWORD.
+
+    pfaf is the 2-digit region, riv_mb the layer of MB reaches (COMID) of the
+    region, and cat_mb, riv_ms and sword dictionaries relating pfaf regions to
+    MB catchment layers (COMID), MERIT-SWORD reach layers (COMID, uparea) and
+    SWORD reach layers (reach_id, facc, reach_len). mb_reg lists the MB
+    regions overlapping the SWORD region, and sw_reg the SWORD regions
+    overlapping the MB region. Returns a Translated tuple with the MB
+    catchments of MERIT-SWORD reaches overlapping the SWORD region (cat_sw)
+    and within the MB region (cat_mb), and the SWORD-to-MB and MB-to-SWORD
+    translation tables.
+
+    Given tile_deg, reaches are split into square tiles of tile_deg degrees
+    translated in up to workers processes, each with the features overlapping
+    the halo of its tile. Given threads, the candidate pairs of reaches and
+    catchments are intersected in up to threads threads (of each worker).
+    Rows do not depend on the tiling or threads.
+    """
+
+    # --------------------------------------------------------------------------
+    # Create lookup dictionary for flow accumulation
+    # --------------------------------------------------------------------------
+    mfa, sfa = _fa_lookup(riv_ms, sword, set(mb_reg) | set(sw_reg))
+
+    # --------------------------------------------------------------------------
+    # Translate from SWORD reaches to MB reaches (SWORD-to-MB)
+    # --------------------------------------------------------------------------
+    sword_lay = sword[pfaf]
+
+    # Keep MB catchments corresponding to MERIT-SWORD reaches
+    ms_timing.phase('filter')
+    cat_sw, cat_mb_sel = _translation_cats(pfaf, cat_mb, riv_ms, mb_reg,
+                                           sw_reg)
+
+    if tile_deg is None:
+
+        # Relate catchment id to bounds of feature geometry
+        ms_timing.phase('index')
+        ms_timing.count('features', len(cat_sw))
+        cat_index = _cat_index(cat_sw) if threads is None else None
+
+        # Create dictionaries to store SWORD to MB translation and lengths
+        ms_timing.phase('intersect')
+        ms_timing.count('features', len(sword_lay))
+        sw_cat, sw_len, n_pair = _sword_rows(sword_lay, cat_sw, cat_index,
+                                             sfa, mfa, threads)
+
+    else:
+
+        # Translate the SWORD reaches of each tile with the catchments
+        # overlapping its halo
+        ms_timing.phase('intersect')
+        ms_timing.count('features', len(sword_lay))
+        sword_bnd = sword_lay.bounds
+        cat_bnd = cat_sw.bounds
+        args = []
+        for rows in tile_rows(sword_bnd, tile_deg):
+            sword_sub = sword_lay.subset(rows)
+            cat_sub = cat_sw.subset(overlaps(cat_bnd,
+                                             extent(sword_bnd[rows])))
+            args.append((sword_sub, cat_sub,
+                         {x: sfa[x] for x in sword_sub['reach_id'].tolist()},
+                         {x: mfa[x] for x in cat_sub['COMID'].tolist() if
+                          x in mfa}, threads))
+        sw_cat, sw_len, n_pair = _merge_rows(run_tiles(_sword_tile, args,
+                                                       workers))
+
+    # --------------------------------------------------------------------------
+    # Translate from MB reaches to SWORD reaches (MB-to-SWORD)
+    # --------------------------------------------------------------------------
+    ms_timing.count('pairs', n_pair)
+    cat_mb_row = dict(zip(cat_mb_sel['COMID'].tolist(),
+                          range(len(cat_mb_sel))))
+
+    if tile_deg is None:
+
+        # Relate sword id to bounds of feature geometry
+        ms_timing.phase('index')
+        sword_index = _sword_index(sword, sw_reg) if threads is None else \
+            None
+
+        # Create dictionary to store MB to SWORD translation and lengths
+        ms_timing.phase('intersect')
+        ms_timing.count('features', len(riv_mb))
+        m_cat, m_len, n_pair = _mb_rows(riv_mb['COMID'].tolist(), cat_mb_sel,
+                                        cat_mb_row, sword, sw_reg,
+                                        sword_index, sfa, mfa, threads)
+
+    else:
+
+        # MB reaches outside of the MERIT-SWORD network have no translation
+        ms_timing.phase('intersect')
+        ms_timing.count('features', len(riv_mb))
+        m_cat, m_len, _ = _mb_rows([x for x in riv_mb['COMID'].tolist() if
+                                    x not in cat_mb_row], cat_mb_sel,
+                                   cat_mb_row, sword, sw_reg, None, sfa, mfa)
+
+        # Translate the catchments of other MB reaches in each tile with the
+        # SWORD reaches overlapping its halo
+        cat_net = cat_mb_sel.subset(np.isin(cat_mb_sel['COMID'],
+                                            riv_mb['COMID']))
+        cat_bnd = cat_net.bounds
+        args = []
+        for rows in tile_rows(cat_bnd, tile_deg):
+            cat_sub = cat_net.subset(rows)
+            box = extent(cat_bnd[rows])
+            sword_sub = {x: sword[x].subset(overlaps(sword[x].bounds, box))
+                         for x in sw_reg}
+            args.append((cat_sub, sword_sub, sw_reg,
+                         {x: sfa[x] for y in sword_sub.values() for x in
+                          y['reach_id'].tolist()},
+                         {x: mfa[x] for x in cat_sub['COMID'].tolist()},
+                         threads))
+        tile_cat, tile_len, n_pair = _merge_rows(run_tiles(_mb_tile, args,
+                                                           workers))
+        m_cat.update(tile_cat)
+        m_len.update(tile_len)
+
+    ms_timing.count('pairs', n_pair)
+
+    return Translated(cat_sw, cat_mb_sel, _table(sw_cat, sw_len, 'mb_'),
+                      _table(m_cat, m_len, 'sword_'))
+
+
+def update_region(pfaf, riv_mb, cat_mb, riv_ms, sword, mb_reg, sw_reg,
+                  old_ms, sw_upd=(), mb_upd=(), old_sw=None):
+    """Translate again the reaches of a region affected by changes since its
+    previous translation.
+
+    Arguments are those of translate_region, with old_ms the COMIDs of the
+    MERIT-SWORD reaches of region pfaf at the previous translation (e.g. of
+    its cat_mb translation catchments), and old_sw the COMIDs of the
+    MERIT-SWORD reaches of the network of region pfaf at the previous
+    translation, of all regions (e.g. of its cat_sw translation catchments).
+    The SWORD reaches whose bounds overlap the catchments of MERIT-SWORD
+    reaches added or removed since then, and these MB reaches themselves if
+    in region pfaf, are translated again. sw_upd holds the
+    reach_ids of SWORD reaches of any region added or changed since then
+    (e.g. by ms_sword_diff.py): those of region pfaf are translated again,
+    along with the MB reaches whose catchments overlap their bounds. mb_upd
+    holds the COMIDs of other MB reaches to translate again, such as those
+    translated to removed SWORD reaches. Returns a Translated tuple holding
+    the new translation catchments and the translation tables of the updated
+    reaches only, to be patched into the previous tables.
+    """
+
+    # --------------------------------------------------------------------------
+    # Identify catchments of changed MERIT-SWORD reaches
+    # --------------------------------------------------------------------------
+    ms_timing.phase('filter')
+    cat_sw, cat_mb_sel = _translation_cats(pfaf, cat_mb, riv_ms, mb_reg,
+                                           sw_reg)
+
+    new_ms = cat_mb_sel['COMID']
+    old_ms = np.asarray(old_ms, dtype='int64')
+    added = np.setdiff1d(new_ms, old_ms)
+    removed = np.setdiff1d(old_ms, new_ms)
+
+    # Reaches of the network of region pfaf from other regions change the
+    # SWORD-to-MB translations only, through the cat_sw catchments
+    chg_ms = np.concatenate([added, removed])
+    if old_sw is not None:
+        chg_ms = np.union1d(chg_ms, np.setxor1d(
+            cat_sw['COMID'], np.asarray(old_sw, dtype='int64')))
+    chg = concat_layers([cat_mb[x].subset(np.isin(cat_mb[x]['COMID'],
+                                                  chg_ms))
+                         for x in sorted(set(mb_reg) | {pfaf})])
+    sw_upd = np.asarray(sw_upd, dtype='int64')
+    mb_upd = np.asarray(mb_upd, dtype='int64')
+    ms_timing.count('features', len(chg) + len(sw_upd) + len(mb_upd))
+
+    if len(chg) == 0 and len(sw_upd) == 0 and len(mb_upd) == 0:
+        return Translated(cat_sw, cat_mb_sel, pd.DataFrame(), pd.DataFrame())
+
+    mfa, sfa = _fa_lookup(riv_ms, sword, set(mb_reg) | set(sw_reg))
+
+    # --------------------------------------------------------------------------
+    # Translate updated SWORD reaches (SWORD-to-MB)
+    # --------------------------------------------------------------------------
+    # Select updated SWORD reaches, and those near changed catchments from the
+    # R-tree of changed catchment bounds
+    ms_timing.phase('index')
+    sword_lay = sword[pfaf]
+    chg_index = _cat_index(chg)
+    sword_bnd = sword_lay.bounds
+    sword_upd = np.isin(sword_lay['reach_id'], sw_upd)
+    sw_aff = [j for j in range(len(sword_lay)) if sword_upd[j] or
+              chg_index.count(tuple(sword_bnd[j])) > 0]
+
+    # Index catchments within the extent of the selected SWORD reaches
+    sw_cat = {}
+    sw_len = {}
+    n_pair = 0
+    if len(sw_aff) > 0:
+        box = extent(sword_bnd[sw_aff])
+        cat_index = _cat_index(cat_sw, overlaps(cat_sw.bounds, box))
+
+        ms_timing.phase('intersect')
+        ms_timing.count('features', len(sw_aff))
+        for j in sw_aff:
+            sword_id = int(sword_lay['reach_id'][j])
+            sw_cat[sword_id], sw_len[sword_id], n = _sword_row(
+                sword_lay, j, cat_sw, cat_index, sfa, mfa)
+            n_pair += n
+
+    # --------------------------------------------------------------------------
+    # Translate updated MB reaches (MB-to-SWORD)
+    # --------------------------------------------------------------------------
+    # Catchments overlapping the bounds of updated SWORD reaches
+    ms_timing.phase('index')
+    upd_index = rtree.index.Index()
+    for x in sw_reg:
+        upd_bnd = sword[x].bounds
+        for j in np.flatnonzero(np.isin(sword[x]['reach_id'], sw_upd)):
+            upd_index.insert(0, tuple(upd_bnd[j]))
+    cat_bnd = cat_mb_sel.bounds
+    cat_upd = [int(cat_mb_sel['COMID'][i]) for i in range(len(cat_mb_sel))
+               if upd_index.count(tuple(cat_bnd[i])) > 0]
+
+    # Reaches outside of the MERIT-SWORD network have no translation, others
+    # are translated with SWORD reaches within the extent of their catchments
+    cat_mb_row = dict(zip(cat_mb_sel['COMID'].tolist(),
+                          range(len(cat_mb_sel))))
+    riv_mb_ids = set(riv_mb['COMID'].tolist())
+    mb_aff = [x for x in sorted(set(added.tolist()) | set(removed.tolist()) |
+                                set(mb_upd.tolist()) | set(cat_upd))
+              if x in riv_mb_ids]
+
+    m_cat = {}
+    m_len = {}
+    for cat_comid in mb_aff:
+        if cat_comid not in cat_mb_row:
+            m_cat[cat_comid] = [0] * 40
+            m_len[cat_comid] = [0] * 40
+
+    add_row = [cat_mb_row[x] for x in mb_aff if x in cat_mb_row]
+    if len(add_row) > 0:
+        box = extent(cat_bnd[add_row])
+        sword_index = _sword_index(sword, sw_reg,
+                                   {x: overlaps(sword[x].bounds, box) for x
+                                    in sw_reg})
+
+        ms_timing.phase('intersect')
+        ms_timing.count('features', len(add_row))
+        for i in add_row:
+            cat_comid = int(cat_mb_sel['COMID'][i])
+            m_cat[cat_comid], m_len[cat_comid], n = _mb_row(
+                cat_mb_sel.geom(i), cat_comid, sword, sw_reg, sword_index,
+                sfa, mfa)
+            n_pair += n
+
+    ms_timing.count('pairs', n_pair)
+
+    return Translated(cat_sw, cat_mb_sel, _table(sw_cat, sw_len, 'mb_'),
+                      _table(m_cat, m_len, 'sword_'))
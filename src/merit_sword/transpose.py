@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# transpose.py
+# ******************************************************************************
+
+# Purpose:
+# This module transposes translation tables between MERIT-Basins and SWORD,
+# rebuilding the translation of one dataset from the translations of the other
+# so that the two can be confirmed to hold the same links.
+
+# Author:
+# Jeffrey Wade, 2024
+
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import pandas as pd
+
+
+# ******************************************************************************
+# Transpose translation tables
+# ******************************************************************************
+def transpose_table(trans_dfs, ids, prefix):
+    """Return the translation table of the reaches ids built from the
+    translation tables trans_dfs of the other dataset, or None if trans_dfs is
+    empty.
+
+    trans_dfs are tables of 40 ID and 40 part_len columns, restricted to
+    translated reaches. The ID columns of the returned table are named prefix
+    followed by 1 to 40.
+    """
+
+    # Catch regions with no translated reaches
+    if len(trans_dfs) == 0:
+        return None
+
+    # Combine all non-zero dfs
+    in_df = pd.concat(trans_dfs)
+
+    # Get unique values in translations, dropping 0
+    uniq = list(set(in_df.iloc[:, :40].values.flatten().tolist()))
+    uniq = [x for x in uniq if x != 0]
+
+    # Rename columns of in_df to integers to simplify part_len retrieval
+    in_df.columns = range(80)
+
+    # Create transposed table from reach IDs
+    out_df = pd.DataFrame(0., index=sorted(ids), columns=range(80))
+
+    # Find all occurences of reaches in translation table
+    # Store corresponding IDs and part_lens
+    for out_id in uniq:
+
+        # Ignore reaches from other regions
+        if out_id not in out_df.index:
+            continue
+
+        # Retrieve locations of ID occurences in translation table
+        locs = (in_df == out_id).stack()
+        out_locs = locs[locs].index.tolist()
+
+        # If no translation for reach, continue
+        if len(out_locs) == 0:
+            continue
+
+        # Get IDs of each occurence
+        in_id = [x[0] for x in out_locs]
+
+        # Get corresponding part_len values for each occurence
+        # part_len columns are 40 indices after correspond ID column
+        in_part_len = [in_df.loc[idx, col+40] for idx, col in out_locs]
+
+        # Sort in_id and in_part_len by intersecting length values
+        # Break ties in reach length by reach id
+        in_srt = pd.DataFrame({'id': in_id,
+                               'part_len': in_part_len}).sort_values(
+                              by=['part_len', 'id'],
+                              ascending=[False, False]).reset_index(drop=True)
+
+        # Insert values into out_df
+        out_df.loc[out_id, 0:len(in_srt)-1] = in_srt.iloc[:, 0]
+        out_df.loc[out_id, 40:40+len(in_srt)-1] = in_srt.iloc[:, 1].values
+
+    # Convert ID columns to integer
+    for i in range(40):
+        out_df[i] = out_df[i].astype(int)
+
+    # Rename out_df columns
+    out_df.columns = [prefix + str(x) for x in range(1, 41)] + \
+        ['part_len_' + str(x) for x in range(1, 41)]
+
+    return out_df
@@ -15,12 +15,7 @@
 # Import Python modules
 # ******************************************************************************
 import sys
-import re
-import glob
-import pandas as pd
-import fiona
-import xarray as xr
-import numpy as np
+import ms_catalog
 
 # ******************************************************************************
 # Declaration of variables (given as command line arguments)
@@ -78,11 +73,11 @@ except IOError:
     raise SystemExit(22)
 
 # Confirm files refer to same region
-ms_trans_reg = ms_trans_nc.split('pfaf_')[1][0:2]
-sm_trans_reg = sm_trans_nc.split('pfaf_')[1][0:2]
-riv_meandrs_reg = riv_meandrs_shp.split('pfaf_')[1][0:2]
-sword_reg = sword_shp.split('hb')[1][0:2]
-sword_out_reg = sword_out.split('hb')[1][0:2]
+ms_trans_reg = ms_catalog.pfaf_of(ms_trans_nc)
+sm_trans_reg = ms_catalog.pfaf_of(sm_trans_nc)
+riv_meandrs_reg = ms_catalog.pfaf_of(riv_meandrs_shp)
+sword_reg = ms_catalog.pfaf_of(sword_shp)
+sword_out_reg = ms_catalog.pfaf_of(sword_out)
 
 if not (ms_trans_reg == sm_trans_reg == riv_meandrs_reg == sword_reg ==
         sword_out_reg):
@@ -91,204 +86,102 @@ if not (ms_trans_reg == sm_trans_reg == riv_meandrs_reg == sword_reg ==
 
 
 # ******************************************************************************
-# Read shapefiles
+# Import processing modules
 # ******************************************************************************
-print('- Reading files')
-
-# ------------------------------------------------------------------------------
-# MB-to-SWORD Translation
-# ------------------------------------------------------------------------------
-# Read MB-to-SWORD files
-ms_files = list(glob.iglob(re.sub(r'(?<=/mb_to_sword/).*?(?=\.nc)', '*',
-                ms_trans_nc)))
-
-# Sort reach files by value
-ms_files.sort()
-
-# Convert to shapefile
-ms_all = [xr.open_dataset(j).to_dataframe() for j in ms_files]
-
-# ------------------------------------------------------------------------------
-# SWORD-to-MB Translation
-# ------------------------------------------------------------------------------
-# Read SWORD-to-MB files
-sm_files = list(glob.iglob(re.sub(r'(?<=/sword_to_mb/).*?(?=\.nc)', '*',
-                sm_trans_nc)))
-
-# Sort reach files by value
-sm_files.sort()
-
-# Convert to shapefile
-sm_all = [xr.open_dataset(j).to_dataframe() for j in sm_files]
-
-# ------------------------------------------------------------------------------
-# MeanDRS Rivers
-# ------------------------------------------------------------------------------
-
-# Read MeanDRS (MB) files
-meandrs_files = list(glob.iglob(re.sub(r'(?<=/riv_COR/).*?(?=\.shp)', '*',
-                     riv_meandrs_shp)))
-
-# Sort reach files by value
-meandrs_files.sort()
-
-# Convert to shapefile
-meandrs_all = [fiona.open(j, 'r', crs="EPSG:4326") for j in meandrs_files]
-
-# Retrieve pfaf numbers from file
-mb_pfaf_list = pd.Series([x.partition("pfaf_")[-1][0:2]
-                          for x in meandrs_files]).sort_values()
-
-# Sort pfaf_list
-pfaf_srt = mb_pfaf_list.sort_values(ignore_index=True)
-pfaf_srt = pfaf_srt.reset_index(drop=True)
-
-# ------------------------------------------------------------------------------
-# SWORD
-# ------------------------------------------------------------------------------
-# Read SWORD files
-sword_files = list(glob.iglob(re.sub(r'(?<=/sword_edit/).*?(?=\.shp)', '*',
-                                     sword_shp)))
-
-# Retrieve pfaf numbers from file
-sw_pfaf_list = pd.Series([x.partition("reaches_hb")[-1][0:2]
-                          for x in sword_files]).sort_values()
+import ms_timing
+ms_timing.phase('import')
+import pandas as pd
+import numpy as np
+import ms_io
+import ms_translation
+import merit_sword
 
-# Sort files by pfaf to align with MERIT-Basins
-sword_files = pd.Series(sword_files)[sw_pfaf_list.index.values].tolist()
 
-# Convert to shapefile
-sword_all = [fiona.open(j, 'r', crs="EPSG:4326") for j in sword_files]
+# ******************************************************************************
+# Read shapefiles
+# ******************************************************************************
+print('- Reading files')
+ms_timing.phase('read')
 
 # ------------------------------------------------------------------------------
-# Get indices of target region shapefiles
+# Files of all regions
 # ------------------------------------------------------------------------------
-ms_trans_ind = ms_files.index(ms_trans_nc)
-sm_trans_ind = sm_files.index(sm_trans_nc)
-riv_meandrs_ind = meandrs_files.index(riv_meandrs_shp)
-sword_ind = sword_files.index(sword_shp)
+# Files of translations, MeanDRS (MB) reaches and SWORD by pfaf region, from
+# the catalog of datasets
+catalog = ms_catalog.open_catalog()
+ms_files = catalog.like(ms_trans_nc)
+sm_files = catalog.like(sm_trans_nc)
+meandrs_files = catalog.like(riv_meandrs_shp)
+sword_files = catalog.like(sword_shp)
+
+# Open translations lazily, reading only the regions used
+ms_all = ms_translation.TranslationFiles(ms_files)
+sm_all = ms_translation.TranslationFiles(sm_files)
 
 # Retrieve SWORD-to-MB translations for each pfaf
-sm_df = sm_all[sm_trans_ind]
+sm_trans = sm_all[sm_trans_reg]
 
 # For given SWORD region, identify related MB pfaf regions
-ms_pfaf = (sm_df.iloc[:, :40].map(lambda x: str(x)[:2])
-           .values.
-           flatten().
-           tolist())
-ms_pfaf_uniq = list(np.unique([v for v in ms_pfaf if v != '0']))
-ms_cat_ind = pfaf_srt.index[pfaf_srt.isin(ms_pfaf_uniq)].tolist()
+ms_pfaf_uniq = sm_trans.regions()
+ms_cat_reg = [x for x in meandrs_files if x in ms_pfaf_uniq]
 
 
 # ******************************************************************************
-# Store MeanDRS MeanQ value in dictionary
+# Store MeanDRS MeanQ values in arrays
 # ******************************************************************************
 print('- Retrieving MeanDRS discharge simulations')
-meanQ_dicts = []
-meandrs_sub = [meandrs_all[x] for x in ms_cat_ind]
+meandrs_sub = [meandrs_files[x] for x in ms_cat_reg]
 
-# Loop through MeanDRS layers related to target region
-for meandrs_lay in meandrs_sub:
+# Read COMID and meanQ columns of MeanDRS layers related to target region
+meanQ_cols = [ms_io.read_fields(j, ['COMID', 'meanQ']) for j in meandrs_sub]
 
-    # Initialize dictionary
-    meanQ_dict = {}
+if len(meanQ_cols) > 0:
+    meandrs_id = np.concatenate([x['COMID'] for x in meanQ_cols])
+    meandrs_q = np.concatenate([x['meanQ'] for x in meanQ_cols])
+else:
+    meandrs_id = np.array([], dtype='int64')
+    meandrs_q = np.array([], dtype='float64')
 
-    for riv_fea in meandrs_lay:
-
-        # Relate COMID to MeanQ
-        meanQ_dict[riv_fea['properties']['COMID']] = \
-            riv_fea['properties']['meanQ']
-
-    # Append dictionary to meanQ_dicts
-    meanQ_dicts.append(meanQ_dict)
 
 # ******************************************************************************
 # Translate MeanDRS values to SWORD
 # ******************************************************************************
 print('- Translating MeanDRS discharge onto SWORD reaches')
-# --------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
 # Load pfaf specific files
-# --------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
 # Retrieve SWORD-to-MB translation for target region
-sm_df = sm_all[sm_trans_ind]
-
-# Retrieve SWORD layer
-sword_lay = sword_all[sword_ind]
+sm_trans = sm_all[sm_trans_reg]
 
-meandrs_dict = {}
-for d in meanQ_dicts:
-    meandrs_dict.update(d)
+# Retrieve translated MB reaches and partial length values as arrays
+comids = sm_trans.ids[:, 0:40]
+part_len = sm_trans.part_len[:, 0:40]
 
 # ------------------------------------------------------------------------------
 # Assign MeanDRS meanQ values to each SWORD reach (weighted average)
 # ------------------------------------------------------------------------------
-meanQ_avg = []
-
-# Loop through SWORD reaches
-for reach_id in sm_df.index:
-
-    # Retrieve translated MB reaches and partial length values
-    comids = sm_df.loc[reach_id].iloc[0:40].astype('int')
-    part_len = sm_df.loc[reach_id].iloc[40:]
-
-    # Remove zero values
-    comids = comids[comids > 0]
-    part_len = part_len[:len(comids)]
-
-    # If no translated reaches, return NaN value
-    if len(comids) == 0:
-
-        meanQ_weight = np.nan
-
-    else:
-
-        # Retrieve meanQ values for translated reaches
-        meanQ_i = [meandrs_dict[comid] for comid in comids]
-
-        # Calculate weighted average of meanQ values by partial length
-        meanQ_weight = np.sum(meanQ_i * (part_len/np.sum(part_len)))
-
-    meanQ_avg.append(meanQ_weight)
+# SWORD reaches without translated reaches return NaN values
+ms_timing.phase('transfer')
+ms_timing.count('features', len(meandrs_id))
+try:
+    meanQ_avg = merit_sword.transfer_values(comids, part_len, meandrs_id,
+                                            meandrs_q)
+except KeyError:
+    print('ERROR - Translated MB reaches missing from MeanDRS files')
+    raise SystemExit(22)
 
 # Give meanQ_avg index of sword reaches
-meanQ_avg = pd.Series(meanQ_avg)
-meanQ_avg.index = sm_df.index
+meanQ_avg = pd.Series(meanQ_avg, index=sm_trans.index)
 
 # ------------------------------------------------------------------------------
 # Write SWORD layer to shapefile with new columns for translated values
 # ------------------------------------------------------------------------------
 print('- Writing shapefiles')
-with fiona.open(sword_files[sword_ind], 'r') as src:
-
-    # Copy schema
-    new_schema = src.schema.copy()
-
-    # Add new columns
-    new_schema['properties']['meanDRS_Q'] = 'float'
-
-    # Write new shapefile
-    with fiona.open(sword_out, 'w', driver=src.driver, crs=src.crs,
-                    schema=new_schema) as out:
-
-        # Write features
-        for sword_fea in src:
-
-            # Copy feature geometry and properties
-            new_geom = sword_fea['geometry']
-            new_id = sword_fea['id']
-            new_prop = dict(sword_fea['properties'])
-
-            # Store meanQ values
-            meanQ_val = round(meanQ_avg.loc[new_prop['reach_id']], 2)
-
-            # Check if values are NaN
-            if np.isnan(meanQ_val):
-                # Write Null
-                new_prop['meanDRS_Q'] = None
-            else:
-                # Write value
-                new_prop['meanDRS_Q'] = meanQ_val
-
-            # Write new feature
-            out.write(fiona.Feature(geometry=new_geom, id=new_id,
-                                    properties=new_prop))
+ms_timing.phase('write')
+# Align meanQ values with the feature order of the SWORD layer
+sword_rch = ms_io.read_fields(sword_files[sword_reg], ['reach_id'])['reach_id']
+meanQ_val = np.round(meanQ_avg.reindex(sword_rch).values, 2)
+
+# Write new shapefile
+ms_io.append_fields(sword_files[sword_reg], sword_out,
+                    {'meanDRS_Q': meanQ_val})
@@ -16,12 +16,7 @@
 # Import Python modules
 # ******************************************************************************
 import sys
-import re
-import glob
-import pandas as pd
-import xarray as xr
-import fiona
-import numpy as np
+import ms_catalog
 
 
 # ******************************************************************************
@@ -72,10 +67,10 @@ except IOError:
     raise SystemExit(22)
 
 # Confirm files refer to same region
-ms_trans_reg = ms_trans_nc.split('pfaf_')[1][0:2]
-riv_mb_reg = riv_mb_shp.split('pfaf_')[1][0:2]
-sword_reg = sword_shp.split('hb')[1][0:2]
-mb_out_reg = mb_out.split('pfaf_')[1][0:2]
+ms_trans_reg = ms_catalog.pfaf_of(ms_trans_nc)
+riv_mb_reg = ms_catalog.pfaf_of(riv_mb_shp)
+sword_reg = ms_catalog.pfaf_of(sword_shp)
+mb_out_reg = ms_catalog.pfaf_of(mb_out)
 
 if not (ms_trans_reg == riv_mb_reg == sword_reg == mb_out_reg):
     print('ERROR - Input files correspond to different regions')
@@ -83,89 +78,34 @@ if not (ms_trans_reg == riv_mb_reg == sword_reg == mb_out_reg):
 
 
 # ******************************************************************************
-# Read shapefiles
+# Import processing modules
 # ******************************************************************************
-print('- Reading files')
-# ------------------------------------------------------------------------------
-# MERIT-Basins Reaches
-# ------------------------------------------------------------------------------
-# Read MERIT-Basins River files
-riv_mb_files = list(glob.iglob(re.sub(r'(?<=/riv/).*?(?=\.shp)', '*',
-                    riv_mb_shp)))
-
-# Sort reach files by value
-riv_mb_files.sort()
-
-# Convert to shapefile
-riv_mb_all = [fiona.open(j, 'r', crs="EPSG:4326") for j in riv_mb_files]
-
-# Retrieve pfaf numbers from file
-mb_pfaf_list = pd.Series([x.partition("pfaf_")[-1][0:2]
-                          for x in riv_mb_files]).sort_values()
-
-# Sort pfaf_list
-pfaf_srt = mb_pfaf_list.sort_values(ignore_index=True)
-pfaf_srt = pfaf_srt.reset_index(drop=True)
-
-# ------------------------------------------------------------------------------
-# MB-to-SWORD Translation
-# ------------------------------------------------------------------------------
-# Read MB-to-SWORD files
-ms_files = list(glob.iglob(re.sub(r'(?<=/mb_to_sword/).*?(?=\.nc)', '*',
-                ms_trans_nc)))
-
-# Sort reach files by value
-ms_files.sort()
-
-# Convert to shapefile
-ms_all = [xr.open_dataset(j).to_dataframe() for j in ms_files]
-
-# ------------------------------------------------------------------------------
-# SWORD
-# ------------------------------------------------------------------------------
-# Read SWORD files
-sword_files = list(glob.iglob(re.sub(r'(?<=/sword_edit/).*?(?=\.shp)', '*',
-                                     sword_shp)))
-
-# Retrieve pfaf numbers from file
-sw_pfaf_list = pd.Series([x.partition("reaches_hb")[-1][0:2]
-                          for x in sword_files]).sort_values()
-
-# Sort files by pfaf to align with MERIT-Basins
-sword_files = pd.Series(sword_files)[sw_pfaf_list.index.values].tolist()
-
-# Convert to shapefile
-sword_all = [fiona.open(j, 'r', crs="EPSG:4326") for j in sword_files]
-
-
-# ------------------------------------------------------------------------------
-# Get indices of target region shapefiles
-# ------------------------------------------------------------------------------
-ms_trans_ind = ms_files.index(ms_trans_nc)
-riv_mb_ind = riv_mb_files.index(riv_mb_shp)
-sword_ind = sword_files.index(sword_shp)
+import ms_timing
+ms_timing.phase('import')
+import pandas as pd
+import numpy as np
+import ms_io
+import ms_translation
+import merit_sword
 
 
 # ******************************************************************************
-# Store SWORD width value in dictionary
+# Read shapefiles
 # ******************************************************************************
-print('- Retrieving SWORD river widths')
-width_dicts = []
-
-# Loop through SWORD layers
-for sword_lay in sword_all:
-
-    # Initialize dictionary
-    width_dict = {}
-
-    for sword_fea in sword_lay:
-
-        # Relate reach_id to width
-        width_dict[sword_fea['properties']['reach_id']] = \
-                       sword_fea['properties']['width']
+print('- Reading files')
+ms_timing.phase('read')
+# ------------------------------------------------------------------------------
+# Files of all regions
+# ------------------------------------------------------------------------------
+# Files of MERIT-Basins reaches, translations and SWORD by pfaf region, from
+# the catalog of datasets
+catalog = ms_catalog.open_catalog()
+riv_mb_files = catalog.like(riv_mb_shp)
+ms_files = catalog.like(ms_trans_nc)
+sword_files = catalog.like(sword_shp)
 
-    # Append dictionary to width_dicts
-    width_dicts.append(width_dict)
+# Open translations lazily, reading only the regions used
+ms_all = ms_translation.TranslationFiles(ms_files)
 
 
 # ******************************************************************************
@@ -173,133 +113,51 @@ for sword_lay in sword_all:
 # ******************************************************************************
 print('- Transferring SWORD widths onto MB reaches')
 # Retrieve MB-to-SWORD translation for target pfaf
-ms_df = ms_all[ms_trans_ind]
-
-# Retrieve MB layer
-riv_mb_lay = riv_mb_all[riv_mb_ind]
+ms_trans = ms_all[ms_trans_reg]
 
 # For given MB region, identify related SWORD pfaf regions
-sm_pfaf = (ms_df.iloc[:, :40].map(lambda x: str(x)[:2])
-           .values
-           .flatten()
-           .tolist())
-sm_pfaf_uniq = list(np.unique([v for v in sm_pfaf if v != '0']))
-sm_cat_ind = pfaf_srt.index[pfaf_srt.isin(sm_pfaf_uniq)].tolist()
-
-# Retrieve and combine SWORD width dictionaries for relevant regions
-sword_dict_all = [width_dicts[x] for x in sm_cat_ind]
-
-sword_dict = {}
-for d in sword_dict_all:
-    sword_dict.update(d)
-
-    # Catch empty regions, writing empty file
-    if len(sm_cat_ind) == 0:
-
-        with fiona.open(riv_mb_files[riv_mb_ind], 'r') as src:
-
-            # Copy schema
-            new_schema = src.schema.copy()
+sm_pfaf_uniq = ms_trans.regions()
+sm_cat_reg = [x for x in riv_mb_files if x in sm_pfaf_uniq]
 
-            # Add new columns
-            new_schema['properties']['sword_wid'] = 'float'
+# Read reach_id and width columns of SWORD layers of relevant regions
+width_cols = [ms_io.read_fields(sword_files[x], ['reach_id', 'width']) for x
+              in sm_cat_reg]
 
-            # Write new shapefile
-            with fiona.open(mb_out, 'w', driver=src.driver, crs=src.crs,
-                            schema=new_schema) as out:
-
-                # Write features
-                for riv_fea in src:
-
-                    # Copy feature geometry and properties
-                    new_geom = riv_fea['geometry']
-                    new_id = riv_fea['id']
-                    new_prop = dict(riv_fea['properties'])
-
-                    # Write Null
-                    new_prop['sword_wid'] = None
-
-                    # Write new feature
-                    out.write(fiona.Feature(geometry=new_geom, id=new_id,
-                                            properties=new_prop))
-
-        continue
+if len(width_cols) > 0:
+    sword_id = np.concatenate([x['reach_id'] for x in width_cols])
+    sword_wid = np.concatenate([x['width'] for x in width_cols])
+else:
+    sword_id = np.array([], dtype='int64')
+    sword_wid = np.array([], dtype='float64')
 
 # ------------------------------------------------------------------------------
 # Assign SWORD width values to each MB reach (weighted average)
 # ------------------------------------------------------------------------------
-width_avg = []
-
-# Loop through MB reaches
-for riv_fea in riv_mb_lay:
-
-    # Retrieve COMID
-    comid = riv_fea['properties']['COMID']
-
-    # Retrieve translated SWORD reaches and partial length values
-    reach_ids = ms_df.loc[comid].iloc[0:40].astype('int')
-    part_len = ms_df.loc[comid].iloc[40:]
-
-    # Remove zero values
-    reach_ids = reach_ids[reach_ids > 0]
-    part_len = part_len[:len(reach_ids)]
-
-    # If COMID has no corresponding SWORd reaches, return NaN value
-    if len(reach_ids) == 0:
-        width_weight = np.nan
-
-    else:
-
-        # Retrieve width values for translated reaches
-        width_i = [sword_dict[reach_id] for reach_id in reach_ids]
-
-        # Calculate weighted average of width values by partial length
-        width_weight = np.sum(width_i * (part_len/np.sum(part_len)))
-
-    width_avg.append(width_weight)
+# MB reaches without translated reaches return NaN values
+ms_timing.phase('transfer')
+ms_timing.count('features', len(sword_id))
+try:
+    width_avg = merit_sword.transfer_values(ms_trans.ids[:, 0:40],
+                                            ms_trans.part_len[:, 0:40],
+                                            sword_id, sword_wid)
+except KeyError:
+    print('ERROR - Translated SWORD reaches missing from SWORD files')
+    raise SystemExit(22)
 
 # Give width_avg index of MB reaches
-width_avg = pd.Series(width_avg)
-width_avg.index = ms_df.index
+width_avg = pd.Series(width_avg, index=ms_trans.index)
 
 # ------------------------------------------------------------------------------
 # Write MB layer to shapefile with new column for translated values
 # ------------------------------------------------------------------------------
 print('- Writing shapefiles')
-with fiona.open(riv_mb_files[riv_mb_ind], 'r') as src:
-
-    # Copy schema
-    new_schema = src.schema.copy()
-
-    # Add new columns
-    new_schema['properties']['sword_wid'] = 'float'
-
-    # Write new shapefile
-    with fiona.open(mb_out, 'w', driver=src.driver, crs=src.crs,
-                    schema=new_schema) as out:
-
-        # Write features
-        for riv_fea in src:
-
-            # Copy feature geometry and properties
-            new_geom = riv_fea['geometry']
-            new_id = riv_fea['id']
-            new_prop = dict(riv_fea['properties'])
-
-            # Store translated width values if they exist
-            if new_prop['COMID'] in width_avg.index:
-                width_val = round(width_avg.loc[new_prop['COMID']], 2)
-            else:
-                width_val = np.nan
-
-            # Check if values are NaN
-            if np.isnan(width_val):
-                # Write Null
-                new_prop['sword_wid'] = None
-            else:
-                # Write value
-                new_prop['sword_wid'] = width_val
-
-            # Write new feature
-            out.write(fiona.Feature(geometry=new_geom, id=new_id,
-                                    properties=new_prop))
+ms_timing.phase('write')
+# Align width values with the feature order of the MB layer
+# MB reaches absent from the translation receive NaN values
+riv_mb_id = ms_io.read_fields(riv_mb_files[riv_mb_reg], ['COMID'])['COMID']
+width_val = np.round(width_avg.reindex(riv_mb_id).values.astype('float64'),
+                     2)
+
+# Write new shapefile
+ms_io.append_fields(riv_mb_files[riv_mb_reg], mb_out,
+                    {'sword_wid': width_val})
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# ms_cache.py
+# ******************************************************************************
+
+# Purpose:
+# Given a folder of shapefiles (MERIT-Basins, SWORD, MeanDRS, ...) and a cache
+# folder, this script converts each shapefile once into a columnar GeoParquet
+# file (attributes as Arrow columns, geometries as WKB). The cached layers are
+# then used by ms_io.py to load whole columns and geometry arrays in bulk, as
+# long as the cache folder is given in the MS_CACHE_DIR environment variable.
+# Geometries are read as a WkbArray of ms_geom_store.py over the buffers of
+# the WKB column, without a copy of each geometry, and the fiona schema of the
+# layer is kept in the cached metadata when read with the fiona backend.
+
+# Author:
+# Jeffrey Wade, 2024
+
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import sys
+import os
+import glob
+import json
+import hashlib
+import importlib.util
+import numpy as np
+
+# pyarrow is imported only when a cache is used, to keep startup short
+HAS_PYARROW = importlib.util.find_spec('pyarrow') is not None
+
+
+# ******************************************************************************
+# Cache location and freshness
+# ******************************************************************************
+def cache_path(shp, cache_dir):
+    """Return the GeoParquet file caching shp within cache_dir, named after
+    the file name and a hash of the absolute path of shp, so that layers of
+    the same name in different folders have distinct files."""
+
+    stem = os.path.splitext(os.path.basename(shp))[0]
+    key = hashlib.blake2b(os.path.abspath(shp).encode(),
+                          digest_size=4).hexdigest()
+    return os.path.join(cache_dir, stem + '.' + key + '.parquet')
+
+
+def source_stamp(shp):
+    """Return size and modification time of the .shp and .dbf of a layer."""
+
+    stamp = {}
+    for ext in ['.shp', '.dbf']:
+        src = os.path.splitext(shp)[0] + ext
+        if os.path.isfile(src):
+            stat = os.stat(src)
+            stamp[ext] = [stat.st_size, stat.st_mtime_ns]
+    return stamp
+
+
+# ******************************************************************************
+# Write a layer to the cache
+# ******************************************************************************
+def ingest(shp, cache_dir):
+    """Convert shp into a GeoParquet file in cache_dir and return its path."""
+
+    # Local import, as ms_io reads cached layers through this module
+    import ms_io
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    meta, fields, geometry = ms_io.read_layer(shp, use_cache=False)
+
+    # Attribute columns followed by WKB geometry column
+    columns = {name: pa.array(fields[name]) for name in meta['fields']}
+    columns['geometry'] = pa.array(geometry, type=pa.binary())
+    table = pa.table(columns)
+
+    # Store layer metadata and GeoParquet geometry description
+    geo = {'version': '1.0.0', 'primary_column': 'geometry',
+           'columns': {'geometry': {'encoding': 'WKB',
+                                    'geometry_types':
+                                    [meta['geometry_type']]}}}
+    ms_meta = {'crs': meta['crs'], 'encoding': meta['encoding'],
+               'geometry_type': meta['geometry_type'],
+               'fields': list(meta['fields']), 'source': source_stamp(shp)}
+    if 'schema' in meta:
+        ms_meta['schema'] = meta['schema']
+    table = table.replace_schema_metadata({b'geo': json.dumps(geo),
+                                           b'ms_cache': json.dumps(ms_meta)})
+
+    os.makedirs(cache_dir, exist_ok=True)
+    out = cache_path(shp, cache_dir)
+
+    # Write to temporary file first so readers never see partial files
+    pq.write_table(table, out + '.tmp')
+    os.replace(out + '.tmp', out)
+
+    return out
+
+
+# ******************************************************************************
+# Read a layer from the cache
+# ******************************************************************************
+def read_cached(shp, columns=None, read_geometry=True, cache_dir=None):
+    """Return (meta, fields, geometry) for shp from the cache, or None if the
+    cache is disabled, missing, or older than the shapefile."""
+
+    if cache_dir is None:
+        cache_dir = os.environ.get('MS_CACHE_DIR')
+    if not HAS_PYARROW or not cache_dir:
+        return None
+    import pyarrow.parquet as pq
+
+    cached = cache_path(shp, cache_dir)
+    if not os.path.isfile(cached):
+        return None
+
+    # Check cached layer was generated from the current shapefile
+    ms_meta = json.loads(pq.read_schema(cached).metadata[b'ms_cache'])
+    if ms_meta['source'] != source_stamp(shp):
+        return None
+
+    names = ms_meta['fields'] if columns is None else list(columns)
+    table = pq.read_table(cached, columns=names + (['geometry'] if
+                                                   read_geometry else []))
+
+    fields = {name: table.column(name).to_numpy(zero_copy_only=False)
+              for name in names}
+    geometry = None
+    if read_geometry:
+        geometry = wkb_array(table.column('geometry'))
+
+    meta = {'crs': ms_meta['crs'], 'encoding': ms_meta['encoding'],
+            'geometry_type': ms_meta['geometry_type'],
+            'fields': np.array(names, dtype=object)}
+    if 'schema' in ms_meta:
+        schema = ms_meta['schema']
+        meta['schema'] = {'geometry': schema['geometry'],
+                          'properties': {x: schema['properties'][x]
+                                         for x in names}}
+
+    return meta, fields, geometry
+
+
+def wkb_array(column):
+    """Return a WkbArray over the offsets and data buffers of a WKB column
+    (pyarrow ChunkedArray of binary values), with null values as empty."""
+
+    # Local import, as ms_geom_store imports this module
+    import pyarrow as pa
+    import ms_geom_store
+
+    arr = column.combine_chunks()
+    _, off_buf, data_buf = arr.buffers()
+    dtype = np.int64 if pa.types.is_large_binary(arr.type) else np.int32
+    offsets = np.frombuffer(off_buf, dtype=dtype)[arr.offset:arr.offset +
+                                                  len(arr) + 1] \
+        if off_buf is not None else np.zeros(len(arr) + 1, dtype=dtype)
+    blob = np.frombuffer(data_buf, dtype=np.uint8) if data_buf is not None \
+        else np.zeros(0, dtype=np.uint8)
+
+    return ms_geom_store.WkbArray(blob, offsets)
+
+
+# ******************************************************************************
+# Command line interface
+# ******************************************************************************
+if __name__ == '__main__':
+
+    # --------------------------------------------------------------------------
+    # Declaration of variables (given as command line arguments)
+    # --------------------------------------------------------------------------
+    # 1 - shp_in
+    # 2 - cache_out
+
+    # --------------------------------------------------------------------------
+    # Get command line arguments
+    # --------------------------------------------------------------------------
+    IS_arg = len(sys.argv)
+    if IS_arg != 3:
+        print('ERROR - 2 arguments must be used')
+        raise SystemExit(22)
+
+    shp_in = sys.argv[1]
+    cache_out = sys.argv[2]
+
+    # --------------------------------------------------------------------------
+    # Check if folders exist
+    # --------------------------------------------------------------------------
+    if not os.path.isdir(shp_in):
+        print('ERROR - '+shp_in+' invalid folder path')
+        raise SystemExit(22)
+
+    if not HAS_PYARROW:
+        print('ERROR - pyarrow is required to build the cache')
+        raise SystemExit(22)
+
+    # --------------------------------------------------------------------------
+    # Convert shapefiles to cache
+    # --------------------------------------------------------------------------
+    print('- Caching shapefiles')
+    shp_files = sorted(glob.glob(os.path.join(shp_in, '**', '*.shp'),
+                                 recursive=True))
+
+    for shp in shp_files:
+
+        # Skip layers already cached from the current shapefile
+        if read_cached(shp, columns=[], read_geometry=False,
+                       cache_dir=cache_out) is not None:
+            continue
+
+        print('  - '+os.path.relpath(shp, shp_in))
+        ingest(shp, cache_out)
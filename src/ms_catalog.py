@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# ms_catalog.py
+# ******************************************************************************
+
+# Purpose:
+# This module keeps a catalog of the files of each dataset of MERIT-SWORD, so
+# that scripts resolve the files of related regions by (dataset, pfaf) instead
+# of globbing folders and aligning the file lists by pfaf. A dataset is a
+# folder of shapefiles or NetCDF files (e.g. 'MB/cat' of the input folder or
+# 'ms_translate/mb_to_sword' of the output folder), and the pfaf region of
+# each file is taken from its name ('pfaf_11' or 'hb11'). Along with its path,
+# the catalog records the feature count, bounds and checksum of each file.
+# The catalog is built once over the input and output folders by
+# ms_pipeline.py and saved in a JSON index file given to the scripts in the
+# MS_CATALOG environment variable. Scripts scan again the folders whose
+# modification time changed since the index was saved (e.g. as files were
+# written by other runs), and the folders absent from the index.
+
+# Author:
+# Jeffrey Wade, 2024
+
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import os
+import re
+import json
+import struct
+import fnmatch
+import hashlib
+import collections.abc
+
+
+# ******************************************************************************
+# Catalog parameters
+# ******************************************************************************
+# Extensions of cataloged files
+EXTS = ('.shp', '.nc')
+
+# Pfaf region in file names of MERIT-Basins and outputs ('pfaf_11') and of
+# SWORD ('hb11')
+PFAF_RE = re.compile(r'(?:pfaf_|hb)(\d\d)')
+
+
+def pfaf_of(path):
+    """Return the 2-digit pfaf region in the file name of path, raising
+    ValueError if there is none."""
+
+    match = PFAF_RE.search(os.path.basename(path))
+    if match is None:
+        raise ValueError('No pfaf region in file name of '+path)
+
+    return match.group(1)
+
+
+def pattern_of(path):
+    """Return the pattern of the file names of the dataset of path: its file
+    name with the pfaf region replaced by wildcards, and any prefix before
+    the region (e.g. the continent of SWORD files) by '*'."""
+
+    name = os.path.basename(path)
+    match = PFAF_RE.search(name)
+    if match is None:
+        raise ValueError('No pfaf region in file name of '+path)
+
+    return '*' + name[match.start():match.start(1)] + '??' + \
+        name[match.end(1):]
+
+
+# ******************************************************************************
+# Files by pfaf region
+# ******************************************************************************
+class RegionFiles(collections.abc.Mapping):
+    """Paths of the files of a dataset by pfaf region, in order of pfaf.
+    Accessing a region with several files raises ValueError, so that other
+    regions can still be used."""
+
+    def __init__(self, files, folder):
+        self._files = {x: files[x] for x in sorted(files)}
+        self.folder = folder
+
+    def __getitem__(self, pfaf):
+        paths = self._files[pfaf]
+        if len(paths) > 1:
+            raise ValueError('Several files of pfaf region '+pfaf+' in ' +
+                             self.folder+': ' +
+                             ', '.join(os.path.basename(x) for x in paths))
+        return paths[0]
+
+    def __iter__(self):
+        return iter(self._files)
+
+    def __len__(self):
+        return len(self._files)
+
+    def paths(self, pfaf):
+        """Return all paths of the files of region pfaf (none if absent)."""
+
+        return list(self._files.get(pfaf, []))
+
+    def ambiguous(self):
+        """Return the pfaf regions with several files."""
+
+        return [x for x in self._files if len(self._files[x]) > 1]
+
+
+# ******************************************************************************
+# File records
+# ******************************************************************************
+def _sidecars(path, names):
+    """Return the sorted names among names of the files holding path: all
+    sidecar files of a shapefile, or the file itself."""
+
+    name = os.path.basename(path)
+    if not path.endswith('.shp'):
+        return [name] if name in names else []
+
+    stem = name[:-4]
+    return sorted(x for x in names if os.path.splitext(x)[0] == stem)
+
+
+def _stamp(folder, files):
+    """Return the [name, size, modification time] of each file of files."""
+
+    stamp = []
+    for name in files:
+        stat = os.stat(os.path.join(folder, name))
+        stamp.append([name, stat.st_size, stat.st_mtime_ns])
+
+    return stamp
+
+
+def checksum(folder, files):
+    """Return the SHA-256 of the files of a layer in folder, combined as the
+    content hashes of ms_pipeline.py."""
+
+    sha = hashlib.sha256()
+    for name in files:
+        sha_f = hashlib.sha256()
+        with open(os.path.join(folder, name), 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                sha_f.update(chunk)
+        sha.update(os.path.splitext(name)[1].encode())
+        sha.update(sha_f.hexdigest().encode())
+
+    return sha.hexdigest()
+
+
+def describe(path):
+    """Return the feature count and (minx, miny, maxx, maxy) bounds of path,
+    from the headers of a shapefile, or the length of the first dimension of
+    a NetCDF file (without bounds)."""
+
+    if path.endswith('.shp'):
+        with open(path, 'rb') as file:
+            bounds = list(struct.unpack('<4d', file.read(100)[36:68]))
+        count = (os.path.getsize(path[:-4] + '.shx') - 100) // 8
+        return count, bounds
+
+    import netCDF4
+
+    with netCDF4.Dataset(path) as ds:
+        return len(list(ds.dimensions.values())[0]), None
+
+
+# ******************************************************************************
+# Catalog
+# ******************************************************************************
+class Catalog:
+    """Records of the files of each dataset (folder) by pfaf region. Datasets
+    are named relative to the root folders holding them (e.g. the input and
+    output folders), or by their path otherwise."""
+
+    def __init__(self, roots=()):
+        self.roots = [os.path.abspath(x) for x in roots]
+        self.files = {}
+        self.folders = {}
+        self._regions = {}
+        self._dataset = {}
+
+    # --------------------------------------------------------------------------
+    # Scan folders
+    # --------------------------------------------------------------------------
+    def dataset(self, folder):
+        """Return the name of the dataset of folder."""
+
+        folder = os.path.abspath(folder)
+        for root in self.roots:
+            if folder == root or folder.startswith(root + os.sep):
+                return os.path.relpath(folder, root)
+
+        return folder
+
+    def scan(self, folder, full=False):
+        """Catalog the files of folder, keeping the records of unchanged
+        files. If full is True, the feature count, bounds and checksum of
+        new or changed files are recorded, otherwise they are left to
+        record()."""
+
+        folder = os.path.abspath(folder)
+        mtime = os.stat(folder).st_mtime_ns
+        names = os.listdir(folder)
+        dataset = self.dataset(folder)
+
+        old = {x: y for x, y in self.files.items()
+               if os.path.dirname(x) == folder}
+        for path in old:
+            del self.files[path]
+
+        for name in sorted(names):
+            if os.path.splitext(name)[1] not in EXTS or \
+                    PFAF_RE.search(name) is None:
+                continue
+
+            path = os.path.join(folder, name)
+            stamp = _stamp(folder, _sidecars(path, names))
+            rec = old.get(path)
+            if rec is None or rec['stamp'] != stamp:
+                rec = {'dataset': dataset, 'pfaf': pfaf_of(name),
+                       'path': path, 'count': None, 'bounds': None,
+                       'checksum': None, 'stamp': stamp}
+            self.files[path] = rec
+            if full:
+                self._describe(rec)
+
+        self.folders[folder] = mtime
+        self._index(folder)
+
+    def _index(self, folder):
+        """Index the files of folder by extension and pfaf."""
+
+        for key in [x for x in self._regions if x[0] == folder]:
+            del self._regions[key]
+
+        for path in sorted(x for x in self.files
+                           if os.path.dirname(x) == folder):
+            rec = self.files[path]
+            key = (folder, os.path.splitext(path)[1])
+            self._regions.setdefault(key, {}).setdefault(rec['pfaf'],
+                                                         []).append(path)
+            self._dataset[(rec['dataset'], key[1])] = folder
+
+    def _describe(self, rec):
+        """Fill in the feature count, bounds and checksum of rec."""
+
+        if rec['checksum'] is None:
+            folder = os.path.dirname(rec['path'])
+            files = [x[0] for x in rec['stamp']]
+            rec['count'], rec['bounds'] = describe(rec['path'])
+            rec['checksum'] = checksum(folder, files)
+
+    def refresh(self, folder):
+        """Scan folder if absent from the catalog or changed since its last
+        scan."""
+
+        folder = os.path.abspath(folder)
+        if self.folders.get(folder) != os.stat(folder).st_mtime_ns:
+            self.scan(folder)
+
+    # --------------------------------------------------------------------------
+    # Resolve files
+    # --------------------------------------------------------------------------
+    def regions(self, folder, ext='.shp', pattern=None):
+        """Return the paths of the files of extension ext in folder by pfaf
+        region, in order of pfaf, as a RegionFiles raising ValueError only
+        when a region with several files is accessed. If pattern is given,
+        only the files whose name matches it are kept (e.g. the files of one
+        version of a dataset)."""
+
+        folder = os.path.abspath(folder)
+        self.refresh(folder)
+
+        files = self._regions.get((folder, ext), {})
+        if pattern is not None:
+            files = {x: [y for y in files[x] if
+                         fnmatch.fnmatchcase(os.path.basename(y), pattern)]
+                     for x in files}
+            files = {x: y for x, y in files.items() if len(y) > 0}
+
+        return RegionFiles(files, folder)
+
+    def like(self, path):
+        """Return the paths of the files of the dataset of path (the files of
+        its folder with the same extension and names matching pattern_of(path))
+        by pfaf region, in order of pfaf, with the folder written as in
+        path."""
+
+        folder, name = os.path.split(path)
+        ext = os.path.splitext(name)[1]
+        pattern = pattern_of(name)
+        files = self.regions(folder or '.', ext, pattern)
+
+        # Files written since the folder was scanned within the resolution
+        # of its modification time
+        if os.path.isfile(path) and \
+                os.path.abspath(path) not in files.paths(pfaf_of(name)):
+            self.scan(folder or '.')
+            files = self.regions(folder or '.', ext, pattern)
+
+        return RegionFiles({x: [os.path.join(folder, os.path.basename(y))
+                                for y in files.paths(x)] for x in files},
+                           files.folder)
+
+    def path(self, dataset, pfaf, ext='.shp'):
+        """Return the path of the file of dataset for pfaf, raising KeyError
+        if absent and ValueError if the region has several files."""
+
+        folder = self._dataset.get((dataset, ext))
+        if folder is None:
+            folder = [x for x in [os.path.join(y, dataset) for y in
+                                  self.roots] + [dataset] if os.path.isdir(x)]
+            if len(folder) == 0:
+                raise KeyError('Unknown dataset '+dataset)
+            folder = folder[0]
+
+        return self.regions(folder, ext)[pfaf]
+
+    def record(self, path):
+        """Return the record of the file path, with its feature count, bounds
+        and checksum."""
+
+        path = os.path.abspath(path)
+        self.refresh(os.path.dirname(path))
+
+        rec = self.files[path]
+        stamp = _stamp(os.path.dirname(path), [x[0] for x in rec['stamp']])
+        if rec['stamp'] != stamp:
+            self.scan(os.path.dirname(path))
+            rec = self.files[path]
+        self._describe(rec)
+
+        return rec
+
+    # --------------------------------------------------------------------------
+    # Index file
+    # --------------------------------------------------------------------------
+    def save(self, index_json):
+        os.makedirs(os.path.dirname(index_json) or '.', exist_ok=True)
+        tmp = index_json + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp, 'w') as file:
+            json.dump({'roots': self.roots, 'folders': self.folders,
+                       'files': [self.files[x] for x in sorted(self.files)]},
+                      file, indent=1, sort_keys=True)
+        os.replace(tmp, index_json)
+
+    @classmethod
+    def load(cls, index_json):
+        with open(index_json) as file:
+            index = json.load(file)
+
+        catalog = cls(index['roots'])
+        catalog.folders = index['folders']
+        catalog.files = {x['path']: x for x in index['files']}
+        for folder in catalog.folders:
+            catalog._index(folder)
+
+        return catalog
+
+
+# ******************************************************************************
+# Build and open catalogs
+# ******************************************************************************
+def build(roots, index_json=None):
+    """Return the catalog of all folders below roots, with the feature count,
+    bounds and checksum of each file. Records of the index file index_json
+    are kept for unchanged files, and the catalog is saved to it."""
+
+    catalog = Catalog(roots)
+    if index_json is not None and os.path.isfile(index_json):
+        old = Catalog.load(index_json)
+        catalog.files = old.files
+
+    for root in catalog.roots:
+        for folder, dirs, _ in os.walk(root):
+            dirs.sort()
+            catalog.scan(folder, full=True)
+
+    # Files of folders removed since the index was saved
+    catalog.files = {x: y for x, y in catalog.files.items()
+                     if os.path.dirname(x) in catalog.folders}
+
+    if index_json is not None:
+        catalog.save(index_json)
+
+    return catalog
+
+
+def open_catalog():
+    """Return the catalog saved in the index file given in the MS_CATALOG
+    environment variable, or an empty catalog scanning folders on demand."""
+
+    index_json = os.environ.get('MS_CATALOG')
+    if index_json and os.path.isfile(index_json):
+        return Catalog.load(index_json)
+
+    return Catalog()
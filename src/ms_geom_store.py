@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# ms_geom_store.py
+# ******************************************************************************
+
+# Purpose:
+# This module stores the geometries of a layer in a flat binary file of WKB
+# geometries, along with an offsets array, an array of feature IDs (COMID or
+# reach_id), and an array of feature bounds. All files are memory-mapped, so
+# that random access to a geometry by row or by ID is a slice of the mapped
+# file, and so that processes opening the same store share the same pages.
+# The IDs are also stored sorted, along with their rows, so that lookups by ID
+# are binary searches in a mapped file rather than a sort on each opening.
+# Stores are kept in the folder given in the MS_STORE_DIR environment variable
+# (or in a temporary folder), named after the file name and absolute path of
+# their layer, and are rebuilt when the layer changes. The files of each build
+# are named after the version of the layer, so that a store is never mapped
+# with files of different versions.
+# Each mapped file holds an open file descriptor, so the files of stores are
+# mapped through a pool shared by all stores of a process, which keeps at most
+# MS_MAX_OPEN stores (default: 64) mapped and unmaps the least recently used
+# ones; an unmapped store is mapped again on its next access, with the files
+# of the current version if the store was rebuilt meanwhile.
+
+# Author:
+# Jeffrey Wade, 2024
+
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import os
+import re
+import json
+import hashlib
+import tempfile
+import collections
+import numpy as np
+import shapely
+import ms_cache
+
+
+# ******************************************************************************
+# Pool of mapped stores
+# ******************************************************************************
+# Default maximum number of stores mapped at once by a process
+MAX_OPEN = 64
+
+
+def map_files(prefix):
+    """Return the (blob, offsets, ids, bounds, srt) arrays mapped from the
+    files of the store at prefix."""
+
+    # Flat WKB blob and offsets of each geometry within the blob
+    offsets = np.load(prefix + '.off.npy', mmap_mode='r')
+    if offsets[-1] > 0:
+        blob = np.memmap(prefix + '.wkb', dtype=np.uint8, mode='r')
+    else:
+        blob = np.zeros(0, dtype=np.uint8)
+
+    # Feature IDs and bounds in row order, and sorted IDs above their rows
+    return blob, offsets, np.load(prefix + '.ids.npy', mmap_mode='r'), \
+        np.load(prefix + '.bnd.npy', mmap_mode='r'), \
+        np.load(prefix + '.srt.npy', mmap_mode='r')
+
+
+def current_version(prefix):
+    """Return the path prefix of the files of the current version of the
+    store whose files of any version are at prefix, as named by its stamp,
+    raising FileNotFoundError if the stamp is missing or unreadable."""
+
+    stamp_json = re.sub(r'\.[0-9a-f]{16}$', '', prefix) + '.json'
+    try:
+        with open(stamp_json) as f:
+            return os.path.join(os.path.dirname(prefix), json.load(f)['files'])
+    except (ValueError, KeyError):
+        raise FileNotFoundError('Unreadable store stamp '+stamp_json)
+
+
+class StorePool:
+    """Mapped files of up to max_open stores (default: MS_MAX_OPEN or
+    MAX_OPEN), unmapping the least recently used stores beyond."""
+
+    def __init__(self, max_open=None):
+        if max_open is None:
+            max_open = int(os.environ.get('MS_MAX_OPEN', MAX_OPEN))
+        self.max_open = max(max_open, 1)
+        self.maps = 0
+        self._open = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._open)
+
+    def get(self, prefix):
+        """Return the mapped arrays of the store at prefix."""
+
+        if prefix in self._open:
+            self._open.move_to_end(prefix)
+            return self._open[prefix]
+
+        # Files are closed once arrays of evicted stores are no longer
+        # referenced
+        try:
+            arrays = map_files(prefix)
+        except FileNotFoundError:
+            # Version removed by a rebuild of the store since it was mapped
+            current = current_version(prefix)
+            if current == prefix:
+                raise
+            arrays = map_files(current)
+        self._open[prefix] = arrays
+        self.maps += 1
+        while len(self._open) > self.max_open:
+            self._open.popitem(last=False)
+
+        return arrays
+
+    def discard(self, prefix):
+        """Unmap the store at prefix, e.g. after it was rebuilt."""
+
+        self._open.pop(prefix, None)
+
+
+# Pool shared by the stores of this process
+POOL = StorePool()
+
+
+# ******************************************************************************
+# WKB views
+# ******************************************************************************
+class WkbArray:
+    """Read-only sequence of the WKB geometries of rows (default all) of a
+    flat blob, holding views of the blob and offsets arrays instead of a copy
+    of each geometry. An integer index returns the WKB bytes of a geometry
+    (None if empty), other indexes (slice, boolean or integer array) return
+    another WkbArray, and np.asarray() returns an object array of WKB as
+    read by ms_io.read_layer."""
+
+    def __init__(self, blob, offsets, rows=None):
+        self.blob = blob
+        self.offsets = offsets
+        self.rows = None if rows is None else np.asarray(rows, dtype=np.int64)
+
+    def __len__(self):
+        if self.rows is None:
+            return len(self.offsets) - 1
+        return len(self.rows)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            row = range(len(self.offsets) - 1)[key] if self.rows is None \
+                else self.rows[key]
+            wkb = self.blob[self.offsets[row]:self.offsets[row + 1]]
+            return wkb.tobytes() if len(wkb) > 0 else None
+
+        rows = np.arange(len(self.offsets) - 1) if self.rows is None else \
+            self.rows
+        return WkbArray(self.blob, self.offsets, rows[key])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __array__(self, dtype=None):
+        geometry = np.empty(len(self), dtype=object)
+        geometry[:] = list(self)
+        return geometry
+
+
+# ******************************************************************************
+# Geometry store
+# ******************************************************************************
+class GeometryStore:
+    """Memory-mapped WKB geometries of a layer, accessible by row or ID. Files
+    are mapped through pool (default: POOL)."""
+
+    def __init__(self, prefix, pool=None):
+        self.prefix = prefix
+        self.pool = POOL if pool is None else pool
+
+        # Map files now, so that a missing version fails on opening
+        self._arrays()
+
+    def _arrays(self):
+        """Return the (blob, offsets, ids, bounds, srt) arrays of the store,
+        srt holding the sorted IDs above their rows."""
+        return self.pool.get(self.prefix)
+
+    @property
+    def blob(self):
+        return self._arrays()[0]
+
+    @property
+    def offsets(self):
+        return self._arrays()[1]
+
+    @property
+    def ids(self):
+        return self._arrays()[2]
+
+    @property
+    def bounds(self):
+        return self._arrays()[3]
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def wkb(self, row):
+        """Return the WKB of a row as a view of the mapped file."""
+        blob, offsets = self._arrays()[:2]
+        return memoryview(blob[offsets[row]:offsets[row + 1]])
+
+    def geom(self, row):
+        """Return the shapely geometry of a row."""
+        return shapely.from_wkb(bytes(self.wkb(row)))
+
+    def geoms(self, rows=None):
+        """Return an array of shapely geometries for rows (default all)."""
+        return shapely.from_wkb(self.wkb_array(rows))
+
+    def wkb_array(self, rows=None):
+        """Return the WKB of rows (default all) as a WkbArray of views of
+        the mapped files."""
+        blob, offsets = self._arrays()[:2]
+        return WkbArray(blob, offsets, None if rows is None else
+                        np.asarray(rows))
+
+    def rows(self, ids):
+        """Return the rows of an array of IDs, raising KeyError if absent."""
+        ids = np.asarray(ids)
+        ids_srt, id_srt = self._arrays()[4]
+        pos = np.searchsorted(ids_srt, ids)
+        pos = np.minimum(pos, len(ids_srt) - 1)
+        if len(ids_srt) == 0 or not np.array_equal(ids_srt[pos], ids):
+            raise KeyError('IDs missing from geometry store')
+        return id_srt[pos]
+
+    def row(self, fid):
+        """Return the row of a single ID."""
+        return int(self.rows([fid])[0])
+
+
+# ******************************************************************************
+# Build and open stores
+# ******************************************************************************
+def pack_wkb(geometry):
+    """Return the flat WKB blob (bytes), offsets and bounds of an object
+    array of WKB geometries, with missing geometries as empty WKB."""
+
+    # Concatenate WKB geometries and record their offsets
+    wkb = [b'' if x is None else bytes(x) for x in geometry]
+    offsets = np.zeros(len(wkb) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(x) for x in wkb])
+
+    bounds = shapely.bounds(shapely.from_wkb(
+        np.array([x if len(x) > 0 else None for x in wkb], dtype=object)))
+
+    return b''.join(wkb), offsets, bounds.reshape(-1, 4)
+
+
+def sort_ids(ids):
+    """Return the sorted IDs of an array of IDs above their rows, as an
+    int64 array of shape (2, len(ids))."""
+
+    ids = np.asarray(ids, dtype=np.int64)
+    rows = np.argsort(ids, kind='stable')
+
+    return np.stack([ids[rows], rows])
+
+
+# Files of a version of a store
+STORE_EXTS = ['.wkb', '.off.npy', '.ids.npy', '.bnd.npy', '.srt.npy']
+
+# Format of the files of stores, recorded in their stamp so that stores
+# written in an older format are rebuilt
+FORMAT = 2
+
+
+def store_prefix(shp, id_field, store_dir=None):
+    """Return the path prefix of the store of shp keyed by id_field, named
+    after the file name and a hash of the absolute path of shp, so that
+    layers of the same name in different folders have distinct stores."""
+
+    if store_dir is None:
+        store_dir = os.environ.get('MS_STORE_DIR',
+                                   os.path.join(tempfile.gettempdir(),
+                                                'ms_geom_store'))
+    stem = os.path.splitext(os.path.basename(shp))[0]
+    key = hashlib.blake2b(os.path.abspath(shp).encode(),
+                          digest_size=4).hexdigest()
+    return os.path.join(store_dir, stem + '.' + key + '.' + id_field)
+
+
+def version_prefix(prefix, stamp):
+    """Return the path prefix of the files of the store at prefix built from
+    the source with stamp stamp (ms_cache.source_stamp)."""
+
+    return prefix + '.' + hashlib.blake2b(json.dumps(stamp).encode(),
+                                          digest_size=8).hexdigest()
+
+
+def build_store(shp, id_field, store_dir=None):
+    """Write the geometry store of shp and return the path prefix of its
+    files.
+
+    The files of each version of the source are written under their own
+    prefix, and the stamp naming the current version is written last, so
+    that a process opening the store while it is rebuilt maps the files of a
+    single version. Files of previous versions are then removed.
+    """
+
+    prefix = store_prefix(shp, id_field, store_dir)
+    os.makedirs(os.path.dirname(prefix), exist_ok=True)
+
+    # Local import, as ms_io reads shared layers through ms_shared.py, which
+    # builds on this module
+    import ms_io
+
+    stamp = ms_cache.source_stamp(shp)
+    files = version_prefix(prefix, stamp)
+    _, fields, geometry = ms_io.read_layer(shp, columns=[id_field])
+    blob, offsets, bounds = pack_wkb(geometry)
+
+    # Write each file to a temporary path first, then move in place
+    # Temporary paths are process-specific as workers may build concurrently
+    tmp = '.' + str(os.getpid()) + '.tmp'
+
+    with open(files + '.wkb' + tmp, 'wb') as f:
+        f.write(blob)
+    os.replace(files + '.wkb' + tmp, files + '.wkb')
+
+    ids = np.asarray(fields[id_field], np.int64)
+    for ext, arr in [('.off.npy', offsets), ('.ids.npy', ids),
+                     ('.bnd.npy', bounds), ('.srt.npy', sort_ids(ids))]:
+        with open(files + ext + tmp, 'wb') as f:
+            np.save(f, arr)
+        os.replace(files + ext + tmp, files + ext)
+
+    # Stamp written last, marking the version as current
+    with open(prefix + '.json' + tmp, 'w') as f:
+        json.dump({'source': stamp, 'id_field': id_field, 'format': FORMAT,
+                   'files': os.path.basename(files)}, f)
+    os.replace(prefix + '.json' + tmp, prefix + '.json')
+
+    # Remove files of previous versions
+    # Processes having mapped them keep their pages until unmapped
+    old = re.compile(re.escape(os.path.basename(prefix)) + r'\.[0-9a-f]{16}(' +
+                     '|'.join(re.escape(x) for x in STORE_EXTS) + ')')
+    for name in os.listdir(os.path.dirname(prefix)):
+        if old.fullmatch(name) and \
+                not name.startswith(os.path.basename(files) + '.'):
+            try:
+                os.remove(os.path.join(os.path.dirname(prefix), name))
+            except OSError:
+                pass
+
+    # Files of this version previously mapped by this process were rewritten
+    POOL.discard(files)
+
+    return files
+
+
+def open_store(shp, id_field, store_dir=None):
+    """Return the GeometryStore of shp, building it if missing or stale."""
+
+    prefix = store_prefix(shp, id_field, store_dir)
+
+    try:
+        with open(prefix + '.json') as f:
+            stamp = json.load(f)
+        fresh = stamp['source'] == ms_cache.source_stamp(shp) and \
+            stamp.get('format') == FORMAT
+        files = os.path.join(os.path.dirname(prefix), stamp['files'])
+    except (IOError, ValueError, KeyError):
+        fresh = False
+
+    if not fresh:
+        files = build_store(shp, id_field, store_dir)
+
+    try:
+        return GeometryStore(files)
+    except FileNotFoundError:
+        # Version removed by a concurrent rebuild since its stamp was read
+        return open_store(shp, id_field, store_dir)
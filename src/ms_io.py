@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# ms_io.py
+# ******************************************************************************
+
+# Purpose:
+# This module gathers the bulk shapefile input/output used by the MERIT-SWORD
+# scripts. Whole layers are read and written as arrays (attributes plus WKB
+# geometries) in one call. Two backends are available: pyogrio (default when
+# installed) and fiona (fallback). The backend can be selected with the
+# MS_IO_BACKEND environment variable or with set_backend().
+
+# Author:
+# Jeffrey Wade, 2024
+
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import os
+import glob
+import shutil
+import itertools
+import importlib.util
+import numpy as np
+import ms_cache
+import ms_shared
+
+# Backends are imported when first selected, as pyogrio and fiona each take a
+# noticeable share of the startup time of short scripts
+HAS_PYOGRIO = importlib.util.find_spec('pyogrio') is not None
+
+
+# ******************************************************************************
+# pyogrio backend
+# ******************************************************************************
+class PyogrioBackend:
+    """Read and write whole layers with single calls to pyogrio."""
+
+    name = 'pyogrio'
+
+    def __init__(self):
+        import pyogrio.raw
+        self._raw = pyogrio.raw
+
+    def read(self, shp, columns=None, read_geometry=True, skip_features=0,
+             max_features=None):
+        meta, _, geometry, field_data = self._raw.read(
+            shp, columns=columns, read_geometry=read_geometry,
+            skip_features=skip_features, max_features=max_features)
+        fields = {name: field_data[i] for i, name in
+                  enumerate(meta['fields'])}
+        meta = {'crs': meta['crs'], 'encoding': meta['encoding'],
+                'geometry_type': meta['geometry_type'],
+                'fields': meta['fields']}
+        return meta, fields, geometry
+
+    def write(self, shp, meta, fields, geometry):
+        names = list(fields)
+        self._raw.write(shp, geometry, [fields[x] for x in names], names,
+                        driver='ESRI Shapefile',
+                        geometry_type=meta['geometry_type'],
+                        crs=meta['crs'], encoding=meta['encoding'])
+
+
+# ******************************************************************************
+# fiona backend
+# ******************************************************************************
+class FionaBackend:
+    """Read and write layers feature by feature with fiona."""
+
+    name = 'fiona'
+
+    # fiona field types of NumPy dtype kinds
+    _types = {'i': 'int', 'u': 'int', 'f': 'float', 'b': 'bool', 'O': 'str',
+              'U': 'str'}
+
+    def __init__(self):
+        import fiona
+        import shapely.geometry
+        import shapely.wkb
+        self._fiona = fiona
+        self._shapely = shapely
+
+    def read(self, shp, columns=None, read_geometry=True, skip_features=0,
+             max_features=None):
+        fiona, shapely = self._fiona, self._shapely
+
+        with fiona.open(shp, 'r') as src:
+
+            names = list(src.schema['properties']) if columns is None else \
+                list(columns)
+            values = {name: [] for name in names}
+            geometry = []
+
+            stop = None if max_features is None else \
+                skip_features + max_features
+            for fea in itertools.islice(src, skip_features, stop):
+                for name in names:
+                    values[name].append(fea['properties'][name])
+                if read_geometry and fea['geometry'] is not None:
+                    geometry.append(
+                        shapely.geometry.shape(fea['geometry']).wkb)
+                elif read_geometry:
+                    geometry.append(None)
+
+            # Keep fiona schema so that field widths survive a round trip
+            schema = {'geometry': src.schema['geometry'],
+                      'properties': {name: src.schema['properties'][name]
+                                     for name in names}}
+            meta = {'crs': src.crs.to_string(), 'encoding': src.encoding,
+                    'geometry_type': src.schema['geometry'],
+                    'fields': np.array(names, dtype=object),
+                    'schema': schema}
+
+        fields = {name: np.array(values[name]) for name in names}
+        geometry = np.array(geometry, dtype=object) if read_geometry else None
+
+        return meta, fields, geometry
+
+    def write(self, shp, meta, fields, geometry):
+        fiona, shapely = self._fiona, self._shapely
+        names = list(fields)
+
+        # Use schema of source layer when available, else derive from dtypes
+        props = dict(meta.get('schema', {}).get('properties', {}))
+        for name in names:
+            if name not in props:
+                props[name] = self._types.get(fields[name].dtype.kind, 'str')
+        schema = {'geometry': meta['geometry_type'],
+                  'properties': {name: props[name] for name in names}}
+
+        # Convert NaN values to None once per float column
+        values = {}
+        for name in names:
+            col = fields[name]
+            if col.dtype.kind == 'f':
+                values[name] = [None if np.isnan(x) else float(x) for x in
+                                col]
+            else:
+                values[name] = col.tolist()
+
+        with fiona.open(shp, 'w', driver='ESRI Shapefile', crs=meta['crs'],
+                        schema=schema) as out:
+            out.writerecords(
+                fiona.Feature(
+                    geometry=None if geometry[i] is None else
+                    fiona.Geometry.from_dict(shapely.geometry.mapping(
+                        shapely.wkb.loads(geometry[i]))),
+                    properties={name: values[name][i] for name in names})
+                for i in range(len(geometry)))
+
+
+# ******************************************************************************
+# Backend selection
+# ******************************************************************************
+BACKENDS = {'fiona': FionaBackend}
+if HAS_PYOGRIO:
+    BACKENDS['pyogrio'] = PyogrioBackend
+
+_backend = None
+
+
+def set_backend(name):
+    """Select the backend ('pyogrio' or 'fiona') used by this module."""
+
+    global _backend
+    if name not in BACKENDS:
+        raise ValueError('Unavailable I/O backend: ' + name)
+    _backend = BACKENDS[name]()
+
+
+def get_backend():
+    """Return the backend used by this module, selecting it if needed."""
+
+    if _backend is None:
+        set_backend(os.environ.get('MS_IO_BACKEND', 'pyogrio' if 'pyogrio'
+                                   in BACKENDS else 'fiona'))
+    return _backend
+
+
+# ******************************************************************************
+# Read a whole layer
+# ******************************************************************************
+def read_layer(shp, columns=None, read_geometry=True, use_cache=True):
+    """Return (meta, fields, geometry) for shp.
+
+    meta holds the crs, encoding, geometry_type and field names of the layer,
+    fields is a dict of NumPy arrays in feature order, and geometry is an
+    object array of WKB geometries (None if read_geometry is False). Layers
+    published in shared memory with ms_shared.py are read from their segment,
+    as read-only views (geometry as a WkbArray of ms_geom_store.py), and
+    layers cached with ms_cache.py from the cache when it is up to date.
+    """
+
+    if use_cache:
+        shared = ms_shared.read_shared(shp, columns, read_geometry)
+        if shared is not None:
+            return shared
+        cached = ms_cache.read_cached(shp, columns, read_geometry)
+        if cached is not None:
+            return cached
+
+    return get_backend().read(shp, columns, read_geometry)
+
+
+# ******************************************************************************
+# Read a layer in chunks of features
+# ******************************************************************************
+def read_chunks(shp, columns=None, read_geometry=True, chunk=100000):
+    """Yield (fields, geometry) for successive chunks of at most chunk
+    features of shp, so that large layers are not held in memory at once."""
+
+    skip = 0
+    while True:
+        _, fields, geometry = get_backend().read(shp, columns, read_geometry,
+                                                 skip, chunk)
+        n = len(geometry) if read_geometry else \
+            len(next(iter(fields.values()), []))
+        if n == 0 and skip > 0:
+            return
+        yield fields, geometry
+        if n < chunk:
+            return
+        skip += chunk
+
+
+# ******************************************************************************
+# Read attribute columns of a layer
+# ******************************************************************************
+def read_fields(shp, columns):
+    """Return a dict of NumPy arrays for the given attribute columns of shp,
+    in feature order."""
+
+    return read_layer(shp, columns=columns, read_geometry=False)[1]
+
+
+# ******************************************************************************
+# Write a whole layer
+# ******************************************************************************
+def write_layer(shp, meta, fields, geometry):
+    """Write a layer given as returned by read_layer to shp."""
+
+    get_backend().write(shp, meta, fields, geometry)
+
+
+# ******************************************************************************
+# Select features from one or more layers
+# ******************************************************************************
+def concat_layers(layers):
+    """Concatenate (meta, fields, geometry) layers sharing the same fields,
+    keeping the metadata of the first layer."""
+
+    meta = layers[0][0]
+    fields = {name: np.concatenate([lay[1][name] for lay in layers]) for
+              name in layers[0][1]}
+    geometry = np.concatenate([lay[2] for lay in layers])
+
+    return meta, fields, geometry
+
+
+def subset_layer(layer, keep):
+    """Return the features of a (meta, fields, geometry) layer selected by
+    the boolean array keep."""
+
+    meta, fields, geometry = layer
+
+    return meta, {name: col[keep] for name, col in fields.items()}, \
+        geometry[keep]
+
+
+# ******************************************************************************
+# Copy an unchanged layer
+# ******************************************************************************
+# ioctl request cloning the blocks of a file into another one (Linux FICLONE)
+FICLONE = 0x40049409
+
+
+def copy_file(src, dst):
+    """Copy the file src to dst, as a reflink (copy-on-write clone sharing the
+    blocks of src) on file systems supporting them, or in full otherwise."""
+
+    with open(src, 'rb') as file_src, open(dst, 'wb') as file_dst:
+        try:
+            import fcntl
+            fcntl.ioctl(file_dst.fileno(), FICLONE, file_src.fileno())
+            return
+        except (ImportError, OSError):
+            pass
+    shutil.copyfile(src, dst)
+
+
+def copy_layer(src_shp, out_shp):
+    """Copy all files of src_shp (.shp, .dbf, .shx, .prj, ...) to the name of
+    out_shp. Files are copied rather than linked, so that the output never
+    shares its inode with the input, and writing either one in place leaves
+    the other unchanged."""
+
+    src_stem = os.path.splitext(src_shp)[0]
+    out_stem = os.path.splitext(out_shp)[0]
+    for src in glob.glob(glob.escape(src_stem) + '.*'):
+        dst = out_stem + src[len(src_stem):]
+        if os.path.lexists(dst):
+            os.remove(dst)
+        copy_file(src, dst)
+
+
+# ******************************************************************************
+# Copy a layer, appending new attribute columns
+# ******************************************************************************
+def append_fields(src_shp, out_shp, fields):
+    """Copy src_shp to out_shp with extra float columns appended.
+
+    fields maps each new column name to an array aligned with the feature
+    order of src_shp. NaN values are written as Null.
+    """
+
+    meta, field_data, geometry = read_layer(src_shp)
+
+    for name, col in fields.items():
+        field_data[name] = np.asarray(col, dtype='float64')
+        if 'schema' in meta:
+            meta['schema']['properties'][name] = 'float'
+
+    write_layer(out_shp, meta, field_data, geometry)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# ms_lon_norm.py
+# ******************************************************************************
+
+# Purpose:
+# Given a shapefile of any dataset (SWORD, MERIT-Basins, MeanDRS, other river
+# networks), this script identifies features crossing the -180/180 meridian,
+# whose bounding boxes otherwise span the whole globe and inflate the
+# candidate sets of spatial indexes. If any feature crosses, the longitudes of
+# all features on the far side of the meridian are shifted into a single
+# convention ('east' by default, allowing lon>180 as in MERIT-Basins), so that
+# crossing features stay connected to their neighbours. The modified features
+# are recorded in a csv file next to the output shapefile, with their
+# longitude bounds before and after the shift. Layers without crossing
+# features are copied unchanged.
+
+# Author:
+# Jeffrey Wade, 2024
+
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import sys
+import os
+
+
+# ******************************************************************************
+# Declaration of variables (given as command line arguments)
+# ******************************************************************************
+# 1 - in_shp
+# 2 - out_shp
+# 3 - convention (optional, east or west, default east)
+
+
+# ******************************************************************************
+# Normalization parameters
+# ******************************************************************************
+# Columns identifying features, in order of preference
+ID_COLS = ['COMID', 'reach_id']
+
+
+# ******************************************************************************
+# Get command line arguments
+# ******************************************************************************
+IS_arg = len(sys.argv)
+if IS_arg not in (3, 4):
+    print('ERROR - 2 or 3 arguments must be used')
+    raise SystemExit(22)
+
+in_shp = sys.argv[1]
+out_shp = sys.argv[2]
+convention = sys.argv[3] if IS_arg == 4 else 'east'
+
+if convention not in ('east', 'west'):
+    print('ERROR - Longitude convention must be east or west')
+    raise SystemExit(22)
+
+
+# ******************************************************************************
+# Check if files exist
+# ******************************************************************************
+try:
+    with open(in_shp) as file:
+        pass
+except IOError:
+    print('ERROR - Unable to open '+in_shp)
+    raise SystemExit(22)
+
+# Record of modified features
+out_csv = os.path.splitext(out_shp)[0] + '_antimeridian.csv'
+
+
+# ******************************************************************************
+# Import processing modules
+# ******************************************************************************
+import ms_timing
+ms_timing.phase('import')
+import numpy as np
+import pandas as pd
+import shapely
+import ms_io
+from merit_sword import spans_antimeridian, normalize_longitudes
+
+
+# ******************************************************************************
+# Read files
+# ******************************************************************************
+print('- Reading files')
+ms_timing.phase('read')
+meta, fields, geometry = ms_io.read_layer(in_shp)
+geoms = shapely.from_wkb(geometry)
+ms_timing.count('features', len(geoms))
+
+
+# ******************************************************************************
+# Normalize longitudes of features crossing the antimeridian
+# ******************************************************************************
+print('- Normalizing longitudes')
+ms_timing.phase('filter')
+cross = spans_antimeridian(geoms)
+geoms_new, modified = normalize_longitudes(geoms, convention)
+ms_timing.count('modified', modified.sum())
+print('  - '+str(cross.sum())+' features crossing the antimeridian, ' +
+      str(modified.sum())+' of '+str(len(geoms))+' features modified')
+
+# Record IDs and longitude bounds of modified features
+id_col = next((x for x in ID_COLS if x in fields), None)
+ids = fields[id_col] if id_col is not None else np.arange(len(geoms))
+bnd_in = shapely.bounds(geoms[modified])
+bnd_out = shapely.bounds(geoms_new[modified])
+rec_df = pd.DataFrame({id_col or 'fid': ids[modified],
+                       'minx_in': bnd_in[:, 0], 'maxx_in': bnd_in[:, 2],
+                       'minx_out': bnd_out[:, 0], 'maxx_out': bnd_out[:, 2]})
+
+
+# ******************************************************************************
+# Write to file
+# ******************************************************************************
+ms_timing.phase('write')
+if modified.any():
+    geometry = np.asarray(geometry, dtype=object)
+    geometry[modified] = shapely.to_wkb(geoms_new[modified])
+    ms_io.write_layer(out_shp, meta, fields, geometry)
+else:
+    ms_io.copy_layer(in_shp, out_shp)
+
+rec_df.to_csv(out_csv, index=False)
@@ -0,0 +1,705 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# ms_pipeline.py
+# ******************************************************************************
+
+# Purpose:
+# Given the input folder of MERIT-SWORD, an output folder and the file of
+# manual reach deletions, this script runs the processing steps of
+# MERIT-SWORD as a graph of script runs per region. The content hashes of the
+# inputs, the scripts and the arguments of each run are recorded with its
+# outputs, and only the runs whose record no longer matches are re-executed.
+# Runs are started as soon as the runs producing their inputs are done, with
+# the number of simultaneous runs and their total estimated memory limited by
+# the MS_WORKERS (default: number of CPUs) and MS_MEM_MB environment variables.
+# When the MS_SHARED environment variable is set, the input layers read by
+# several region runs (e.g. MB catchments of overlapping regions) are
+# published once in shared memory with ms_shared.py before the region runs,
+# which then map them instead of reading the shapefiles.
+# The input and output folders are cataloged with ms_catalog.py before the
+# runs and between the global and region runs, and the catalog is given to
+# the scripts in the MS_CATALOG environment variable, so that they resolve the
+# files of related regions without scanning their folders.
+
+# Author:
+# Jeffrey Wade, 2024
+
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import sys
+import os
+import csv
+import glob
+import collections
+import json
+import time
+import hashlib
+import tempfile
+import subprocess
+import ms_catalog
+
+
+# ******************************************************************************
+# Declaration of variables (given as command line arguments)
+# ******************************************************************************
+# 1 - in_dir
+# 2 - out_dir
+# 3 - edits_csv
+# 4 - pfaf_list (optional, comma-separated)
+
+
+# ******************************************************************************
+# Regions
+# ******************************************************************************
+# Continent prefix of SWORD files and pfaf number of each region
+REGIONS = [('af', x) for x in ['11', '12', '13', '14', '15', '16', '17',
+                               '18']] + \
+          [('eu', x) for x in ['21', '22', '23', '24', '25', '26', '27', '28',
+                               '29']] + \
+          [('as', x) for x in ['31', '32', '33', '34', '35', '36', '41', '42',
+                               '43', '44', '45', '46', '47', '48', '49']] + \
+          [('oc', x) for x in ['51', '52', '53', '54', '55', '56', '57']] + \
+          [('sa', x) for x in ['61', '62', '63', '64', '65', '66', '67']] + \
+          [('na', x) for x in ['71', '72', '73', '74', '75', '76', '77', '78',
+                               '81', '82', '83', '84', '85', '86', '91']]
+
+# Modules imported by the scripts, whose changes invalidate every run
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+LIB_FILES = ['ms_io.py', 'ms_cache.py', 'ms_geom_store.py', 'ms_shared.py',
+             'ms_catalog.py', 'ms_timing.py', 'ms_translation.py',
+             'merit_sword/*.py']
+
+# Wall time (s) and peak memory (MB) per MB of input files, used for runs that
+# were never measured
+SEC_PER_MB = 0.5
+MEM_PER_MB = 4
+
+
+# ******************************************************************************
+# File layout
+# ******************************************************************************
+class Layout:
+    """Paths of the inputs and outputs of MERIT-SWORD, following
+    tst_pub_repr_all_Wade_etal_202x.sh."""
+
+    mb = 'MERIT_Hydro_v07_Basins_v01'
+
+    def __init__(self, in_dir, out_dir, edits_csv):
+        self.in_dir = os.path.abspath(in_dir)
+        self.out_dir = os.path.abspath(out_dir)
+        self.edits_csv = os.path.abspath(edits_csv)
+
+    def _in(self, *path):
+        return os.path.join(self.in_dir, *path)
+
+    def _out(self, *path):
+        return os.path.join(self.out_dir, *path)
+
+    # Inputs
+    def sword_in(self, reg, pfaf):
+        return self._in('SWORD', reg+'_sword_reaches_hb'+pfaf+'_v16.shp')
+
+    def riv_mb(self, pfaf):
+        return self._in('MB', 'riv', 'riv_pfaf_'+pfaf+'_'+self.mb+'.shp')
+
+    def cat_mb(self, pfaf):
+        return self._in('MB', 'cat', 'cat_pfaf_'+pfaf+'_'+self.mb+'.shp')
+
+    def cat_disso(self, pfaf):
+        return self._in('MeanDRS', 'cat_disso',
+                        'cat_pfaf_'+pfaf+'_'+self.mb+'_disso.shp')
+
+    def meandrs(self, pfaf):
+        return self._in('MeanDRS', 'riv_COR',
+                        'riv_pfaf_'+pfaf+'_'+self.mb+'_GLDAS_COR.shp')
+
+    # Outputs
+    def sword_edit(self, reg, pfaf):
+        return self._out('sword_edit', reg+'_sword_reaches_hb'+pfaf+'_v16.shp')
+
+    def overlap(self):
+        return [self._out('ms_region_overlap', 'sword_to_mb_reg_overlap.csv'),
+                self._out('ms_region_overlap', 'mb_to_sword_reg_overlap.csv')]
+
+    def trace(self, pfaf):
+        return self._out('ms_riv_trace', 'meritsword_pfaf_'+pfaf+'_trace.shp')
+
+    def seeds(self, pfaf):
+        return self._out('ms_riv_trace',
+                         'meritsword_pfaf_'+pfaf+'_trace_seeds.csv')
+
+    def network(self, pfaf):
+        return self._out('ms_riv_network',
+                         'meritsword_pfaf_'+pfaf+'_network.shp')
+
+    def trans_cat(self, pfaf):
+        return [self._out('ms_translate_cat', x, x+'_pfaf_'+pfaf +
+                          '_translate_cat.shp') for x in ['mb_to_sword',
+                                                          'sword_to_mb']]
+
+    def trans(self, pfaf):
+        return [self._out('ms_translate', x, x+'_pfaf_'+pfaf+'_translate.nc')
+                for x in ['mb_to_sword', 'sword_to_mb']]
+
+    def diag(self, pfaf):
+        return [self._out('ms_diagnostic', x, x+'_pfaf_'+pfaf +
+                          '_diagnostic.nc') for x in ['mb_to_sword',
+                                                      'sword_to_mb']]
+
+    def transposed(self, pfaf):
+        return [self._out('ms_transpose', 'mb_transposed',
+                          'mb_to_sword_pfaf_'+pfaf+'_transpose.nc'),
+                self._out('ms_transpose', 'sword_transposed',
+                          'sword_to_mb_pfaf_'+pfaf+'_transpose.nc')]
+
+    def app_meandrs(self, reg, pfaf):
+        return self._out('app_meandrs_to_sword', reg+'_sword_reaches_hb' +
+                         pfaf+'_v16_meandrs.shp')
+
+    def app_sword(self, pfaf):
+        return self._out('app_sword_to_mb', 'riv_pfaf_'+pfaf+'_'+self.mb +
+                         '_sword.shp')
+
+    def state(self):
+        return self._out('ms_pipeline.json')
+
+    def catalog(self):
+        return self._out('ms_catalog.json')
+
+
+# ******************************************************************************
+# Nodes of the processing graph
+# ******************************************************************************
+class Node:
+    """A run of script with args, reading inputs and writing outputs. Files
+    in after must exist before the run but are not recorded: scripts resolving
+    the files of all regions of a step need the full set of files, but only
+    read those of related regions."""
+
+    def __init__(self, name, script, args, inputs, outputs, pfaf=None,
+                 after=()):
+        self.name = name
+        self.script = script
+        self.args = args
+        self.inputs = sorted(set(inputs))
+        self.outputs = outputs
+        self.pfaf = pfaf
+        self.after = sorted(set(after) - set(inputs))
+
+    def command(self):
+        return [sys.executable, os.path.join(SRC_DIR, self.script)] + \
+            self.args
+
+
+class Pipeline:
+    """Nodes in insertion order, with dependencies given by the nodes
+    producing their inputs."""
+
+    def __init__(self, nodes=()):
+        self.nodes = {}
+        self.producer = {}
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        self.nodes[node.name] = node
+        for out in node.outputs:
+            self.producer[out] = node.name
+
+    def deps(self, name):
+        """Return the names of the nodes producing the inputs of name."""
+
+        node = self.nodes[name]
+        return sorted({self.producer[x] for x in node.inputs + node.after if
+                       x in self.producer})
+
+    def order(self):
+        """Return the node names in topological order."""
+
+        done = set()
+        order = []
+
+        def visit(name, path):
+            if name in done:
+                return
+            if name in path:
+                raise ValueError('Cycle in pipeline at ' + name)
+            for dep in self.deps(name):
+                visit(dep, path | {name})
+            done.add(name)
+            order.append(name)
+
+        for name in self.nodes:
+            visit(name, set())
+
+        return order
+
+
+def global_nodes(lay, regions):
+    """Return the nodes preceding the region overlap files: SWORD edits of
+    each region, and the region overlap."""
+
+    nodes = []
+    for reg, pfaf in regions:
+
+        # Pfaf 54 has no SWORD reaches, its empty file is based on pfaf 53
+        sword_in = lay.sword_in(reg, pfaf)
+        src = lay.sword_in(reg, '53') if pfaf == '54' else sword_in
+
+        nodes.append(Node('sword_edit_'+pfaf, 'ms_sword_edit.py',
+                          [sword_in, lay.sword_edit(reg, pfaf)], [src],
+                          [lay.sword_edit(reg, pfaf)], pfaf))
+
+    nodes.append(Node('region_overlap', 'ms_region_overlap.py',
+                      [os.path.dirname(lay.sword_edit('af', '11')) + '/',
+                       os.path.dirname(lay.cat_disso('11')) + '/'] +
+                      lay.overlap(),
+                      [lay.sword_edit(reg, pfaf) for reg, pfaf in regions] +
+                      [lay.cat_disso(pfaf) for _, pfaf in regions],
+                      lay.overlap()))
+
+    return nodes
+
+
+def read_overlap(overlap_csv):
+    """Return a dictionary relating each region of the first column of an
+    overlap file to the regions overlapping it."""
+
+    over = {}
+    with open(overlap_csv, newline='') as file:
+        rows = csv.reader(file)
+        next(rows)
+        for row in rows:
+            over[row[0]] = [str(int(float(x))) for x in row[1:] if x != '']
+
+    return over
+
+
+def region_nodes(lay, regions, sw_to_mb, mb_to_sw):
+    """Return the nodes of each region following the region overlap, given
+    the MB regions overlapping each SWORD region (sw_to_mb) and the SWORD
+    regions overlapping each MB region (mb_to_sw)."""
+
+    cont = dict((pfaf, reg) for reg, pfaf in regions)
+    first = min(cont)
+    over = lay.overlap()
+    net_all = [lay.network(x) for x in cont]
+    trans_all = [x for y in cont for x in lay.trans(y)]
+    nodes = []
+
+    for reg, pfaf in regions:
+
+        mb_reg = sw_to_mb.get(pfaf, [])
+        sw_reg = mb_to_sw.get(pfaf, [])
+        near = sorted(set(mb_reg) | set(sw_reg) | {pfaf})
+        sword = lay.sword_edit(reg, pfaf)
+
+        nodes.append(Node(
+            'riv_trace_'+pfaf, 'ms_riv_trace.py',
+            [lay.riv_mb(pfaf), lay.cat_mb(pfaf), sword] + over +
+            [lay.trace(pfaf)],
+            [lay.riv_mb(x) for x in mb_reg] + [lay.cat_mb(x) for x in mb_reg] +
+            [lay.riv_mb(pfaf), sword] + over,
+            [lay.trace(pfaf), lay.seeds(pfaf)], pfaf))
+
+        nodes.append(Node(
+            'rch_delete_'+pfaf, 'ms_rch_delete.py',
+            [lay.trace(pfaf), lay.edits_csv, lay.network(pfaf)],
+            [lay.trace(pfaf), lay.edits_csv],
+            [lay.network(pfaf)], pfaf))
+
+        nodes.append(Node(
+            'translate_'+pfaf, 'ms_translate.py',
+            [lay.network(pfaf), lay.riv_mb(pfaf), lay.cat_mb(pfaf), sword] +
+            over + lay.trans_cat(pfaf) + lay.trans(pfaf),
+            [lay.network(x) for x in near] +
+            [lay.sword_edit(cont[x], x) for x in near] +
+            [lay.cat_mb(x) for x in set(mb_reg) | {pfaf, first}] +
+            [lay.riv_mb(pfaf)] + over,
+            lay.trans_cat(pfaf) + lay.trans(pfaf), pfaf, net_all))
+
+        nodes.append(Node(
+            'diagnostic_'+pfaf, 'ms_diagnostic.py',
+            lay.trans(pfaf) + [lay.network(pfaf)] + lay.trans_cat(pfaf) +
+            [lay.cat_disso(pfaf), sword] + over + lay.diag(pfaf),
+            lay.trans(pfaf) + [lay.network(pfaf)] + lay.trans_cat(pfaf) +
+            [lay.cat_disso(x) for x in near] +
+            [lay.sword_edit(cont[x], x) for x in near],
+            lay.diag(pfaf), pfaf, trans_all))
+
+        nodes.append(Node(
+            'transpose_'+pfaf, 'ms_transpose.py',
+            lay.trans(pfaf) + [lay.network(pfaf), lay.riv_mb(pfaf), sword] +
+            lay.transposed(pfaf),
+            [x for y in near for x in lay.trans(y)] +
+            [lay.network(pfaf), lay.riv_mb(pfaf), sword],
+            lay.transposed(pfaf), pfaf, trans_all))
+
+        nodes.append(Node(
+            'app_meandrs_to_sword_'+pfaf, 'ms_app_meandrs_to_sword.py',
+            lay.trans(pfaf) + [lay.meandrs(pfaf), sword,
+                               lay.app_meandrs(reg, pfaf)],
+            lay.trans(pfaf) + [lay.meandrs(x) for x in mb_reg] + [sword],
+            [lay.app_meandrs(reg, pfaf)], pfaf, trans_all))
+
+        nodes.append(Node(
+            'app_sword_to_mb_'+pfaf, 'ms_app_sword_to_mb.py',
+            [lay.trans(pfaf)[0], lay.riv_mb(pfaf), sword, lay.app_sword(pfaf)],
+            [lay.trans(pfaf)[0], lay.riv_mb(pfaf)] +
+            [lay.sword_edit(cont[x], x) for x in sw_reg],
+            [lay.app_sword(pfaf)], pfaf, trans_all))
+
+    return nodes
+
+
+# ******************************************************************************
+# Recorded state of runs
+# ******************************************************************************
+def layer_files(path):
+    """Return the files holding path: all sidecar files of a shapefile, or the
+    file itself."""
+
+    if path.endswith('.shp'):
+        return sorted(glob.glob(glob.escape(path[:-4]) + '.*'))
+    return [path] if os.path.isfile(path) else []
+
+
+class State:
+    """Content hashes of files, records of completed runs and their measured
+    wall time and peak memory (stats), kept in a JSON file. File hashes are
+    reused while size and modification time of the file are unchanged."""
+
+    def __init__(self, state_json):
+        self.state_json = state_json
+        self.hashes = {}
+        self.runs = {}
+        self.stats = {}
+        if os.path.isfile(state_json):
+            with open(state_json) as file:
+                state = json.load(file)
+            self.hashes = state['hashes']
+            self.runs = state['runs']
+            self.stats = state.get('stats', {})
+        self._code = {}
+
+    def save(self):
+        tmp = self.state_json + '.tmp'
+        with open(tmp, 'w') as file:
+            json.dump({'hashes': self.hashes, 'runs': self.runs,
+                       'stats': self.stats}, file, indent=1, sort_keys=True)
+        os.replace(tmp, self.state_json)
+
+    def file_hash(self, path):
+        """Return the SHA-256 of the content of path, or None if missing."""
+
+        files = layer_files(path)
+        if len(files) == 0:
+            return None
+
+        sha = hashlib.sha256()
+        for f in files:
+            stat = os.stat(f)
+            key = [stat.st_size, stat.st_mtime_ns]
+            if f not in self.hashes or self.hashes[f][0] != key:
+                sha_f = hashlib.sha256()
+                with open(f, 'rb') as file:
+                    for chunk in iter(lambda: file.read(1 << 20), b''):
+                        sha_f.update(chunk)
+                self.hashes[f] = [key, sha_f.hexdigest()]
+            sha.update(os.path.splitext(f)[1].encode())
+            sha.update(self.hashes[f][1].encode())
+
+        return sha.hexdigest()
+
+    def params(self, node):
+        """Return the hash of the script, library modules and arguments of
+        node."""
+
+        if node.script not in self._code:
+            sha = hashlib.sha256()
+            for pattern in [node.script] + LIB_FILES:
+                for f in sorted(glob.glob(os.path.join(SRC_DIR, pattern))):
+                    with open(f, 'rb') as file:
+                        sha.update(file.read())
+            self._code[node.script] = sha.hexdigest()
+
+        return hashlib.sha256(json.dumps([self._code[node.script],
+                                          node.args]).encode()).hexdigest()
+
+    def record(self, node):
+        """Return the record of node given current files."""
+
+        return {'params': self.params(node),
+                'inputs': {x: self.file_hash(x) for x in node.inputs},
+                'outputs': {x: self.file_hash(x) for x in node.outputs}}
+
+    def is_stale(self, node):
+        """Return True if node has no record matching current files."""
+
+        rec = self.record(node)
+        return None in rec['outputs'].values() or \
+            self.runs.get(node.name) != rec
+
+    def done(self, node):
+        self.runs[node.name] = self.record(node)
+
+
+# ******************************************************************************
+# Run nodes
+# ******************************************************************************
+def remove_outputs(node):
+    """Remove the outputs of node, so that no previous output is taken for a
+    new one."""
+
+    for out in node.outputs:
+        for f in layer_files(out):
+            os.remove(f)
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+
+
+def input_mb(node):
+    """Return the size (MB) of the files read by node."""
+
+    size = 0
+    for x in node.inputs:
+        size += sum(os.path.getsize(f) for f in layer_files(x))
+
+    return size / 2**20
+
+
+def estimate(node, state):
+    """Return the estimated wall time (s) and peak memory (MB) of node: those
+    of its previous run if any, otherwise values scaled from the size of its
+    inputs, which is only known once upstream nodes have run."""
+
+    if node.name in state.stats:
+        return state.stats[node.name]['wall_s'], \
+            state.stats[node.name]['maxrss_mb']
+
+    size = input_mb(node)
+
+    return 1 + SEC_PER_MB * size, 100 + MEM_PER_MB * size
+
+
+def priorities(pipe, state):
+    """Return the estimated time (s) from the start of each node to the end
+    of the pipeline along its longest chain of downstream nodes."""
+
+    down = {x: [] for x in pipe.nodes}
+    for name in pipe.nodes:
+        for dep in pipe.deps(name):
+            down[dep].append(name)
+
+    prio = {}
+    for name in reversed(pipe.order()):
+        prio[name] = estimate(pipe.nodes[name], state)[0] + \
+            max([prio[x] for x in down[name]], default=0)
+
+    return prio
+
+
+def run_pipeline(pipe, state, workers=1, mem_mb=None):
+    """Run the stale nodes of pipe, recording each completed run.
+
+    A node is started as soon as the nodes producing its inputs are done,
+    with up to workers processes at once and, if mem_mb is given, as long as
+    the estimated peak memory of running nodes stays within mem_mb MB. Ready
+    nodes with the longest estimated chain of downstream nodes are started
+    first. Returns the names of the nodes run.
+    """
+
+    prio = priorities(pipe, state)
+    deps = {x: set(pipe.deps(x)) for x in pipe.nodes}
+    done = set()
+    ran = []
+    running = {}
+    failed = None
+
+    while len(done) < len(pipe.nodes):
+
+        # ----------------------------------------------------------------------
+        # Start ready nodes by decreasing priority
+        # ----------------------------------------------------------------------
+        ready = sorted([x for x in pipe.nodes if x not in done and
+                        x not in running.values() and deps[x] <= done],
+                       key=lambda x: -prio[x])
+
+        started = False
+        for name in ready if failed is None else []:
+            node = pipe.nodes[name]
+            if not state.is_stale(node):
+                done.add(name)
+                started = True
+                continue
+
+            if len(running) >= workers:
+                break
+
+            mem = estimate(node, state)[1]
+            used = sum(x[1] for x in running)
+            if mem_mb is not None and len(running) > 0 and \
+               used + mem > mem_mb:
+                continue
+
+            print('  - ' + name)
+            remove_outputs(node)
+            out = tempfile.TemporaryFile()
+            proc = subprocess.Popen(node.command(), stdout=out,
+                                    stderr=subprocess.STDOUT)
+            running[(proc, mem, out, time.perf_counter())] = name
+            started = True
+
+        # Nodes found up to date may have made other nodes ready
+        if started and len(running) < workers:
+            continue
+
+        if len(running) == 0:
+            break
+
+        # ----------------------------------------------------------------------
+        # Wait for a node to finish and record its run
+        # ----------------------------------------------------------------------
+        pid, status, usage = os.wait4(-1, 0)
+        key = [x for x in running if x[0].pid == pid][0]
+        name = running.pop(key)
+        proc, _, out, start = key
+        proc.returncode = os.waitstatus_to_exitcode(status)
+
+        if proc.returncode != 0:
+            out.seek(0)
+            print(out.read().decode())
+            print('ERROR - Failed run: ' + name)
+            failed = failed if failed is not None else proc.returncode
+            out.close()
+            continue
+
+        out.close()
+        state.stats[name] = {'wall_s': round(time.perf_counter() - start, 3),
+                             'maxrss_mb': round(usage.ru_maxrss / 1024, 1)}
+        state.done(pipe.nodes[name])
+        state.save()
+        done.add(name)
+        ran.append(name)
+
+    if failed is not None:
+        raise SystemExit(failed)
+
+    return ran
+
+
+def shared_inputs(pipe, state):
+    """Return the layers to publish in shared memory before running pipe: the
+    inputs read by several of the nodes to run (stale nodes and the nodes
+    depending on them) that are not produced by the pipeline."""
+
+    run = set()
+    for name in pipe.order():
+        if set(pipe.deps(name)) & run or state.is_stale(pipe.nodes[name]):
+            run.add(name)
+
+    count = collections.Counter(x for name in run for x in
+                                pipe.nodes[name].inputs if
+                                x.endswith('.shp') and
+                                x not in pipe.producer)
+
+    return sorted(x for x in count if count[x] > 1 and os.path.isfile(x))
+
+
+def update_catalog(lay):
+    """Catalog the input and output folders of lay, in the index file given
+    to the scripts in MS_CATALOG."""
+
+    ms_catalog.build([lay.in_dir, lay.out_dir], lay.catalog())
+    os.environ['MS_CATALOG'] = lay.catalog()
+
+
+def run_all(lay, regions, state, workers=1, mem_mb=None, shared=False):
+    """Run the global nodes, then the region nodes built from the region
+    overlap files, with the layers read by several region nodes published in
+    shared memory if shared is True. The catalog of files is updated before
+    each stage and after the runs. Returns the names of the nodes run."""
+
+    update_catalog(lay)
+    ran = run_pipeline(Pipeline(global_nodes(lay, regions)), state, workers,
+                       mem_mb)
+    update_catalog(lay)
+    sw_to_mb = read_overlap(lay.overlap()[0])
+    mb_to_sw = read_overlap(lay.overlap()[1])
+    pipe = Pipeline(region_nodes(lay, regions, sw_to_mb, mb_to_sw))
+
+    if shared:
+        # Imported here, as the pipeline itself only needs the standard
+        # library
+        import ms_shared
+
+    shms = []
+    try:
+        if shared:
+            pub = shared_inputs(pipe, state)
+            print('- Publishing '+str(len(pub))+' layers in shared memory')
+            for shp in pub:
+                shms.append(ms_shared.publish(shp))
+        ran += run_pipeline(pipe, state, workers, mem_mb)
+    finally:
+        if shared:
+            ms_shared.release(shms)
+
+    update_catalog(lay)
+
+    return ran
+
+
+# ******************************************************************************
+# Command line interface
+# ******************************************************************************
+if __name__ == '__main__':
+
+    # --------------------------------------------------------------------------
+    # Get command line arguments
+    # --------------------------------------------------------------------------
+    IS_arg = len(sys.argv)
+    if IS_arg not in (4, 5):
+        print('ERROR - 3 or 4 arguments must be used')
+        raise SystemExit(22)
+
+    in_dir = sys.argv[1]
+    out_dir = sys.argv[2]
+    edits_csv = sys.argv[3]
+    pfaf_list = sys.argv[4].split(',') if IS_arg == 5 else None
+
+    # --------------------------------------------------------------------------
+    # Check if folders and files exist
+    # --------------------------------------------------------------------------
+    if not os.path.isdir(in_dir):
+        print('ERROR - '+in_dir+' invalid folder path')
+        raise SystemExit(22)
+
+    try:
+        with open(edits_csv) as file:
+            pass
+    except IOError:
+        print('ERROR - Unable to open '+edits_csv)
+        raise SystemExit(22)
+
+    regions = REGIONS
+    if pfaf_list is not None:
+        regions = [x for x in REGIONS if x[1] in pfaf_list]
+        if len(regions) != len(pfaf_list):
+            print('ERROR - Unknown pfaf region in '+sys.argv[4])
+            raise SystemExit(22)
+
+    # --------------------------------------------------------------------------
+    # Run stale nodes
+    # --------------------------------------------------------------------------
+    workers = int(os.environ.get('MS_WORKERS', os.cpu_count()))
+    mem_mb = os.environ.get('MS_MEM_MB')
+    mem_mb = float(mem_mb) if mem_mb is not None else None
+    shared = bool(os.environ.get('MS_SHARED'))
+
+    print('- Running pipeline with '+str(workers)+' workers')
+    os.makedirs(out_dir, exist_ok=True)
+    lay = Layout(in_dir, out_dir, edits_csv)
+    ran = run_all(lay, regions, State(lay.state()), workers, mem_mb, shared)
+    print('- '+str(len(ran))+' runs executed')
@@ -7,6 +7,11 @@
 # Given a river shapefile of MERIT-SWORD reaches and a CSV containing reaches
 # identified from manual removal, this script removes selected reaches to
 # generate the final MERIT-SWORD river network.
+# Given folders instead of the input and output shapefiles, all regions of the
+# input folder are processed in one pass: the CSV is read once, and regions
+# are filtered in parallel (up to MS_WORKERS at once, default: number of
+# CPUs). Output files are named after the input files, with _trace replaced
+# by _network.
 
 # Author:
 # Jeffrey Wade, 2024
@@ -15,16 +20,16 @@
 # Import Python modules
 # ******************************************************************************
 import sys
-import pandas as pd
-import fiona
+import os
+import ms_catalog
 
 
 # ******************************************************************************
 # Declaration of variables (given as command line arguments)
 # ******************************************************************************
-# 1 - riv_ms_shp
+# 1 - riv_ms_shp (or folder of shapefiles)
 # 2 - del_csv
-# 3 - riv_ms_out
+# 3 - riv_ms_out (or folder)
 
 
 # ******************************************************************************
@@ -43,12 +48,19 @@ riv_ms_out = sys.argv[3]
 # ******************************************************************************
 # Check if files exist
 # ******************************************************************************
-try:
-    with open(riv_ms_shp) as file:
-        pass
-except IOError:
-    print('ERROR - Unable to open '+riv_ms_shp)
-    raise SystemExit(22)
+is_batch = os.path.isdir(riv_ms_shp)
+
+if is_batch:
+    if not os.path.isdir(riv_ms_out):
+        print('ERROR - '+riv_ms_out+' invalid folder path')
+        raise SystemExit(22)
+else:
+    try:
+        with open(riv_ms_shp) as file:
+            pass
+    except IOError:
+        print('ERROR - Unable to open '+riv_ms_shp)
+        raise SystemExit(22)
 
 try:
     with open(del_csv) as file:
@@ -58,40 +70,96 @@ except IOError:
     raise SystemExit(22)
 
 # Confirm files refer to same region
-riv_ms_reg = riv_ms_shp.split('pfaf_')[1][0:2]
-riv_ms_out_reg = riv_ms_out.split('pfaf_')[1][0:2]
+if not is_batch:
+    riv_ms_reg = ms_catalog.pfaf_of(riv_ms_shp)
+    riv_ms_out_reg = ms_catalog.pfaf_of(riv_ms_out)
+
+    if not (riv_ms_reg == riv_ms_out_reg):
+        print('ERROR - Input files correspond to different regions')
+        raise SystemExit(22)
 
-if not (riv_ms_reg == riv_ms_out_reg):
-    print('ERROR - Input files correspond to different regions')
-    raise SystemExit(22)
+
+# ******************************************************************************
+# Import processing modules
+# ******************************************************************************
+import ms_timing
+ms_timing.phase('import')
+import concurrent.futures
+import pandas as pd
+import numpy as np
+import ms_io
 
 
 # ******************************************************************************
-# Read files
+# Remove reaches of one region
 # ******************************************************************************
-print('- Reading files')
-# Read MERIT-SWORD file
-riv_ms = fiona.open(riv_ms_shp, 'r', crs="EPSG:4326")
+def delete_region(riv_ms_shp, del_rch, riv_ms_out):
+    """Write the reaches of riv_ms_shp absent from the sorted array del_rch
+    to riv_ms_out. Returns the number of reaches read and removed."""
+
+    # Read MERIT-SWORD file
+    ms_timing.phase('read')
+    riv_ms = ms_io.read_layer(riv_ms_shp)
+    ms_timing.count('features', len(riv_ms[1]['COMID']))
+
+    # Identify reaches to keep
+    ms_timing.phase('filter')
+    rch_keep = ~np.isin(riv_ms[1]['COMID'], del_rch)
+    n_drop = int((~rch_keep).sum())
+    ms_timing.count('dropped', n_drop)
+
+    # Write filtered reaches to file
+    ms_timing.phase('write')
+    ms_io.write_layer(riv_ms_out, *ms_io.subset_layer(riv_ms, rch_keep))
 
-# Read csv
-del_df = pd.read_csv(del_csv)
+    return len(rch_keep), n_drop
 
 
 # ******************************************************************************
 # Remove reaches from traced MERIT-SWORD network
 # ******************************************************************************
-print('- Removing reaches')
-# Retrieve schema and crs
-ms_schema = riv_ms.schema.copy()
-ms_crs = riv_ms.crs
-
-# Retrieve reaches to be deleted from given region
-del_rch = del_df.COMID.to_list()
-
-# Write filtered reaches to file
-with fiona.open(riv_ms_out, 'w', schema=ms_schema,
-                driver='ESRI Shapefile',
-                crs=ms_crs) as output:
-    for riv_fea in riv_ms:
-        if riv_fea['properties']['COMID'] not in del_rch:
-            output.write(riv_fea)
+# Worker processes of the batch mode import this script again to run
+# delete_region, without reading files or starting workers themselves
+if __name__ == '__main__':
+
+    # --------------------------------------------------------------------------
+    # Read files
+    # --------------------------------------------------------------------------
+    print('- Reading files')
+    ms_timing.phase('read')
+    # Read csv once
+    # All reaches to be deleted are removed from each region, as traced
+    # networks hold MB reaches of neighbouring regions
+    del_df = pd.read_csv(del_csv)
+    del_rch = np.unique(del_df.COMID.values.astype('int64'))
+
+    # Files of all regions by pfaf region in batch mode, from the catalog of
+    # datasets
+    if is_batch:
+        riv_ms_files = ms_catalog.open_catalog().regions(riv_ms_shp)
+    else:
+        riv_ms_files = {riv_ms_reg: riv_ms_shp}
+
+    riv_ms_regs = list(riv_ms_files)
+    riv_ms_files = list(riv_ms_files.values())
+    out_files = [os.path.join(riv_ms_out, os.path.basename(x).replace(
+        '_trace', '_network')) for x in riv_ms_files] if is_batch else \
+        [riv_ms_out]
+    del_regs = [del_rch] * len(riv_ms_files)
+
+    # --------------------------------------------------------------------------
+    # Remove reaches of each region
+    # --------------------------------------------------------------------------
+    print('- Removing reaches')
+    if is_batch:
+        ms_timing.phase('filter')
+        workers = int(os.environ.get('MS_WORKERS', os.cpu_count()))
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            res = ms_timing.worker_map(pool, delete_region, riv_ms_files,
+                                       del_regs, out_files)
+    else:
+        res = [delete_region(riv_ms_files[0], del_regs[0], out_files[0])]
+
+    for reg, (n, n_drop) in zip(riv_ms_regs, res):
+        print('  - Region '+reg+': '+str(n_drop)+' of '+str(n) +
+              ' reaches removed')
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# ms_shared.py
+# ******************************************************************************
+
+# Purpose:
+# This module publishes whole layers (attribute columns, plus flat WKB
+# geometries with their offsets and bounds) once into shared memory segments,
+# so that the processes of neighbouring regions reading the same layers map a
+# single copy instead of each reading and parsing the shapefiles. Segments are
+# named after the path, size and modification time of their layer, and are
+# attached by ms_io.py and merit_sword.Layer when the MS_SHARED environment
+# variable is set. Columns and geometries are read-only views of the segment:
+# strings are published as fixed-width NumPy strings, and geometries are read
+# as a WkbArray of ms_geom_store.py over the flat WKB and offsets. Only the
+# string columns holding null values are copied by readers, to restore them.
+
+# Author:
+# Jeffrey Wade, 2024
+
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import os
+import json
+import pickle
+import hashlib
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+import ms_cache
+import ms_geom_store
+
+
+# ******************************************************************************
+# Segment parameters
+# ******************************************************************************
+# Alignment (bytes) of the arrays within a segment
+ALIGN = 64
+
+# Segments attached by this process, by name
+_attached = {}
+
+# Names of the segments published by this process
+_published = set()
+
+
+def _align(pos):
+    return -(-pos // ALIGN) * ALIGN
+
+
+def segment_name(shp):
+    """Return the name of the shared memory segment of shp."""
+
+    key = json.dumps([os.path.abspath(shp), ms_cache.source_stamp(shp)])
+    return 'ms_' + hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+
+
+# ******************************************************************************
+# Shared layer
+# ******************************************************************************
+class SharedStore(ms_geom_store.GeometryStore):
+    """Geometries of a layer attached from shared memory, accessible by row
+    or ID as those of a GeometryStore."""
+
+    def __init__(self, shared, id_field=None):
+        geom = shared.geometry
+        ids = np.arange(len(shared), dtype=np.int64) if id_field is None \
+            else np.asarray(shared.fields[id_field], dtype=np.int64)
+        self._views = (geom['wkb'], geom['offsets'], ids, geom['bounds'],
+                       ms_geom_store.sort_ids(ids))
+
+        # Keep segment mapped as long as the store is used
+        self.shared = shared
+
+    def _arrays(self):
+        return self._views
+
+
+class SharedLayer:
+    """Metadata, attribute columns and geometry arrays of a layer attached
+    from a shared memory segment."""
+
+    def __init__(self, shm):
+        self.shm = shm
+
+        # Header holding the location of each array within the segment
+        size = int.from_bytes(bytes(shm.buf[:8]), 'little')
+        head = pickle.loads(bytes(shm.buf[8:8 + size]))
+        base = _align(8 + size)
+
+        def view(dtype, shape, off):
+            arr = np.ndarray(shape, dtype, buffer=shm.buf, offset=base + off)
+            arr.flags.writeable = False
+            return arr
+
+        self.meta = head['meta']
+        self.geometry = {k: view(*v) for k, v in head['geometry'].items()}
+        fields = {k: view(*v) for k, v in head['fields'].items()}
+        for k, null in head['nulls'].items():
+            fields[k] = np.where(view(*null), None, fields[k]).astype(object)
+        self.fields = {k: fields[k] for k in self.meta['fields']}
+        self._stores = {}
+
+    def __len__(self):
+        return len(self.geometry['offsets']) - 1
+
+    def store(self, id_field=None):
+        """Return the SharedStore of the geometries, keyed by id_field, its
+        IDs being sorted once by this process."""
+
+        if id_field not in self._stores:
+            self._stores[id_field] = SharedStore(self, id_field)
+        return self._stores[id_field]
+
+    def read(self, columns=None, read_geometry=True):
+        """Return (meta, fields, geometry) as ms_io.read_layer."""
+
+        names = list(self.meta['fields']) if columns is None else \
+            list(columns)
+        meta = dict(self.meta, fields=np.array(names, dtype=object))
+        if 'schema' in meta:
+            meta['schema'] = {'geometry': meta['schema']['geometry'],
+                              'properties': {x: meta['schema']['properties']
+                                             [x] for x in names}}
+
+        geometry = None
+        if read_geometry:
+            geometry = ms_geom_store.WkbArray(self.geometry['wkb'],
+                                              self.geometry['offsets'])
+
+        return meta, {x: self.fields[x] for x in names}, geometry
+
+
+# ******************************************************************************
+# Publish and attach layers
+# ******************************************************************************
+def publish(shp):
+    """Copy the layer shp into a new shared memory segment and return its
+    SharedMemory object, to be released with release() once processes no
+    longer attach it."""
+
+    # Local import, as ms_io reads shared layers through this module
+    import ms_io
+
+    meta, fields, geometry = ms_io.read_layer(shp)
+    blob, offsets, bounds = ms_geom_store.pack_wkb(geometry)
+
+    # Columns of Python objects (strings) as fixed-width strings, with the
+    # mask of their null values if any
+    arrays = [('geometry', 'wkb', np.frombuffer(blob, dtype=np.uint8)),
+              ('geometry', 'offsets', offsets),
+              ('geometry', 'bounds', bounds)]
+    for name, arr in fields.items():
+        if arr.dtype.kind == 'O':
+            null = np.array([x is None for x in arr], dtype=bool)
+            arr = np.where(null, '', arr).astype(str)
+            if null.any():
+                arrays.append(('nulls', name, null))
+        arrays.append(('fields', name, arr))
+
+    # Place arrays one after the other
+    head = {'meta': meta, 'geometry': {}, 'fields': {}, 'nulls': {}}
+    data = []
+    pos = 0
+    for group, name, arr in arrays:
+        raw = np.ascontiguousarray(arr).tobytes()
+        head[group][name] = (arr.dtype.str, arr.shape, pos)
+        data.append((pos, raw))
+        pos = _align(pos + len(raw))
+
+    header = pickle.dumps(head)
+    base = _align(8 + len(header))
+    size = base + max(pos, 1)
+    try:
+        shm = shared_memory.SharedMemory(name=segment_name(shp), create=True,
+                                         size=size)
+    except FileExistsError:
+        # Segment left by an interrupted run
+        old = shared_memory.SharedMemory(name=segment_name(shp))
+        old.close()
+        old.unlink()
+        shm = shared_memory.SharedMemory(name=segment_name(shp), create=True,
+                                         size=size)
+
+    shm.buf[8:8 + len(header)] = header
+    for off, raw in data:
+        shm.buf[base + off:base + off + len(raw)] = raw
+
+    # Header size written last, marking the segment as complete
+    shm.buf[:8] = len(header).to_bytes(8, 'little')
+    _published.add(shm.name)
+
+    return shm
+
+
+def release(shms):
+    """Close and remove the segments shms returned by publish()."""
+
+    for shm in shms:
+        _attached.pop(shm.name, None)
+        _published.discard(shm.name)
+        shm.close()
+        shm.unlink()
+
+
+def attach(shp):
+    """Return the SharedLayer of shp, or None if MS_SHARED is not set or shp
+    was not published."""
+
+    if not os.environ.get('MS_SHARED'):
+        return None
+
+    name = segment_name(shp)
+    if name not in _attached:
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            return None
+
+        # The publishing process removes the segment, not the resource
+        # tracker of this process when it exits
+        if name not in _published:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+
+        if bytes(shm.buf[:8]) == bytes(8):
+            shm.close()
+            return None
+        _attached[name] = SharedLayer(shm)
+
+    return _attached[name]
+
+
+def read_shared(shp, columns=None, read_geometry=True):
+    """Return (meta, fields, geometry) for shp from shared memory, or None if
+    it was not published."""
+
+    shared = attach(shp)
+    if shared is None:
+        return None
+
+    return shared.read(columns, read_geometry)
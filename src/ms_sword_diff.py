@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# ms_sword_diff.py
+# ******************************************************************************
+
+# Purpose:
+# Given the SWORD river shapefiles of a region in two SWORD versions (e.g. the
+# edited v16 and v17 files of ms_sword_edit.py), this script compares reaches
+# by reach_id and geometry hash, and writes the reach_id of each reach added,
+# removed, with a changed geometry or with changed attributes only to a csv
+# file. The csv files of all regions drive the update modes of
+# ms_riv_trace.py and ms_translate.py, which trace and translate again only
+# the affected reaches.
+
+# Author:
+# Jeffrey Wade, 2024
+
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import sys
+import ms_catalog
+
+
+# ******************************************************************************
+# Declaration of variables (given as command line arguments)
+# ******************************************************************************
+# 1 - sword_old_shp
+# 2 - sword_new_shp
+# 3 - sword_diff_out
+
+
+# ******************************************************************************
+# Get command line arguments
+# ******************************************************************************
+IS_arg = len(sys.argv)
+if IS_arg != 4:
+    print('ERROR - 3 arguments must be used')
+    raise SystemExit(22)
+
+sword_old_shp = sys.argv[1]
+sword_new_shp = sys.argv[2]
+sword_diff_out = sys.argv[3]
+
+
+# ******************************************************************************
+# Check if files exist
+# ******************************************************************************
+try:
+    with open(sword_old_shp) as file:
+        pass
+except IOError:
+    print('ERROR - Unable to open '+sword_old_shp)
+    raise SystemExit(22)
+
+try:
+    with open(sword_new_shp) as file:
+        pass
+except IOError:
+    print('ERROR - Unable to open '+sword_new_shp)
+    raise SystemExit(22)
+
+# Confirm files refer to same region
+sword_old_reg = ms_catalog.pfaf_of(sword_old_shp)
+sword_new_reg = ms_catalog.pfaf_of(sword_new_shp)
+
+if not (sword_old_reg == sword_new_reg):
+    print('ERROR - Input files correspond to different regions')
+    raise SystemExit(22)
+
+
+# ******************************************************************************
+# Import processing modules
+# ******************************************************************************
+import ms_timing
+ms_timing.phase('import')
+import merit_sword
+
+
+# ******************************************************************************
+# Read files
+# ******************************************************************************
+print('- Reading files')
+ms_timing.phase('read')
+sword_old = merit_sword.Layer.read(sword_old_shp)
+sword_new = merit_sword.Layer.read(sword_new_shp)
+ms_timing.count('features', len(sword_old) + len(sword_new))
+
+
+# ******************************************************************************
+# Compare SWORD versions
+# ******************************************************************************
+print('- Comparing SWORD versions')
+ms_timing.phase('filter')
+diff = merit_sword.diff_sword(sword_old, sword_new)
+
+for status, n in diff.status.value_counts().sort_index().items():
+    print('  - '+str(n)+' reaches '+status)
+
+
+# ******************************************************************************
+# Write to file
+# ******************************************************************************
+ms_timing.phase('write')
+diff.to_csv(sword_diff_out, index=False)
@@ -17,8 +17,8 @@
 # Import Python modules
 # ******************************************************************************
 import sys
-import fiona
-from fiona.model import to_dict
+import ms_timing
+import ms_catalog
 
 
 # ******************************************************************************
@@ -44,7 +44,8 @@ sword_out = sys.argv[2]
 # Check if folders exist
 # ******************************************************************************
 # Empty sword region will fail this test, catch error
-if not (sword_shp.split('hb')[1][0:2] == '54'):
+sword_reg = ms_catalog.pfaf_of(sword_shp)
+if not (sword_reg == '54'):
 
     try:
         with open(sword_shp) as file:
@@ -58,52 +59,39 @@ if not (sword_shp.split('hb')[1][0:2] == '54'):
 # Edit SWORD geometries for relevant regions
 # ******************************************************************************
 print('- Editing geometries')
+ms_timing.phase('edit')
 
 # ------------------------------------------------------------------------------
 # Alter SWORD geometries of pfaf 35 to match MERIT-Basins handling of
 # -180 meridian
 # ------------------------------------------------------------------------------
-if sword_shp.split('hb')[1][0:2] == '35':
+if sword_reg == '35':
 
-    with fiona.open(sword_shp, 'r') as source:
+    import shapely
+    import ms_io
+    from merit_sword import normalize_longitudes
 
-        meta = source.meta
-
-        with fiona.open(sword_out, 'w', **meta) as output:
-
-            for rch in source:
-
-                # Store geometry coordinates dictionary
-                rch_crd = rch['geometry']['coordinates']
-
-                # Loop through coordinates, checking for values east of
-                # meridian
-                for i in range(len(rch_crd)):
-
-                    if rch_crd[i][0] < 0:
+    meta, fields, geometry = ms_io.read_layer(sword_shp)
 
-                        # Calculate new lon in MERIT-Basins proj
-                        # (allowing lon>180)
-                        new_x_crd = 180 + -1*(-180 - rch_crd[i][0])
+    # Shift coordinates east of meridian of all reaches to MERIT-Basins proj
+    # (allowing lon>180), as MERIT-Basins shifts the whole region
+    geometry, _ = normalize_longitudes(shapely.from_wkb(geometry), 'east',
+                                       select=True)
+    geometry = shapely.to_wkb(geometry)
 
-                        # Update coordinate tuple in rch_crd
-                        rch_crd[i] = (new_x_crd, rch_crd[i][1])
-
-                # Replace coordinate geometry in reach and write to file
-                new_rch = to_dict(rch)
-
-                new_rch['geometry']['coordinates'] = rch_crd
-
-                output.write(new_rch)
+    # Write edited reaches to file
+    ms_io.write_layer(sword_out, meta, fields, geometry)
 
 # ------------------------------------------------------------------------------
 # Write empty sword shapefile for missing pfaf 54 file (no sword reaches)
 # ------------------------------------------------------------------------------
-elif sword_shp.split('hb')[1][0:2] == '54':
+elif sword_reg == '54':
 
     # Alter filepath to load another file
     sword_new_shp = sword_shp.split('hb')[0] + 'hb53' + sword_shp.split('54')[1]
 
+    import fiona
+
     # Write an empty polygon shapefile, using another region as source
     with fiona.open(sword_new_shp, 'r') as source:
 
@@ -117,11 +105,7 @@ elif sword_shp.split('hb')[1][0:2] == '54':
 # ------------------------------------------------------------------------------
 else:
 
-    # Copy unchanged file to output data
-    with fiona.open(sword_shp, 'r') as source:
-
-        meta = source.meta
+    import ms_io
 
-        with fiona.open(sword_out, 'w', **meta) as output:
-            for rch in source:
-                output.write(rch)
+    # Copy all files of unchanged layer to output data
+    ms_io.copy_layer(sword_shp, sword_out)
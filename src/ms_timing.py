@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# ms_timing.py
+# ******************************************************************************
+
+# Purpose:
+# This module records the wall time, CPU time, peak memory and counts (e.g.
+# features, candidate pairs) of the successive phases of a script: read,
+# index, intersect, filter, write. The peak memory of a phase is that of the
+# process up to the end of the phase, as the peak of a single phase is not
+# known. Phases run in worker processes (e.g. tiles, regions in batch mode)
+# are recorded by the workers and merged into the worker phases of the run.
+# When the MS_REPORT_DIR environment variable is set, each run writes a json
+# and a csv report of its phases into that folder. When MS_PROFILE lists the
+# script name (e.g. ms_translate) or is set to 'all', a cProfile dump of the
+# run is also written there.
+# Given a folder of reports and a csv file, this script gathers the phases of
+# all reports into the csv file.
+
+# Author:
+# Jeffrey Wade, 2024
+
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import sys
+import os
+import csv
+import json
+import time
+import atexit
+import itertools
+import resource
+
+
+# ******************************************************************************
+# Declaration of variables (given as command line arguments)
+# ******************************************************************************
+# 1 - report_dir
+# 2 - summary_csv
+
+
+# ******************************************************************************
+# Phases of the current run
+# ******************************************************************************
+SCRIPT = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+REPORT_DIR = os.environ.get('MS_REPORT_DIR')
+PROFILE = os.environ.get('MS_PROFILE', '')
+
+# Phases by name in order of first use, the phase currently running, and
+# phases of worker processes by name
+_phases = {}
+_current = None
+_workers = {}
+
+
+def _maxrss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _record(name):
+    return {'phase': name, 'calls': 0, 'wall_s': 0., 'cpu_s': 0.,
+            'peak_rss_so_far_mb': 0., 'counts': {}}
+
+
+def phase(name):
+    """End the current phase and start phase name. Times of a phase started
+    several times are added up."""
+
+    global _current
+    end()
+
+    if name not in _phases:
+        _phases[name] = _record(name)
+    _phases[name]['calls'] += 1
+    _current = [name, time.perf_counter(), time.process_time()]
+
+
+def end():
+    """End the current phase, if any."""
+
+    global _current
+    if _current is None:
+        return
+
+    name, wall, cpu = _current
+    _phases[name]['wall_s'] += time.perf_counter() - wall
+    _phases[name]['cpu_s'] += time.process_time() - cpu
+    _phases[name]['peak_rss_so_far_mb'] = _maxrss_mb()
+    _current = None
+
+
+def count(key, n):
+    """Add n to the count key (e.g. features, pairs) of the current phase."""
+
+    if _current is not None:
+        counts = _phases[_current[0]]['counts']
+        counts[key] = counts.get(key, 0) + int(n)
+
+
+# ******************************************************************************
+# Phases of worker processes
+# ******************************************************************************
+def run_worker(name, func, *args):
+    """Return the result of func(*args) and the phase records of its run, in
+    a worker process. The run starts in phase name (e.g. the phase of the
+    parent process), and the records of the process before the run are left
+    aside."""
+
+    global _phases, _current
+    saved = (_phases, _current)
+    _phases, _current = {}, None
+    try:
+        phase(name)
+        res = func(*args)
+        end()
+        return res, list(_phases.values())
+    finally:
+        _phases, _current = saved
+
+
+def merge(phases):
+    """Add the phase records phases of a worker process to the worker phases
+    of the run: times and counts are added up, and the largest peak memory
+    is kept."""
+
+    for x in phases:
+        rec = _workers.setdefault(x['phase'], _record(x['phase']))
+        for key in ['calls', 'wall_s', 'cpu_s']:
+            rec[key] += x[key]
+        rec['peak_rss_so_far_mb'] = max(rec['peak_rss_so_far_mb'],
+                                        x['peak_rss_so_far_mb'])
+        for key, n in x['counts'].items():
+            rec['counts'][key] = rec['counts'].get(key, 0) + n
+
+
+def worker_map(pool, func, *iterables):
+    """Return the list of results of func mapped over iterables by the
+    worker processes of pool (e.g. a ProcessPoolExecutor), merging the phase
+    records of the workers into the worker phases of the run."""
+
+    name = _current[0] if _current is not None else 'worker'
+    res = []
+    for x, phases in pool.map(run_worker, itertools.repeat(name),
+                              itertools.repeat(func), *iterables):
+        merge(phases)
+        res.append(x)
+
+    return res
+
+
+# ******************************************************************************
+# Reports
+# ******************************************************************************
+def _rounded(phases):
+    return [dict(x, wall_s=round(x['wall_s'], 4), cpu_s=round(x['cpu_s'], 4),
+                 peak_rss_so_far_mb=round(x['peak_rss_so_far_mb'], 1))
+            for x in phases]
+
+
+def report():
+    """Return the phases of the run, and those of its worker processes, as a
+    dictionary."""
+
+    end()
+
+    return {'script': SCRIPT, 'argv': sys.argv[1:],
+            'wall_s': round(time.perf_counter() - _start[0], 4),
+            'cpu_s': round(time.process_time() - _start[1], 4),
+            'peak_rss_mb': round(_maxrss_mb(), 1),
+            'phases': _rounded(_phases.values()),
+            'worker_phases': _rounded(_workers.values())}
+
+
+def report_name():
+    """Return the name of the reports of the run: script name and name of the
+    last argument (the output file of MERIT-SWORD scripts)."""
+
+    name = SCRIPT
+    if len(sys.argv) > 1:
+        name += '__' + os.path.splitext(os.path.basename(
+            sys.argv[-1].rstrip('/')))[0]
+
+    return name
+
+
+def phase_rows(rep):
+    """Return the phases of rep, followed by its worker phases named
+    'worker:' and their phase name."""
+
+    return rep['phases'] + [dict(x, phase='worker:' + x['phase']) for x in
+                            rep.get('worker_phases', [])]
+
+
+def csv_rows(rep):
+    """Return the rows of the csv report of rep, with one column per count."""
+
+    phases = phase_rows(rep)
+    keys = sorted({x for y in phases for x in y['counts']})
+    rows = [['script', 'phase', 'calls', 'wall_s', 'cpu_s',
+             'peak_rss_so_far_mb'] + keys]
+    for x in phases:
+        rows.append([rep['script'], x['phase'], x['calls'], x['wall_s'],
+                     x['cpu_s'], x['peak_rss_so_far_mb']] +
+                    [x['counts'].get(y, '') for y in keys])
+
+    return rows
+
+
+def write_report(report_dir):
+    """Write the json and csv reports of the run into report_dir."""
+
+    rep = report()
+    stem = os.path.join(report_dir, report_name())
+    os.makedirs(report_dir, exist_ok=True)
+    with open(stem + '.json', 'w') as file:
+        json.dump(rep, file, indent=1)
+    with open(stem + '.csv', 'w', newline='') as file:
+        csv.writer(file).writerows(csv_rows(rep))
+
+
+def _write_at_exit():
+    # Worker processes started with the spawn method exit through atexit,
+    # but return their phases to the run instead of writing reports
+    import multiprocessing
+    if multiprocessing.parent_process() is None:
+        write_report(REPORT_DIR)
+
+
+_start = (time.perf_counter(), time.process_time())
+
+if REPORT_DIR and __name__ != '__main__':
+    atexit.register(_write_at_exit)
+
+if PROFILE == 'all' or SCRIPT in PROFILE.split(','):
+    import cProfile
+    _profile = cProfile.Profile()
+    _profile.enable()
+
+    def _dump():
+        _profile.disable()
+        _profile.dump_stats(os.path.join(REPORT_DIR or '.',
+                                         report_name() + '.prof'))
+
+    atexit.register(_dump)
+
+
+# ******************************************************************************
+# Command line interface
+# ******************************************************************************
+if __name__ == '__main__':
+
+    # --------------------------------------------------------------------------
+    # Get command line arguments
+    # --------------------------------------------------------------------------
+    IS_arg = len(sys.argv)
+    if IS_arg != 3:
+        print('ERROR - 2 arguments must be used')
+        raise SystemExit(22)
+
+    report_dir = sys.argv[1]
+    summary_csv = sys.argv[2]
+
+    # --------------------------------------------------------------------------
+    # Check if folders exist
+    # --------------------------------------------------------------------------
+    if not os.path.isdir(report_dir):
+        print('ERROR - '+report_dir+' invalid folder path')
+        raise SystemExit(22)
+
+    # --------------------------------------------------------------------------
+    # Gather phases of all reports
+    # --------------------------------------------------------------------------
+    print('- Gathering reports')
+    reps = []
+    for f in sorted(os.listdir(report_dir)):
+        if f.endswith('.json'):
+            with open(os.path.join(report_dir, f)) as file:
+                reps.append((os.path.splitext(f)[0], json.load(file)))
+
+    keys = sorted({x for _, y in reps for z in phase_rows(y)
+                   for x in z['counts']})
+
+    # --------------------------------------------------------------------------
+    # Write to file
+    # --------------------------------------------------------------------------
+    with open(summary_csv, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['run', 'script', 'phase', 'calls', 'wall_s', 'cpu_s',
+                         'peak_rss_so_far_mb'] + keys)
+        for run, rep in reps:
+            for x in phase_rows(rep):
+                writer.writerow([run, rep['script'], x['phase'], x['calls'],
+                                 x['wall_s'], x['cpu_s'],
+                                 x['peak_rss_so_far_mb']] +
+                                [x['counts'].get(y, '') for y in keys])
+    print('- '+str(len(reps))+' reports gathered')
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# ms_trans_server.py
+# ******************************************************************************
+
+# Purpose:
+# Given the consolidated MB-to-SWORD and SWORD-to-MB translation stores built
+# by ms_trans_store.py, this script starts a long-running local server that
+# holds both translation tables in memory and answers batch queries over HTTP,
+# either on a localhost port or on a Unix socket. A query posts a list of
+# COMIDs (or reach_ids) and receives the ranked reach_ids (or COMIDs) of each
+# one with their partial lengths. The server keeps request latency and
+# throughput statistics, available at /stats. Functions for clients are given
+# at the end of this module.
+
+# Author:
+# Jeffrey Wade, 2024
+
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import sys
+import os
+import json
+import time
+import socket
+import threading
+import collections
+import http.client
+import http.server
+import socketserver
+import numpy as np
+import ms_trans_store
+
+
+# ******************************************************************************
+# Request statistics
+# ******************************************************************************
+class Stats:
+    """Latency and throughput of the requests answered by the server."""
+
+    def __init__(self, window=10000):
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.requests = 0
+        self.ids = 0
+        self.busy = 0.
+        self.latency = collections.deque(maxlen=window)
+
+    def add(self, n_ids, elapsed):
+        with self.lock:
+            self.requests += 1
+            self.ids += n_ids
+            self.busy += elapsed
+            self.latency.append(elapsed)
+
+    def report(self):
+        """Return a dict of request counts, latency percentiles over the last
+        requests (milliseconds), and throughput since the server started."""
+
+        with self.lock:
+            lat = np.array(self.latency) * 1000.
+            uptime = time.time() - self.start
+            report = {'uptime_s': round(uptime, 3),
+                      'requests': self.requests,
+                      'ids': self.ids,
+                      'requests_per_s': round(self.requests / uptime, 3),
+                      'ids_per_s': round(self.ids / uptime, 3),
+                      'ids_per_busy_s': round(self.ids / self.busy, 3) if
+                      self.busy > 0 else None}
+        for name, q in [('p50', 50), ('p95', 95), ('p99', 99)]:
+            report['latency_' + name + '_ms'] = \
+                round(float(np.percentile(lat, q)), 3) if len(lat) else None
+        report['latency_max_ms'] = round(float(lat.max()), 3) if len(lat) \
+            else None
+
+        return report
+
+
+# ******************************************************************************
+# Request handler
+# ******************************************************************************
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+
+
+def parse_ids(body):
+    """Return the IDs of the decoded JSON body of a query as an int64 array,
+    raising ValueError unless they are a list of integers within the int64
+    range (floats, booleans, strings or nested lists are refused rather than
+    converted)."""
+
+    ids = body['ids']
+    if type(ids) is not list or not all(type(x) is int and
+                                        INT64_MIN <= x <= INT64_MAX
+                                        for x in ids):
+        raise ValueError('IDs must be a list of int64 integers')
+
+    return np.array(ids, dtype='int64')
+
+
+class TranslationHandler(http.server.BaseHTTPRequestHandler):
+    """Answer POST /mb_to_sword and /sword_to_mb queries and GET /stats."""
+
+    def _send(self, code, body):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self._send(200, self.server.stats.report())
+        else:
+            self._send(404, {'error': 'unknown path ' + self.path})
+
+    def do_POST(self):
+        tic = time.perf_counter()
+
+        store = self.server.stores.get(self.path.strip('/'))
+        if store is None:
+            self._send(404, {'error': 'unknown path ' + self.path})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            ids = parse_ids(json.loads(self.rfile.read(length)))
+        except (ValueError, KeyError, TypeError):
+            self._send(400, {'error': 'body must be {"ids": [...]}, with '
+                                      'integer IDs within the int64 range'})
+            return
+
+        # Vectorized lookup of the whole batch
+        found, ref, part_len = store.lookup(ids)
+
+        # Keep the non-zero ranks of each reach
+        n_ref = (ref > 0).sum(axis=1)
+        body = {'found': found.tolist(),
+                'ref': [r[:n].tolist() for r, n in zip(ref, n_ref)],
+                'part_len': [p[:n].tolist() for p, n in
+                             zip(part_len, n_ref)]}
+
+        self._send(200, body)
+        self.server.stats.add(len(ids), time.perf_counter() - tic)
+
+    def log_message(self, format, *args):
+        # Silence per-request logging, summarized by /stats instead
+        pass
+
+
+# ******************************************************************************
+# Servers
+# ******************************************************************************
+class TranslationServer(http.server.ThreadingHTTPServer):
+    """HTTP server on a localhost port."""
+
+    daemon_threads = True
+
+    def __init__(self, port, stores):
+        super().__init__(('127.0.0.1', port), TranslationHandler)
+        self.stores = stores
+        self.stats = Stats()
+
+
+class UnixTranslationServer(socketserver.ThreadingMixIn,
+                            socketserver.UnixStreamServer):
+    """HTTP server on a Unix socket."""
+
+    daemon_threads = True
+
+    def __init__(self, path, stores):
+        if os.path.exists(path):
+            os.remove(path)
+        super().__init__(path, TranslationHandler)
+        self.stores = stores
+        self.stats = Stats()
+
+    def get_request(self):
+        # Give handlers a client address, as Unix sockets have none
+        request, _ = super().get_request()
+        return request, ('local', 0)
+
+
+def serve(ms_store_nc, sm_store_nc, address):
+    """Load both stores and serve them on address, a port number or the
+    path of a Unix socket."""
+
+    stores = {'mb_to_sword': ms_trans_store.TranslationStore(ms_store_nc),
+              'sword_to_mb': ms_trans_store.TranslationStore(sm_store_nc)}
+    for store in stores.values():
+        store.load()
+
+    if str(address).isdigit():
+        server = TranslationServer(int(address), stores)
+    else:
+        server = UnixTranslationServer(address, stores)
+
+    print('- Serving translations on '+str(address))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+# ******************************************************************************
+# Client
+# ******************************************************************************
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection through a Unix socket."""
+
+    def __init__(self, path):
+        super().__init__('localhost')
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+def connect(address):
+    """Return a connection to a server given its port or Unix socket."""
+
+    if str(address).isdigit():
+        return http.client.HTTPConnection('127.0.0.1', int(address))
+    return UnixHTTPConnection(address)
+
+
+def query(conn, direction, ids):
+    """Send a batch of IDs to 'mb_to_sword' or 'sword_to_mb' and return the
+    answer as a dict of found, ref and part_len lists."""
+
+    conn.request('POST', '/' + direction,
+                 json.dumps({'ids': [int(x) for x in ids]}),
+                 {'Content-Type': 'application/json'})
+    resp = conn.getresponse()
+    body = json.loads(resp.read())
+    if resp.status != 200:
+        raise ValueError(body['error'])
+    return body
+
+
+def stats(conn):
+    """Return the statistics of a server."""
+
+    conn.request('GET', '/stats')
+    return json.loads(conn.getresponse().read())
+
+
+# ******************************************************************************
+# Command line interface
+# ******************************************************************************
+if __name__ == '__main__':
+
+    # --------------------------------------------------------------------------
+    # Declaration of variables (given as command line arguments)
+    # --------------------------------------------------------------------------
+    # 1 - ms_store_nc
+    # 2 - sm_store_nc
+    # 3 - address (port number or Unix socket path)
+
+    # --------------------------------------------------------------------------
+    # Get command line arguments
+    # --------------------------------------------------------------------------
+    IS_arg = len(sys.argv)
+    if IS_arg != 4:
+        print('ERROR - 3 arguments must be used')
+        raise SystemExit(22)
+
+    ms_store_nc = sys.argv[1]
+    sm_store_nc = sys.argv[2]
+    address = sys.argv[3]
+
+    # --------------------------------------------------------------------------
+    # Check if files exist
+    # --------------------------------------------------------------------------
+    try:
+        with open(ms_store_nc) as file:
+            pass
+    except IOError:
+        print('ERROR - Unable to open '+ms_store_nc)
+        raise SystemExit(22)
+
+    try:
+        with open(sm_store_nc) as file:
+            pass
+    except IOError:
+        print('ERROR - Unable to open '+sm_store_nc)
+        raise SystemExit(22)
+
+    serve(ms_store_nc, sm_store_nc, address)
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# ms_trans_store.py
+# ******************************************************************************
+
+# Purpose:
+# Given a folder of regional translation files (mb_to_sword or sword_to_mb)
+# produced by ms_translate.py, this script merges all regions into a single
+# chunked NetCDF4 store. Reaches are sorted by region and then by ID, so that
+# the store holds a sorted ID index along with the offset and count of each
+# region. Any reach of the world can then be looked up with a binary search
+# within its region followed by the read of a single chunk, using the
+# TranslationStore class of this module.
+
+# Author:
+# Jeffrey Wade, 2024
+
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import sys
+import os
+import glob
+import numpy as np
+import netCDF4
+import ms_translation
+
+
+# ******************************************************************************
+# Build the store
+# ******************************************************************************
+def build_store(trans_files, store_nc, chunk=1024):
+    """Merge regional translation files into the store store_nc."""
+
+    # --------------------------------------------------------------------------
+    # Identify the region of each file from its index, skipping empty files
+    # --------------------------------------------------------------------------
+    regions = []
+    for nc in trans_files:
+        with netCDF4.Dataset(nc, 'r') as ds:
+            dim = list(ds.dimensions)[0]
+            if len(ds.dimensions[dim]) == 0:
+                continue
+            pfaf = np.unique(ms_translation.id_pfaf(ds[dim][:]))
+
+        if len(pfaf) != 1:
+            raise ValueError('Reaches of several regions in ' + nc)
+        regions.append((int(pfaf[0]), nc))
+
+    if len(regions) == 0:
+        raise ValueError('No translated reaches in translation files')
+
+    # Order regions by pfaf
+    regions.sort()
+    if len(set(x[0] for x in regions)) != len(regions):
+        raise ValueError('Region given by several translation files')
+
+    # --------------------------------------------------------------------------
+    # Create store from the layout of the first region
+    # --------------------------------------------------------------------------
+    trans = ms_translation.Translation(regions[0][1])
+    dim = trans.dim
+    ref = trans.id_names[0].rsplit('_', 1)[0]
+    rank = trans.ids.shape[1]
+
+    sizes = []
+    for _, nc in regions:
+        with netCDF4.Dataset(nc, 'r') as ds:
+            sizes.append(len(ds.dimensions[dim]))
+
+    tmp = store_nc + '.' + str(os.getpid()) + '.tmp'
+    ds = netCDF4.Dataset(tmp, 'w', format='NETCDF4')
+
+    ds.createDimension(dim, sum(sizes))
+    ds.createDimension('rank', rank)
+    ds.createDimension('region', len(regions))
+
+    chunks = (min(chunk, sum(sizes)), rank)
+    index_var = ds.createVariable(dim, 'i8', (dim,), zlib=True)
+    ids_var = ds.createVariable(ref, 'i8', (dim, 'rank'), zlib=True,
+                                chunksizes=chunks)
+    len_var = ds.createVariable('part_len', 'f8', (dim, 'rank'), zlib=True,
+                                chunksizes=chunks, fill_value=np.nan)
+    pfaf_var = ds.createVariable('region_pfaf', 'i4', ('region',))
+    start_var = ds.createVariable('region_start', 'i8', ('region',))
+    count_var = ds.createVariable('region_count', 'i8', ('region',))
+
+    ds.description = 'Consolidated translation store: ' + dim + ' to ' + ref
+    index_var.long_name = 'Sorted ' + dim + ' index'
+    ids_var.long_name = 'Ranked ' + ref + ' IDs corresponding to ' + dim
+    len_var.units = 'meters'
+    len_var.long_name = 'Partial length of SWORD reach within MB catchment'
+
+    # --------------------------------------------------------------------------
+    # Write regions one at a time, sorted by ID
+    # --------------------------------------------------------------------------
+    start = 0
+    for i, (pfaf, nc) in enumerate(regions):
+        if i > 0:
+            trans = ms_translation.Translation(nc)
+
+        srt = np.argsort(trans.index, kind='stable')
+        end = start + len(trans)
+
+        index_var[start:end] = trans.index[srt]
+        ids_var[start:end, :] = trans.ids[srt]
+        len_var[start:end, :] = trans.part_len[srt]
+
+        pfaf_var[i] = pfaf
+        start_var[i] = start
+        count_var[i] = len(trans)
+        start = end
+
+    ds.close()
+    os.replace(tmp, store_nc)
+
+
+# ******************************************************************************
+# Read the store
+# ******************************************************************************
+class TranslationStore:
+    """Lookups of any reach in a consolidated translation store."""
+
+    def __init__(self, store_nc):
+
+        self.ds = netCDF4.Dataset(store_nc, 'r')
+        self.ds.set_auto_mask(False)
+
+        self.dim = list(self.ds.dimensions)[0]
+        self.ref = [x for x in self.ds.variables if x not in
+                    [self.dim, 'part_len'] and not
+                    x.startswith('region_')][0]
+
+        # Sorted ID index and region offsets are held in memory
+        self.index = self.ds[self.dim][:]
+        self.region = {int(p): (int(s), int(s) + int(c)) for p, s, c in
+                       zip(self.ds['region_pfaf'][:],
+                           self.ds['region_start'][:],
+                           self.ds['region_count'][:])}
+
+        # Blocks of translated IDs and partial lengths, read from the file
+        # unless held in memory with load()
+        self.ref_block = self.ds[self.ref]
+        self.len_block = self.ds['part_len']
+
+    def load(self):
+        """Read the blocks of translated IDs and partial lengths into memory,
+        so that lookups no longer read from the file."""
+
+        self.ref_block = self.ref_block[:]
+        self.len_block = self.len_block[:]
+
+    def close(self):
+        self.ds.close()
+
+    def rows(self, ids):
+        """Return the store rows of an array of IDs, -1 where absent."""
+
+        ids = np.asarray(ids, dtype='int64')
+        rows = np.full(len(ids), -1, dtype='int64')
+        pfaf = ms_translation.id_pfaf(ids)
+
+        # Binary search within the ID range of each region
+        for p in np.unique(pfaf):
+            if int(p) not in self.region:
+                continue
+            start, end = self.region[int(p)]
+            sel = np.where(pfaf == p)[0]
+            pos = start + np.searchsorted(self.index[start:end], ids[sel])
+            pos = np.minimum(pos, end - 1)
+            hit = self.index[pos] == ids[sel]
+            rows[sel[hit]] = pos[hit]
+
+        return rows
+
+    def lookup(self, ids):
+        """Return (found, ids, part_len) for an array of IDs: a boolean
+        array and the 2-D blocks of translated IDs and partial lengths,
+        zero and NaN for IDs absent from the store."""
+
+        rows = self.rows(ids)
+        found = rows >= 0
+        rank = self.ref_block.shape[1]
+
+        ref = np.zeros((len(rows), rank), dtype='int64')
+        part_len = np.full((len(rows), rank), np.nan)
+
+        # Read each distinct row once, in increasing order
+        if found.any():
+            uniq, inv = np.unique(rows[found], return_inverse=True)
+            ref[found] = self.ref_block[uniq, :][inv]
+            part_len[found] = self.len_block[uniq, :][inv]
+
+        return found, ref, part_len
+
+
+# ******************************************************************************
+# Command line interface
+# ******************************************************************************
+if __name__ == '__main__':
+
+    # --------------------------------------------------------------------------
+    # Declaration of variables (given as command line arguments)
+    # --------------------------------------------------------------------------
+    # 1 - trans_in
+    # 2 - store_out
+
+    # --------------------------------------------------------------------------
+    # Get command line arguments
+    # --------------------------------------------------------------------------
+    IS_arg = len(sys.argv)
+    if IS_arg != 3:
+        print('ERROR - 2 arguments must be used')
+        raise SystemExit(22)
+
+    trans_in = sys.argv[1]
+    store_out = sys.argv[2]
+
+    # --------------------------------------------------------------------------
+    # Check if folder exists
+    # --------------------------------------------------------------------------
+    if not os.path.isdir(trans_in):
+        print('ERROR - '+trans_in+' invalid folder path')
+        raise SystemExit(22)
+
+    trans_files = sorted(glob.glob(os.path.join(trans_in, '*.nc')))
+    if len(trans_files) == 0:
+        print('ERROR - No translation files in '+trans_in)
+        raise SystemExit(22)
+
+    # --------------------------------------------------------------------------
+    # Merge regional translations
+    # --------------------------------------------------------------------------
+    print('- Merging '+str(len(trans_files))+' translation files')
+    build_store(trans_files, store_out)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# ms_translation.py
+# ******************************************************************************
+
+# Purpose:
+# This module reads the MB-to-SWORD and SWORD-to-MB translation NetCDF files
+# produced by ms_translate.py. Each file is read with netCDF4 straight into
+# NumPy arrays: the index (COMID or reach_id), the block of translated IDs, and
+# the block of partial lengths, each block as a contiguous 2-D array with one
+# row per reach. Sets of regional files are opened lazily, so that only the
+# regions actually used by a script are read. Rows of translation and
+# diagnostic files can be patched in place after incremental updates.
+
+# Author:
+# Jeffrey Wade, 2024
+
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import collections.abc
+import numpy as np
+import netCDF4
+
+
+# ******************************************************************************
+# Pfafstetter regions of reach IDs
+# ******************************************************************************
+def id_pfaf(ids):
+    """Return the 2-digit pfaf region of each COMID or reach_id in an array."""
+
+    pfaf = np.asarray(ids, dtype='int64')
+
+    # Drop trailing digits with integer division until 2 digits remain
+    while (pfaf >= 100).any():
+        pfaf = np.where(pfaf >= 100, pfaf // 10, pfaf)
+
+    return pfaf
+
+
+def id_regions(ids):
+    """Return the sorted unique 2-digit pfaf regions of an array of COMIDs or
+    reach_ids, ignoring zeros."""
+
+    # Reduce to unique non-zero IDs before computing prefixes
+    ids = np.unique(np.asarray(ids, dtype='int64'))
+
+    return [str(x) for x in np.unique(id_pfaf(ids[ids != 0]))]
+
+
+# ******************************************************************************
+# Translation of one region
+# ******************************************************************************
+class Translation:
+    """Index, translated IDs and partial lengths of a translation file."""
+
+    def __init__(self, nc):
+
+        with netCDF4.Dataset(nc, 'r') as ds:
+
+            # Keep raw values, as fill values are never written
+            ds.set_auto_mask(False)
+
+            # Index dimension ('mb' or 'sword') and its coordinate variable
+            self.dim = list(ds.dimensions)[0]
+            self.index = np.asarray(ds[self.dim][:], dtype='int64')
+
+            # Translated ID variables followed by partial length variables
+            names = [x for x in ds.variables if x != self.dim]
+            self.id_names = [x for x in names if not
+                             x.startswith('part_len')]
+            self.len_names = [x for x in names if x.startswith('part_len')]
+
+            # Fill 2-D blocks column by column from each variable
+            self.ids = np.zeros((len(self.index), len(self.id_names)),
+                                dtype='int64')
+            for j, name in enumerate(self.id_names):
+                self.ids[:, j] = ds[name][:]
+
+            self.part_len = np.zeros((len(self.index), len(self.len_names)),
+                                     dtype='float64')
+            for j, name in enumerate(self.len_names):
+                self.part_len[:, j] = ds[name][:]
+
+        self._regions = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def regions(self):
+        """Return the pfaf regions referenced by the translated IDs, computed
+        once per translation."""
+
+        if self._regions is None:
+            self._regions = id_regions(self.ids)
+        return self._regions
+
+    def subset(self, keep):
+        """Return the translation of the rows selected by the boolean array
+        keep, referencing the regions of the whole translation."""
+
+        sub = object.__new__(Translation)
+        sub.dim = self.dim
+        sub.id_names = self.id_names
+        sub.len_names = self.len_names
+        sub.index = self.index[keep]
+        sub.ids = self.ids[keep]
+        sub.part_len = self.part_len[keep]
+        sub._regions = self.regions()
+
+        return sub
+
+    def to_dataframe(self):
+        """Return the translation as the DataFrame given by xarray."""
+
+        # Local import, as most users only need the arrays
+        import pandas as pd
+
+        index = pd.Index(self.index, name=self.dim)
+        return pd.concat([pd.DataFrame(self.ids, index=index,
+                                       columns=self.id_names),
+                          pd.DataFrame(self.part_len, index=index,
+                                       columns=self.len_names)], axis=1)
+
+
+# ******************************************************************************
+# Lazily opened translations of all regions
+# ******************************************************************************
+class TranslationFiles:
+    """List of translation files, or dict of translation files by pfaf
+    region, each read on first access."""
+
+    def __init__(self, files):
+        self.files = files if isinstance(files, collections.abc.Mapping) \
+            else list(files)
+        self._cache = {}
+
+    def __len__(self):
+        return len(self.files)
+
+    def __getitem__(self, i):
+        if i not in self._cache:
+            self._cache[i] = Translation(self.files[i])
+        return self._cache[i]
+
+
+# ******************************************************************************
+# Patch rows of a NetCDF file
+# ******************************************************************************
+def patch_rows(nc, df):
+    """Overwrite in place the rows of the NetCDF file nc (a translation or
+    diagnostic file) whose index values are in df.index, with the columns of
+    df. Raises KeyError if a value of df.index is absent from the file."""
+
+    if len(df) == 0:
+        return
+
+    with netCDF4.Dataset(nc, 'r+') as ds:
+        ds.set_auto_mask(False)
+        dim = list(ds.dimensions)[0]
+        index = np.asarray(ds[dim][:], dtype='int64')
+
+        # Rows of the patched index values
+        row = dict(zip(index.tolist(), range(len(index))))
+        missing = [x for x in df.index.tolist() if x not in row]
+        if len(missing) > 0:
+            raise KeyError('Reaches absent from ' + nc + ': ' +
+                           ' '.join(str(x) for x in missing[:5]))
+        pos = np.array([row[x] for x in df.index.tolist()], dtype='int64')
+
+        # Write values variable by variable, in increasing row order
+        srt = np.argsort(pos)
+        for name in df.columns:
+            ds[name][pos[srt]] = np.asarray(df[name].values)[srt]
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# tst_bench.py
+# ******************************************************************************
+
+# Purpose:
+# Given a folder containing the MERIT-SWORD scripts, this script measures the
+# startup time of each script with python -X importtime. Scripts are run
+# without arguments, so that they stop at their argument check, and the time
+# spent importing modules before that check is written to a csv file.
+# Given a list of numbers of reaches, this script instead generates synthetic
+# datasets of these sizes with tst_synth.py, runs all processing steps on them
+# with ms_pipeline.py, and writes the wall time, peak memory and phase times
+# of each step to the csv file. Given the csv file of a previous benchmark,
+# steps that became slower by more than REG_TOL are reported as regressions.
+
+# Author:
+# Jeffrey Wade, 2024
+
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import sys
+import os
+import glob
+import csv
+import json
+import time
+import shutil
+import tempfile
+import statistics
+import subprocess
+
+
+# ******************************************************************************
+# Declaration of variables (given as command line arguments)
+# ******************************************************************************
+# 1 - src_dir
+# 2 - bench_csv
+# 3 - n_reach_list (optional, comma-separated, e.g. 1000,10000,100000,1000000)
+# 4 - ref_csv (optional)
+
+
+# ******************************************************************************
+# Benchmark parameters
+# ******************************************************************************
+# Phases recorded by ms_timing.py reported for each step
+PHASES = ['import', 'read', 'index', 'intersect', 'filter', 'write']
+
+# Relative and absolute (s) increase of wall time counted as a regression
+REG_TOL = 0.2
+REG_MIN_S = 0.5
+
+
+# ******************************************************************************
+# Startup time of a script
+# ******************************************************************************
+def parse_importtime(stderr):
+    """Return (import_us, n_mod, top) from the python -X importtime output of
+    a run: total import time (us), number of imported modules, and the
+    cumulative time (us) of each top-level import."""
+
+    import_us = 0
+    n_mod = 0
+    top = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cum_us, name = line[len('import time:'):].split('|')
+        import_us += int(self_us)
+        n_mod += 1
+
+        # Top-level imports are not indented
+        if not name.startswith('  '):
+            top[name.strip()] = int(cum_us)
+
+    return import_us, n_mod, top
+
+
+def startup_time(script, repeat=5):
+    """Return the median wall-clock and import times (ms) of script run with
+    no arguments, its number of imported modules, and its three slowest
+    top-level imports."""
+
+    wall = []
+    imp = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run = subprocess.run([sys.executable, '-X', 'importtime',
+                              os.path.basename(script)],
+                             cwd=os.path.dirname(os.path.abspath(script)),
+                             capture_output=True, text=True)
+        wall.append((time.perf_counter() - start) * 1e3)
+        import_us, n_mod, top = parse_importtime(run.stderr)
+        imp.append(import_us / 1e3)
+
+    top = sorted(top, key=lambda x: -top[x])[:3]
+
+    return statistics.median(wall), statistics.median(imp), n_mod, top
+
+
+# ******************************************************************************
+# Processing time of each step on synthetic datasets
+# ******************************************************************************
+def step_times(src_dir, n_reach, work_dir):
+    """Return rows of wall time, peak memory and phase times (s) of each
+    processing step, summed over regions, for a synthetic dataset of n_reach
+    reaches generated in work_dir."""
+
+    sys.path.insert(0, os.path.abspath(src_dir))
+    import tst_synth
+    import ms_pipeline
+
+    regions = tst_synth.generate(work_dir, n_reach)
+    lay = ms_pipeline.Layout(
+        os.path.join(work_dir, 'input'), os.path.join(work_dir, 'out'),
+        os.path.join(work_dir, 'output', 'ms_riv_edit',
+                     'meritsword_edits.csv'))
+
+    # Run steps one at a time, with phase reports of each run
+    report_dir = os.path.join(work_dir, 'report')
+    os.environ['MS_REPORT_DIR'] = report_dir
+    state = ms_pipeline.State(lay.state())
+    ms_pipeline.run_all(lay, regions, state, workers=1)
+    del os.environ['MS_REPORT_DIR']
+
+    # Sum runs of each step over regions
+    steps = {}
+    for name, stat in state.stats.items():
+        step = name.rstrip('0123456789').rstrip('_')
+        row = steps.setdefault(step, {'runs': 0, 'wall_s': 0.,
+                                      'maxrss_mb': 0.})
+        row['runs'] += 1
+        row['wall_s'] += stat['wall_s']
+        row['maxrss_mb'] = max(row['maxrss_mb'], stat['maxrss_mb'])
+
+    for f in sorted(os.listdir(report_dir)):
+        if not f.endswith('.json'):
+            continue
+        with open(os.path.join(report_dir, f)) as file:
+            rep = json.load(file)
+        row = steps[rep['script'][len('ms_'):]]
+        for x in rep['phases']:
+            if x['phase'] in PHASES:
+                key = x['phase'] + '_s'
+                row[key] = row.get(key, 0.) + x['wall_s']
+
+    return [[n_reach, step, x['runs'], round(x['wall_s'], 3),
+             x['maxrss_mb']] + [round(x.get(y + '_s', 0.), 3) for y in
+                                PHASES] for step, x in steps.items()]
+
+
+def regressions(rows, ref_csv):
+    """Return the (n_reach, step, wall_s, ref_wall_s) of rows whose wall time
+    exceeds that of the reference benchmark by REG_TOL and REG_MIN_S."""
+
+    with open(ref_csv, newline='') as file:
+        ref = {(int(x['n_reach']), x['step']): float(x['wall_s']) for x in
+               csv.DictReader(file)}
+
+    slow = []
+    for row in rows:
+        key = (row[0], row[1])
+        if key in ref and row[3] > ref[key] * (1 + REG_TOL) and \
+           row[3] - ref[key] > REG_MIN_S:
+            slow.append((row[0], row[1], row[3], ref[key]))
+
+    return slow
+
+
+# ******************************************************************************
+# Command line interface
+# ******************************************************************************
+if __name__ == '__main__':
+
+    # --------------------------------------------------------------------------
+    # Get command line arguments
+    # --------------------------------------------------------------------------
+    IS_arg = len(sys.argv)
+    if IS_arg < 3 or IS_arg > 5:
+        print('ERROR - Between 2 and 4 arguments must be used')
+        raise SystemExit(22)
+
+    src_dir = sys.argv[1]
+    bench_csv = sys.argv[2]
+    n_reach_list = [int(x) for x in sys.argv[3].split(',')] if IS_arg > 3 \
+        else None
+    ref_csv = sys.argv[4] if IS_arg > 4 else None
+
+    # --------------------------------------------------------------------------
+    # Check if folders exist
+    # --------------------------------------------------------------------------
+    if not os.path.isdir(src_dir):
+        print('ERROR - '+src_dir+' invalid folder path')
+        raise SystemExit(22)
+
+    if ref_csv is not None:
+        try:
+            with open(ref_csv) as file:
+                pass
+        except IOError:
+            print('ERROR - Unable to open '+ref_csv)
+            raise SystemExit(22)
+
+    # --------------------------------------------------------------------------
+    # Measure processing time of each step on synthetic datasets
+    # --------------------------------------------------------------------------
+    if n_reach_list is not None:
+
+        header = ['n_reach', 'step', 'runs', 'wall_s', 'maxrss_mb'] + \
+            [x + '_s' for x in PHASES]
+        rows = []
+        for n_reach in n_reach_list:
+            print('- Timing processing steps for '+str(n_reach)+' reaches')
+            work_dir = tempfile.mkdtemp(prefix='ms_bench_')
+            try:
+                rows.extend(step_times(src_dir, n_reach, work_dir))
+            finally:
+                shutil.rmtree(work_dir)
+
+        for row in rows:
+            print('  - {:>8} {:<22} {:>9.2f} s {:>8.1f} MB'
+                  .format(row[0], row[1], row[3], row[4]))
+
+    # --------------------------------------------------------------------------
+    # Measure startup time of each script
+    # --------------------------------------------------------------------------
+    else:
+
+        print('- Measuring startup time')
+        scripts = sorted(glob.glob(os.path.join(src_dir, 'ms_*.py')) +
+                         glob.glob(os.path.join(src_dir, 'tst_cmp.py')))
+
+        header = ['script', 'wall_ms', 'import_ms', 'n_modules',
+                  'top_imports']
+        rows = []
+        for script in scripts:
+            wall_ms, import_ms, n_mod, top = startup_time(script)
+            rows.append([os.path.basename(script), round(wall_ms, 1),
+                         round(import_ms, 1), n_mod, ' '.join(top)])
+            print('  - {:<28} {:>8.1f} ms {:>8.1f} ms import {:>5} modules'
+                  .format(*rows[-1][:4]))
+
+    # --------------------------------------------------------------------------
+    # Write to file
+    # --------------------------------------------------------------------------
+    with open(bench_csv, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+    # --------------------------------------------------------------------------
+    # Check for regressions
+    # --------------------------------------------------------------------------
+    if n_reach_list is not None and ref_csv is not None:
+        slow = regressions(rows, ref_csv)
+        for n_reach, step, wall_s, ref_s in slow:
+            print('REGRESSION - {} at {} reaches: {:.2f} s, was {:.2f} s'
+                  .format(step, n_reach, wall_s, ref_s))
+        if len(slow) > 0:
+            raise SystemExit(1)
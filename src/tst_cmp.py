@@ -6,6 +6,12 @@
 # Purpose:
 # Given an original MERIT-SWORD file and a file generating during testing,
 # ensure that files are identical.
+# Given a tolerance, or two folders, files are instead compared by content:
+# NetCDF variables array by array, and shapefile attributes and geometries in
+# chunks of features, with numeric values and coordinates allowed to differ
+# by the tolerance. Header differences (attributes, field widths) are ignored.
+# Files of two folders are compared in parallel, and the first differing
+# reach IDs of each file are reported.
 
 # Author:
 # Jeffrey Wade, 2024
@@ -15,56 +21,275 @@
 # Import Python modules
 # ******************************************************************************
 import sys
+import os
 import filecmp
 
 
 # ******************************************************************************
 # Declaration of variables (given as command line arguments)
 # ******************************************************************************
-# 1 - file_org
-# 2 - file_tst
+# 1 - file_org (file or folder)
+# 2 - file_tst (file or folder)
+# 3 - tol (optional, absolute tolerance, default 0 for folders)
 
 
 # ******************************************************************************
-# Get command line arguments
+# Comparison parameters
 # ******************************************************************************
-IS_arg = len(sys.argv)
-if IS_arg != 3:
-    print('ERROR - 2 arguments must be used')
-    raise SystemExit(22)
+# Number of values (NetCDF) or features (shapefiles) compared at once
+CHUNK = 1000000
+CHUNK_FEA = 100000
 
-file_org = sys.argv[1]
-file_tst = sys.argv[2]
+# Number of differing IDs reported for each variable or file
+N_ID = 5
+
+# Columns identifying reaches, in order of preference
+ID_COLS = ['COMID', 'reach_id']
+
+# Files compared in folders
+EXTS = ('.shp', '.nc', '.csv')
+
+
+# ******************************************************************************
+# Compare arrays
+# ******************************************************************************
+def differs(a, b, tol):
+    """Return a boolean array, True where arrays a and b differ by more than
+    tol, with NaN values equal to each other."""
+
+    import numpy as np
+
+    if a.dtype.kind in 'fc' or b.dtype.kind in 'fc':
+        a = np.asarray(a, dtype='float64')
+        b = np.asarray(b, dtype='float64')
+        same = np.isclose(a, b, rtol=0, atol=tol, equal_nan=True)
+    else:
+        same = a == b
+
+    return ~np.asarray(same)
+
+
+# ******************************************************************************
+# Compare NetCDF files
+# ******************************************************************************
+def cmp_nc(file_org, file_tst, tol):
+    """Return a list of differences between the variables of two NetCDF
+    files, with the first differing IDs of each variable."""
+
+    import numpy as np
+    import netCDF4
+
+    diffs = []
+    with netCDF4.Dataset(file_org) as org, netCDF4.Dataset(file_tst) as tst:
+
+        if set(org.variables) != set(tst.variables):
+            return ['variables differ: ' +
+                    ' '.join(sorted(set(org.variables) ^ set(tst.variables)))]
+
+        for name in org.variables:
+            var_org = org.variables[name]
+            var_tst = tst.variables[name]
+            if var_org.shape != var_tst.shape:
+                diffs.append(name + ': shape ' + str(var_org.shape) + ' != ' +
+                             str(var_tst.shape))
+                continue
+
+            # Values of the first dimension identify the differing rows
+            dim = var_org.dimensions[0] if var_org.ndim > 0 else None
+            ids = org.variables[dim] if dim in org.variables else None
+
+            # Compare rows of the first dimension in chunks of CHUNK values
+            n = var_org.shape[0] if var_org.ndim > 0 else 1
+            step = max(CHUNK // max(int(np.prod(var_org.shape[1:])), 1), 1)
+            bad = []
+            for i in range(0, n, step):
+                sel = slice(i, i + step) if var_org.ndim > 0 else ()
+                a = np.ma.filled(var_org[sel], np.nan)
+                b = np.ma.filled(var_tst[sel], np.nan)
+                m = a.shape[0] if var_org.ndim > 0 else 1
+                row = differs(a, b, tol).reshape(m, -1).any(axis=1)
+                bad.extend((np.flatnonzero(row) + i).tolist())
+                if len(bad) >= N_ID:
+                    break
+
+            if len(bad) > 0:
+                first = bad[:N_ID] if ids is None else \
+                    [int(ids[x]) if ids.dtype.kind in 'iu' else ids[x]
+                     for x in bad[:N_ID]]
+                diffs.append(name + ': first differing ' +
+                             (dim if ids is not None else 'rows') + ' ' +
+                             ' '.join(str(x) for x in first))
+
+    return diffs
+
+
+# ******************************************************************************
+# Compare shapefiles
+# ******************************************************************************
+def cmp_shp(file_org, file_tst, tol):
+    """Return a list of differences between the attributes and geometries of
+    two shapefiles, with the first differing IDs."""
+
+    import itertools
+    import numpy as np
+    import shapely
+    import ms_io
+
+    names_org = list(ms_io.read_layer(file_org, read_geometry=False,
+                                      use_cache=False)[0]['fields'])
+    names_tst = list(ms_io.read_layer(file_tst, read_geometry=False,
+                                      use_cache=False)[0]['fields'])
+    if names_org != names_tst:
+        return ['fields differ: ' + ' '.join(names_org) + ' != ' +
+                ' '.join(names_tst)]
+    id_col = next((x for x in ID_COLS if x in names_org), None)
+
+    diffs = {}
+    n_org = 0
+    n_tst = 0
+    chunks = itertools.zip_longest(
+        ms_io.read_chunks(file_org, chunk=CHUNK_FEA),
+        ms_io.read_chunks(file_tst, chunk=CHUNK_FEA), fillvalue=({}, []))
+    for (fld_org, geo_org), (fld_tst, geo_tst) in chunks:
+        n_org += len(geo_org)
+        n_tst += len(geo_tst)
+        if len(geo_org) != len(geo_tst):
+            break
+
+        ids = fld_org[id_col] if id_col is not None else \
+            np.arange(n_org - len(geo_org), n_org)
+
+        # Attributes
+        for name in names_org:
+            bad = np.flatnonzero(differs(fld_org[name], fld_tst[name], tol))
+            if len(bad) > 0:
+                diffs.setdefault(name, []).extend(ids[bad].tolist())
+
+        # Geometries, equal if both are missing
+        g_org = shapely.from_wkb(geo_org)
+        g_tst = shapely.from_wkb(geo_tst)
+        same = shapely.equals_exact(g_org, g_tst, tolerance=tol) | \
+            (shapely.is_missing(g_org) & shapely.is_missing(g_tst))
+        bad = np.flatnonzero(~same)
+        if len(bad) > 0:
+            diffs.setdefault('geometry', []).extend(ids[bad].tolist())
+
+        if sum(len(x) for x in diffs.values()) >= N_ID:
+            break
+
+    if n_org != n_tst:
+        return ['number of features differs: ' + str(n_org) + ' != ' +
+                str(n_tst)]
+
+    return [name + ': first differing ' + (id_col or 'features') + ' ' +
+            ' '.join(str(x) for x in val[:N_ID]) for name, val in
+            diffs.items()]
 
 
 # ******************************************************************************
-# Check if files exist
+# Compare any file
 # ******************************************************************************
-try:
-    with open(file_org) as file:
-        pass
-except IOError:
-    print('ERROR - Unable to open ' + file_org)
-    raise SystemExit(22)
+def cmp_file(file_org, file_tst, tol):
+    """Return a list of differences between two files, compared by content
+    for NetCDF files and shapefiles and byte by byte otherwise."""
+
+    if not os.path.isfile(file_tst):
+        return ['missing file']
+
+    try:
+        if file_org.endswith('.nc'):
+            return cmp_nc(file_org, file_tst, tol)
+        if file_org.endswith('.shp'):
+            return cmp_shp(file_org, file_tst, tol)
+    except Exception as err:
+        return ['unable to compare: ' + str(err)]
 
-try:
-    with open(file_tst) as file:
-        pass
-except IOError:
-    print('ERROR - Unable to open ' + file_tst)
-    raise SystemExit(22)
+    return [] if filecmp.cmp(file_org, file_tst, shallow=False) else \
+        ['files differ']
+
+
+def cmp_dir(dir_org, dir_tst, tol, workers=None):
+    """Return a dictionary of the differences of each file of dir_org with
+    the file of the same relative path in dir_tst, compared in parallel."""
+
+    import concurrent.futures
+
+    rel = []
+    for root, _, files in os.walk(dir_org):
+        for f in files:
+            if f.endswith(EXTS):
+                rel.append(os.path.relpath(os.path.join(root, f), dir_org))
+    rel.sort()
+
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        res = pool.map(cmp_file, [os.path.join(dir_org, x) for x in rel],
+                       [os.path.join(dir_tst, x) for x in rel],
+                       [tol] * len(rel))
+        diffs = dict(zip(rel, res))
+
+    return diffs
 
 
 # ******************************************************************************
-# Compare original and test files
+# Command line interface
 # ******************************************************************************
+if __name__ == '__main__':
+
+    # --------------------------------------------------------------------------
+    # Get command line arguments
+    # --------------------------------------------------------------------------
+    IS_arg = len(sys.argv)
+    if IS_arg not in (3, 4):
+        print('ERROR - 2 or 3 arguments must be used')
+        raise SystemExit(22)
+
+    file_org = sys.argv[1]
+    file_tst = sys.argv[2]
+    tol = float(sys.argv[3]) if IS_arg == 4 else None
+
+    # --------------------------------------------------------------------------
+    # Check if files exist
+    # --------------------------------------------------------------------------
+    is_dir = os.path.isdir(file_org) and os.path.isdir(file_tst)
+
+    if not is_dir:
+        try:
+            with open(file_org) as file:
+                pass
+        except IOError:
+            print('ERROR - Unable to open ' + file_org)
+            raise SystemExit(22)
+
+        try:
+            with open(file_tst) as file:
+                pass
+        except IOError:
+            print('ERROR - Unable to open ' + file_tst)
+            raise SystemExit(22)
+
+    # --------------------------------------------------------------------------
+    # Compare original and test files
+    # --------------------------------------------------------------------------
+    if is_dir:
+        diffs = cmp_dir(file_org, file_tst, tol or 0.)
+        print('- Compared ' + str(len(diffs)) + ' files')
+    elif tol is not None:
+        diffs = {file_tst: cmp_file(file_org, file_tst, tol)}
+    else:
+        # Clear cache
+        filecmp.clear_cache()
+        diffs = {file_tst: [] if filecmp.cmp(file_org, file_tst,
+                                             shallow=False) else
+                 ['files differ']}
 
-# Clear cache
-filecmp.clear_cache()
+    # If files are not identical, raise error
+    failed = {x: y for x, y in diffs.items() if len(y) > 0}
+    for name, diff in failed.items():
+        for x in diff:
+            print('  - ' + name + ': ' + x)
 
-# If files are not identical, raise error
-if not (filecmp.cmp(file_org, file_tst, shallow=False)):
-    print('ERROR - Comparison failed.')
-    raise SystemExit(99)
-else:
-    print('Comparison successful!')
+    if len(failed) > 0:
+        print('ERROR - Comparison failed.')
+        raise SystemExit(99)
+    else:
+        print('Comparison successful!')
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# tst_synth.py
+# ******************************************************************************
+
+# Purpose:
+# Given an output folder and a number of reaches, this script generates a
+# synthetic MERIT-SWORD input dataset in the folder layout and schemas of the
+# real inputs: tree-structured MERIT-Basins river networks, catchments tiling
+# each region, MeanDRS discharge, dissolved regions and SWORD reaches offset
+# from the larger rivers, along with a file of manual reach deletions. Regions
+# are placed side by side, each draining into the region west of it, and SWORD
+# reaches at region outlets cross into the neighboring region, so that all
+# processing steps can be run and timed without downloading the global
+# datasets.
+
+# Author:
+# Jeffrey Wade, 2024
+
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import sys
+import os
+import numpy as np
+import shapely
+import ms_io
+
+
+# ******************************************************************************
+# Declaration of variables (given as command line arguments)
+# ******************************************************************************
+# 1 - out_dir
+# 2 - n_reach
+# 3 - n_reg (optional, default 2)
+# 4 - seed (optional, default 0)
+
+
+# ******************************************************************************
+# Synthetic dataset parameters
+# ******************************************************************************
+# Continent prefix of SWORD files and pfaf number of generated regions
+REGIONS = [('af', '11'), ('af', '12'), ('af', '13'), ('af', '14'),
+           ('af', '15'), ('af', '16'), ('af', '17'), ('af', '18')]
+
+MB = 'MERIT_Hydro_v07_Basins_v01'
+
+# Width (degrees) of each region, probability for a reach to flow south
+# rather than west, share of reaches with SWORD counterparts, and number of
+# MB reaches per SWORD reach
+REG_DEG = 1.
+P_SOUTH = 0.3
+SWORD_SHARE = 0.1
+SWORD_LEN = 3
+
+META = {'crs': 'EPSG:4326', 'encoding': 'UTF-8'}
+
+
+# ******************************************************************************
+# MERIT-Basins network of a region
+# ******************************************************************************
+def mb_region(pfaf, x0, n_side, rng):
+    """Return the MB reaches and catchments of a region spanning longitudes x0
+    to x0+REG_DEG, as a n_side by n_side grid of catchments with jittered
+    corners. Reaches flow west or south to the next catchment, and reaches of
+    the western column are outlets."""
+
+    cell = REG_DEG / n_side
+    n = n_side * n_side
+    row, col = np.divmod(np.arange(n), n_side)
+
+    # --------------------------------------------------------------------------
+    # Catchments tiling the region, with jittered interior corners
+    # --------------------------------------------------------------------------
+    cy, cx = np.mgrid[0:n_side+1, 0:n_side+1].astype('float64')
+    inner = (cx > 0) & (cx < n_side) & (cy > 0) & (cy < n_side)
+    cx[inner] += rng.uniform(-.3, .3, inner.sum())
+    cy[inner] += rng.uniform(-.3, .3, inner.sum())
+    cx = x0 + cx * cell
+    cy = cy * cell
+
+    ring = [(row, col), (row, col+1), (row+1, col+1), (row+1, col),
+            (row, col)]
+    ring = np.stack([np.stack([cx[r, c], cy[r, c]], axis=-1) for r, c in
+                     ring], axis=1)
+    cat_geom = shapely.polygons(ring)
+
+    # --------------------------------------------------------------------------
+    # River tree
+    # --------------------------------------------------------------------------
+    comid = int(pfaf) * 1000000 + 1 + np.arange(n)
+    south = (rng.random(n) < P_SOUTH) & (row > 0)
+    down = np.where(south, np.arange(n) - n_side, np.arange(n) - 1)
+    down[(col == 0) & ~south] = -1
+
+    # Reaches run from catchment center to the edge shared with the next one
+    center = ring[:, :4].mean(axis=1)
+    edge = np.where(south[:, None], (ring[:, 0] + ring[:, 1]) / 2,
+                    (ring[:, 0] + ring[:, 3]) / 2)
+    riv_geom = shapely.linestrings(np.stack([center, edge], axis=1))
+
+    # Accumulate area downstream, from the furthest diagonal to the outlets
+    unitarea = np.round(shapely.area(cat_geom) * 111. ** 2, 3)
+    uparea = unitarea.copy()
+    diag = row + col
+    for d in range(diag.max(), 0, -1):
+        sel = np.where((diag == d) & (down >= 0))[0]
+        np.add.at(uparea, down[sel], uparea[sel])
+
+    # Upstream reaches, at most from the east and north catchments
+    up = np.zeros((n, 4), dtype='int64')
+    has_down = np.where(down >= 0)[0]
+    slot = np.where(south[has_down], 1, 0)
+    up[down[has_down], slot] = comid[has_down]
+
+    riv = {'COMID': comid,
+           'lengthkm': np.round(shapely.length(riv_geom) * 111., 3),
+           'NextDownID': np.where(down >= 0, comid[down], 0),
+           'uparea': np.round(uparea, 3), 'up1': up[:, 0], 'up2': up[:, 1],
+           'up3': up[:, 2], 'up4': up[:, 3]}
+    cat = {'COMID': comid, 'unitarea': unitarea}
+
+    return riv, riv_geom, down, cat, cat_geom
+
+
+def drain_west(riv, down, riv_east, n_side):
+    """Add the upstream area of the outlets of the region east of riv to the
+    reaches of riv downstream of the catchments they drain into, along its
+    eastern edge, as rivers crossing region boundaries. Returns a boolean
+    array, True for the reaches of these catchments."""
+
+    uparea = riv['uparea'].copy()
+    inflow = np.zeros(len(uparea), dtype=bool)
+    for i_east in np.flatnonzero(riv_east['NextDownID'] == 0):
+        i = (i_east // n_side) * n_side + n_side - 1
+        inflow[i] = True
+        while i >= 0:
+            uparea[i] += riv_east['uparea'][i_east]
+            i = down[i]
+
+    riv['uparea'] = np.round(uparea, 3)
+
+    return inflow
+
+
+# ******************************************************************************
+# SWORD reaches of a region
+# ******************************************************************************
+def sword_region(pfaf, riv, riv_geom, down, x0, n_side, cross, inflow, rng):
+    """Return SWORD reaches following the MB reaches with the largest
+    upstream area, each spanning up to SWORD_LEN MB reaches between
+    confluences and slightly offset from them. Outlet reaches are extended
+    west into the neighboring region if cross is True, and reaches end at the
+    MB reaches of the boolean array inflow, receiving rivers from the east."""
+
+    cell = REG_DEG / n_side
+    uparea = riv['uparea']
+    big = uparea >= np.quantile(uparea, 1 - SWORD_SHARE)
+
+    # Number of large upstream reaches of each reach
+    n_up = np.zeros(len(uparea), dtype='int64')
+    np.add.at(n_up, down[big & (down >= 0)], 1)
+
+    # Reaches start at sources and confluences of large rivers
+    heads = np.where(big & (n_up != 1))[0]
+    chains = []
+    rch_of = {}
+    for head in heads:
+        i = head
+        chain = [i]
+        while down[i] >= 0 and n_up[down[i]] == 1:
+            i = down[i]
+            if len(chain) == SWORD_LEN or inflow[chain[-1]]:
+                chains.append(chain)
+                chain = []
+            chain.append(i)
+        chains.append(chain)
+
+    reach_id = int(pfaf) * 1000000000 + 10 * np.arange(1, len(chains)+1) + 1
+    for k, chain in enumerate(chains):
+        for i in chain:
+            rch_of[i] = k
+
+    # --------------------------------------------------------------------------
+    # Geometries and attributes
+    # --------------------------------------------------------------------------
+    coords = shapely.get_coordinates(riv_geom).reshape(-1, 2, 2)
+    off = cell * .05
+    geom = []
+    dn_id = []
+    for chain in chains:
+        pts = np.concatenate([coords[i, :1] for i in chain] +
+                             [coords[chain[-1], 1:]]) + off
+        if down[chain[-1]] < 0 and cross:
+            pts = np.concatenate([pts, [[x0 - .3 * cell, pts[-1, 1]]]])
+        geom.append(shapely.linestrings(pts))
+        nxt = down[chain[-1]]
+        dn_id.append(reach_id[rch_of[nxt]] if nxt >= 0 else 0)
+    geom = np.array(geom, dtype=object)
+
+    up_id = {x: [] for x in reach_id.tolist()}
+    for x, y in zip(reach_id.tolist(), dn_id):
+        if y != 0:
+            up_id[y].append(x)
+
+    last = np.array([x[-1] for x in chains])
+    facc = np.round(uparea[last] * rng.uniform(.9, 1.1, len(chains)), 3)
+    sword = {'reach_id': reach_id,
+             'reach_len': np.round(shapely.length(geom) * 111000., 2),
+             'width': np.round(rng.uniform(2, 4, len(chains)) *
+                               np.sqrt(facc), 2),
+             'facc': facc,
+             'rch_id_up': np.array([' '.join(str(z) for z in up_id[x]) or
+                                    '0' for x in reach_id.tolist()],
+                                   dtype=object),
+             'rch_id_dn': np.array([str(x) for x in dn_id], dtype=object)}
+
+    return sword, geom, np.array(sorted(rch_of))
+
+
+# ******************************************************************************
+# Generate dataset
+# ******************************************************************************
+def generate(out_dir, n_reach, n_reg=2, seed=0):
+    """Write a synthetic dataset of about n_reach MB reaches in n_reg regions
+    to out_dir/input, and its reach deletions to
+    out_dir/output/ms_riv_edit/meritsword_edits.csv. Returns the regions."""
+
+    rng = np.random.default_rng(seed)
+    n_side = max(int(round(np.sqrt(n_reach / n_reg))), 4)
+    regions = REGIONS[:n_reg]
+
+    path = {x: os.path.join(out_dir, 'input', x) for x in
+            ['SWORD', 'MB/riv', 'MB/cat', 'MeanDRS/cat_disso',
+             'MeanDRS/riv_COR']}
+    for x in path.values():
+        os.makedirs(x, exist_ok=True)
+    edit_dir = os.path.join(out_dir, 'output', 'ms_riv_edit')
+    os.makedirs(edit_dir, exist_ok=True)
+
+    # MB networks of all regions, each draining into the region west of it
+    mb = [mb_region(pfaf, k * REG_DEG, n_side, rng) for k, (_, pfaf) in
+          enumerate(regions)]
+    inflow = [np.zeros(n_side * n_side, dtype=bool) for _ in regions]
+    for k in range(len(regions) - 1, 0, -1):
+        inflow[k-1] = drain_west(mb[k-1][0], mb[k-1][2], mb[k][0], n_side)
+
+    del_id = []
+    for k, (reg, pfaf) in enumerate(regions):
+        x0 = k * REG_DEG
+        stem = 'pfaf_' + pfaf + '_' + MB
+
+        riv, riv_geom, down, cat, cat_geom = mb[k]
+        sword, sword_geom, sw_rch = sword_region(pfaf, riv, riv_geom, down,
+                                                 x0, n_side, k > 0,
+                                                 inflow[k], rng)
+
+        line = dict(META, geometry_type='LineString')
+        poly = dict(META, geometry_type='Polygon')
+        riv_wkb = shapely.to_wkb(riv_geom)
+
+        ms_io.write_layer(os.path.join(path['MB/riv'], 'riv_'+stem+'.shp'),
+                          line, riv, riv_wkb)
+        ms_io.write_layer(os.path.join(path['MB/cat'], 'cat_'+stem+'.shp'),
+                          poly, cat, shapely.to_wkb(cat_geom))
+        ms_io.write_layer(os.path.join(path['MeanDRS/riv_COR'],
+                                       'riv_'+stem+'_GLDAS_COR.shp'), line,
+                          {'COMID': riv['COMID'],
+                           'meanQ': np.round(riv['uparea'] * .01 *
+                                             rng.uniform(.5, 1.5,
+                                                         len(riv_wkb)), 3)},
+                          riv_wkb)
+        ms_io.write_layer(os.path.join(path['MeanDRS/cat_disso'],
+                                       'cat_'+stem+'_disso.shp'), poly,
+                          {'DN': np.array([int(pfaf)])},
+                          shapely.to_wkb([shapely.box(x0, 0, x0 + REG_DEG,
+                                                      REG_DEG)]))
+        ms_io.write_layer(os.path.join(path['SWORD'], reg+'_sword_reaches_hb' +
+                                       pfaf+'_v16.shp'), line, sword,
+                          shapely.to_wkb(sword_geom))
+
+        # Delete a few MB reaches along SWORD rivers
+        del_id.extend(riv['COMID'][rng.choice(sw_rch, max(len(sw_rch) // 500,
+                                                          1),
+                                              replace=False)].tolist())
+
+    with open(os.path.join(edit_dir, 'meritsword_edits.csv'), 'w') as file:
+        file.write('COMID\n')
+        file.writelines(str(x) + '\n' for x in sorted(del_id))
+
+    return regions
+
+
+# ******************************************************************************
+# Command line interface
+# ******************************************************************************
+if __name__ == '__main__':
+
+    # --------------------------------------------------------------------------
+    # Get command line arguments
+    # --------------------------------------------------------------------------
+    IS_arg = len(sys.argv)
+    if IS_arg < 3 or IS_arg > 5:
+        print('ERROR - Between 2 and 4 arguments must be used')
+        raise SystemExit(22)
+
+    out_dir = sys.argv[1]
+    n_reach = int(sys.argv[2])
+    n_reg = int(sys.argv[3]) if IS_arg > 3 else 2
+    seed = int(sys.argv[4]) if IS_arg > 4 else 0
+
+    if not 1 <= n_reg <= len(REGIONS):
+        print('ERROR - Number of regions must be between 1 and ' +
+              str(len(REGIONS)))
+        raise SystemExit(22)
+
+    # --------------------------------------------------------------------------
+    # Generate dataset
+    # --------------------------------------------------------------------------
+    print('- Generating '+str(n_reach)+' reaches in '+str(n_reg)+' regions')
+    regions = generate(out_dir, n_reach, n_reg, seed)
+    print('- Regions: '+','.join(x[1] for x in regions))
@@ -223,6 +223,23 @@ echo "- Comparing MERIT-SWORD network file (.shp)"
     > $cmp_file
 x=$? && if [ $x -gt 0 ] ; then echo "Failed comparison: $cmp_file" >&2 ; exit $x ; fi
 
+mkdir -p "../output_test/ms_riv_network_batch"
+
+echo "- Removing reaches from all MERIT-SWORD river networks (batch mode)"
+../src/ms_rch_delete.py                                                        \
+    ../output/ms_riv_trace/                                                    \
+    ../output/ms_riv_edit/meritsword_edits.csv                                 \
+    ../output_test/ms_riv_network_batch/                                       \
+    > $run_file
+x=$? && if [ $x -gt 0 ] ; then echo "Failed run: $run_file" >&2 ; exit $x ; fi
+
+echo "- Comparing MERIT-SWORD network file from batch mode (.shp)"
+../src/tst_cmp.py                                                              \
+    ../output/ms_riv_network/meritsword_pfaf_${pfaf}_network.shp               \
+    ../output_test/ms_riv_network_batch/meritsword_pfaf_${pfaf}_network.shp    \
+    > $cmp_file
+x=$? && if [ $x -gt 0 ] ; then echo "Failed comparison: $cmp_file" >&2 ; exit $x ; fi
+
 rm -f $run_file
 rm -f $cmp_file
 echo "Success"
@@ -0,0 +1,652 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# tst_synth_chk.py
+# ******************************************************************************
+
+# Purpose:
+# This script checks the incremental and optional modes of MERIT-SWORD on a
+# small synthetic dataset generated with tst_synth.py. The dataset is first
+# processed in full with ms_pipeline.py, and the outputs of each mode are then
+# compared with tst_cmp.py to those of a full run over the same inputs.
+# The following are the possible arguments:
+# - No argument: all unit tests are run
+# - One unique unit test number: this test is run
+# - Two unit test numbers: all tests between those (included) are run
+# The script returns the following exit codes
+# - 0  if all experiments are successful
+# - 22 if some arguments are faulty
+# - 99 if a comparison failed
+
+# Author:
+# Jeffrey Wade, 2024
+
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import sys
+import os
+import glob
+import time
+import shutil
+import subprocess
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC)
+
+import numpy as np
+import shapely
+import ms_io
+import ms_cache
+import ms_catalog
+import ms_shared
+import ms_geom_store
+import ms_pipeline
+import ms_translation
+import ms_trans_store
+import ms_trans_server
+import tst_synth
+
+
+# ******************************************************************************
+# Test parameters
+# ******************************************************************************
+# Folder of the synthetic dataset and of the outputs of the tests, and number
+# of MB reaches of the dataset
+WORK = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                    'output_synth')
+N_REACH = 4000
+
+# Output folders compared between runs
+OUT_DIRS = ['ms_riv_trace', 'ms_riv_network', 'ms_translate',
+            'ms_translate_cat', 'ms_diagnostic', 'ms_transpose']
+
+
+# ******************************************************************************
+# Run scripts and compare outputs
+# ******************************************************************************
+def run(script, args, env=None):
+    """Run script of the src folder with args, exiting with its exit code if
+    it fails."""
+
+    res = subprocess.run([sys.executable, os.path.join(SRC, script)] +
+                         [str(x) for x in args], capture_output=True,
+                         text=True, env=None if env is None else
+                         dict(os.environ, **env))
+    if res.returncode != 0:
+        print('Failed run: '+script, file=sys.stderr)
+        print(res.stdout + res.stderr, file=sys.stderr)
+        raise SystemExit(res.returncode)
+
+    return res.stdout
+
+
+def compare(org, tst, dirs=OUT_DIRS):
+    """Compare the files of the folders dirs of org and tst with tst_cmp.py,
+    exiting with code 99 if they differ."""
+
+    for x in dirs:
+        res = subprocess.run([sys.executable, os.path.join(SRC, 'tst_cmp.py'),
+                              os.path.join(org, x), os.path.join(tst, x)],
+                             capture_output=True, text=True)
+        if res.returncode != 0:
+            print('Failed comparison: '+os.path.join(tst, x), file=sys.stderr)
+            print(res.stdout + res.stderr, file=sys.stderr)
+            raise SystemExit(99)
+
+
+def fail(what):
+    """Exit with code 99 after a failed comparison of what."""
+
+    print('Failed comparison: '+what, file=sys.stderr)
+    raise SystemExit(99)
+
+
+def pipeline(in_dir, out_dir, edits_csv, env=None):
+    """Run all steps of MERIT-SWORD with ms_pipeline.py."""
+
+    run('ms_pipeline.py', [in_dir, out_dir, edits_csv,
+                           ','.join(x[1] for x in REGIONS)], env)
+
+
+# ******************************************************************************
+# Synthetic dataset
+# ******************************************************************************
+REGIONS = tst_synth.REGIONS[:2]
+
+IN_DIR = os.path.join(WORK, 'input')
+EDITS_CSV = os.path.join(WORK, 'output', 'ms_riv_edit', 'meritsword_edits.csv')
+OUT_FULL = os.path.join(WORK, 'out_full')
+
+
+def dataset():
+    """Generate the synthetic dataset and process it in full, unless done by
+    a previous unit test."""
+
+    if not os.path.isdir(OUT_FULL):
+        print('- Generating and processing synthetic dataset')
+        tst_synth.generate(WORK, N_REACH, len(REGIONS))
+        pipeline(IN_DIR, OUT_FULL, EDITS_CSV)
+
+
+def update_copy(name):
+    """Return a copy of the outputs of the full run in a new folder name, to
+    be updated."""
+
+    out_dir = os.path.join(WORK, name)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    shutil.copytree(OUT_FULL, out_dir)
+
+    return out_dir
+
+
+def nodes(in_dir, out_dir, edits_csv):
+    """Return the arguments of the region runs of ms_pipeline.py by name."""
+
+    lay = ms_pipeline.Layout(in_dir, out_dir, edits_csv)
+    sw_to_mb = ms_pipeline.read_overlap(lay.overlap()[0])
+    mb_to_sw = ms_pipeline.read_overlap(lay.overlap()[1])
+
+    return {x.name: x.args for x in
+            ms_pipeline.region_nodes(lay, REGIONS, sw_to_mb, mb_to_sw)}
+
+
+# ******************************************************************************
+# Translations of the full run
+# ******************************************************************************
+DIRECTIONS = ['mb_to_sword', 'sword_to_mb']
+
+
+def translations(direction):
+    """Return the IDs, translated IDs and partial lengths of the reaches of
+    all regions of the full run, in direction 'mb_to_sword' or
+    'sword_to_mb'."""
+
+    trans = [ms_translation.Translation(x) for x in sorted(glob.glob(
+        os.path.join(OUT_FULL, 'ms_translate', direction, '*.nc')))]
+
+    return np.concatenate([x.index for x in trans]), \
+        np.concatenate([x.ids for x in trans]), \
+        np.concatenate([x.part_len for x in trans])
+
+
+def trans_store(direction):
+    """Return the consolidated store of the translations of the full run in
+    direction, built with ms_trans_store.py unless done by a previous unit
+    test."""
+
+    store_nc = os.path.join(WORK, direction+'_store.nc')
+    if not os.path.isfile(store_nc):
+        run('ms_trans_store.py', [os.path.join(OUT_FULL, 'ms_translate',
+                                               direction), store_nc])
+
+    return store_nc
+
+
+# ******************************************************************************
+# Unit tests
+# ******************************************************************************
+def tst_upd_edits():
+    """Update translations after new manual deletions, including reaches of
+    each network from the neighboring region, and compare them with a full
+    run over the new deletions."""
+
+    # --------------------------------------------------------------------------
+    # Delete reaches of each network: reaches of the neighboring region
+    # translated to its SWORD reaches if any, as they change the SWORD-to-MB
+    # translations only, and its own reaches otherwise
+    # --------------------------------------------------------------------------
+    rng = np.random.default_rng(1)
+    with open(EDITS_CSV) as file:
+        del_id = [int(x) for x in file.read().split()[1:]]
+
+    for _, pfaf in REGIONS:
+        comid = ms_io.read_fields(os.path.join(
+            OUT_FULL, 'ms_riv_trace', 'meritsword_pfaf_'+pfaf+'_trace.shp'),
+            ['COMID'])['COMID']
+        sm_ids = ms_translation.Translation(os.path.join(
+            OUT_FULL, 'ms_translate', 'sword_to_mb',
+            'sword_to_mb_pfaf_'+pfaf+'_translate.nc')).ids
+        nbr = np.intersect1d(comid[ms_translation.id_pfaf(comid) !=
+                                   int(pfaf)], sm_ids)
+        del_id += rng.choice(nbr if len(nbr) > 0 else comid, 3,
+                             replace=False).tolist()
+
+    edits_csv = os.path.join(WORK, 'edits_upd.csv')
+    with open(edits_csv, 'w') as file:
+        file.write('COMID\n')
+        file.writelines(str(x) + '\n' for x in sorted(set(del_id)))
+
+    # --------------------------------------------------------------------------
+    # Full run and update of the full run
+    # --------------------------------------------------------------------------
+    print('- Running all steps over new manual deletions')
+    out_ref = os.path.join(WORK, 'out_edits')
+    pipeline(IN_DIR, out_ref, edits_csv)
+
+    print('- Updating translations after new manual deletions')
+    out_upd = update_copy('out_edits_upd')
+    args = nodes(IN_DIR, out_upd, edits_csv)
+    chg_dir = os.path.join(out_upd, 'changed')
+    os.makedirs(chg_dir)
+    chg = {x: os.path.join(chg_dir, 'pfaf_'+x+'_changed.csv') for _, x in
+           REGIONS}
+
+    for _, pfaf in REGIONS:
+        run('ms_rch_delete.py', args['rch_delete_'+pfaf])
+    for _, pfaf in REGIONS:
+        run('ms_translate.py', args['translate_'+pfaf] + [chg[pfaf]])
+    for _, pfaf in REGIONS:
+        run('ms_transpose.py', args['transpose_'+pfaf] + [chg[pfaf]] +
+            [chg[x] for _, x in REGIONS if x != pfaf])
+        run('ms_diagnostic.py', args['diagnostic_'+pfaf] + [chg[pfaf]])
+
+    print('- Comparing updated files')
+    compare(out_ref, out_upd)
+
+
+def tst_rch_delete_batch():
+    """Remove the manual deletions from the networks of all regions in batch
+    mode, and compare them with those of the full run."""
+
+    print('- Removing reaches from all networks')
+    out_bat = os.path.join(WORK, 'out_batch', 'ms_riv_network')
+    os.makedirs(out_bat)
+    run('ms_rch_delete.py', [os.path.join(OUT_FULL, 'ms_riv_trace', ''),
+                             EDITS_CSV, os.path.join(out_bat, '')],
+        {'MS_WORKERS': '2'})
+
+    print('- Comparing network files')
+    compare(OUT_FULL, os.path.dirname(out_bat), ['ms_riv_network'])
+
+
+def sword_version(in_dir, rng):
+    """Write in in_dir/SWORD a new version of the SWORD reaches of each
+    region, with two reaches removed, two moved, two with a changed flow
+    accumulation, and one added."""
+
+    for reg, pfaf in REGIONS:
+        sword_shp = os.path.join(in_dir, 'SWORD', reg+'_sword_reaches_hb' +
+                                 pfaf+'_v16.shp')
+        meta, fields, wkb = ms_io.read_layer(sword_shp, use_cache=False)
+        geom = shapely.from_wkb(wkb)
+        idx = rng.permutation(len(geom))
+        rem, mov, att, src = idx[:2], idx[2:4], idx[4:6], idx[6]
+
+        geom[mov] = shapely.transform(geom[mov], lambda x: x + .003)
+        fields['facc'] = fields['facc'].copy()
+        fields['facc'][att] *= 3
+
+        # Remove reaches and their links, and add a copy of a reach, offset
+        # from it, without links
+        keep = np.setdiff1d(np.arange(len(geom)), rem)
+        new = {x: np.concatenate([y[keep], y[[src]]]) for x, y in
+               fields.items()}
+        new['reach_id'][-1] = fields['reach_id'].max() + 10
+        new['rch_id_up'][-1] = '0'
+        new['rch_id_dn'][-1] = '0'
+        gone = set(str(x) for x in fields['reach_id'][rem])
+        for x in ['rch_id_up', 'rch_id_dn']:
+            new[x] = np.array([' '.join(y for y in z.split() if y not in
+                                        gone) or '0' for z in new[x]],
+                              dtype=object)
+        geom = np.concatenate([geom[keep], shapely.transform(
+            geom[[src]], lambda x: x - .004)])
+
+        ms_io.write_layer(sword_shp, meta, new, shapely.to_wkb(geom))
+
+
+def tst_upd_sword():
+    """Update the networks and translations after changes to SWORD reaches,
+    and compare them with a full run over the new SWORD version."""
+
+    # --------------------------------------------------------------------------
+    # New SWORD version
+    # --------------------------------------------------------------------------
+    in_new = os.path.join(WORK, 'input_sword')
+    shutil.rmtree(in_new, ignore_errors=True)
+    shutil.copytree(IN_DIR, in_new)
+    sword_version(in_new, np.random.default_rng(3))
+
+    # --------------------------------------------------------------------------
+    # Full run and update of the full run
+    # --------------------------------------------------------------------------
+    print('- Running all steps over new SWORD version')
+    out_ref = os.path.join(WORK, 'out_sword')
+    pipeline(in_new, out_ref, EDITS_CSV)
+
+    print('- Updating networks and translations after SWORD changes')
+    out_upd = update_copy('out_sword_upd')
+    args = nodes(in_new, out_upd, EDITS_CSV)
+    lay = ms_pipeline.Layout(in_new, out_upd, EDITS_CSV)
+    for x in ['changed', 'sword_diff']:
+        os.makedirs(os.path.join(out_upd, x))
+    chg = {x: os.path.join(out_upd, 'changed', 'pfaf_'+x+'_changed.csv')
+           for _, x in REGIONS}
+    dif = {x: os.path.join(out_upd, 'sword_diff', 'pfaf_'+x+'_diff.csv')
+           for _, x in REGIONS}
+
+    for reg, pfaf in REGIONS:
+        run('ms_sword_edit.py', [lay.sword_in(reg, pfaf),
+                                 lay.sword_edit(reg, pfaf)])
+        run('ms_sword_diff.py', [os.path.join(OUT_FULL, 'sword_edit',
+                                              os.path.basename(
+                                                  lay.sword_edit(reg, pfaf))),
+                                 lay.sword_edit(reg, pfaf), dif[pfaf]])
+    for _, pfaf in REGIONS:
+        run('ms_riv_trace.py', args['riv_trace_'+pfaf] + [dif[pfaf]])
+    for _, pfaf in REGIONS:
+        run('ms_rch_delete.py', args['rch_delete_'+pfaf])
+    for _, pfaf in REGIONS:
+        run('ms_translate.py', args['translate_'+pfaf] + [chg[pfaf]] +
+            [dif[x] for _, x in REGIONS])
+    for _, pfaf in REGIONS:
+        run('ms_transpose.py', args['transpose_'+pfaf] + [chg[pfaf]] +
+            [chg[x] for _, x in REGIONS if x != pfaf])
+        run('ms_diagnostic.py', args['diagnostic_'+pfaf] + [chg[pfaf]])
+
+    print('- Comparing updated files')
+    compare(out_ref, out_upd)
+
+
+def tst_trans_store():
+    """Look up all reaches in the consolidated translation stores, and
+    compare them with the translation files of the full run."""
+
+    print('- Comparing store lookups with translation files')
+    for direction in DIRECTIONS:
+        index, ids, part_len = translations(direction)
+        store = ms_trans_store.TranslationStore(trans_store(direction))
+        found, ref, p_len = store.lookup(index)
+        if not found.all() or not np.array_equal(ref, ids) or \
+                not np.array_equal(p_len, part_len):
+            fail('translation store, '+direction)
+
+        # IDs absent from the store, of known and unknown regions
+        found, ref, _ = store.lookup([index.max() + 1, 0])
+        if found.any() or ref.any():
+            fail('translation store, '+direction+' absent IDs')
+        store.close()
+
+
+def tst_trans_server():
+    """Query the translations of all reaches from ms_trans_server.py, and
+    compare the answers with the translation files of the full run. Queries
+    with IDs that are not int64 integers must be refused."""
+
+    print('- Starting translation server')
+    sock = os.path.join(WORK, 'trans_server.sock')
+    proc = subprocess.Popen([sys.executable,
+                             os.path.join(SRC, 'ms_trans_server.py')] +
+                            [trans_store(x) for x in DIRECTIONS] + [sock],
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(300):
+            if os.path.exists(sock) or proc.poll() is not None:
+                break
+            time.sleep(.1)
+        conn = ms_trans_server.connect(sock)
+
+        print('- Comparing answers with translation files')
+        for direction in DIRECTIONS:
+            index, ids, part_len = translations(direction)
+            ans = ms_trans_server.query(conn, direction, index)
+            n_ref = (ids > 0).sum(axis=1)
+            if not all(ans['found']) or \
+                    ans['ref'] != [x[:n].tolist() for x, n in
+                                   zip(ids, n_ref)] or \
+                    ans['part_len'] != [x[:n].tolist() for x, n in
+                                        zip(part_len, n_ref)]:
+                fail('translation server, '+direction)
+
+        print('- Sending invalid IDs')
+        for body in ['{"ids": [1.5]}', '{"ids": [true]}', '{"ids": ["1"]}',
+                     '{"ids": [[1]]}', '{"ids": [9223372036854775808]}']:
+            conn.request('POST', '/mb_to_sword', body,
+                         {'Content-Type': 'application/json'})
+            resp = conn.getresponse()
+            resp.read()
+            if resp.status != 400:
+                fail('translation server, answer to '+body)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def tst_catalog():
+    """Refresh a saved catalog after a new version of a SWORD file is added,
+    and compare it with a fresh build. Only the region with several files
+    must be ambiguous, and each version must be resolved by like()."""
+
+    print('- Building catalog of input files')
+    in_dir = os.path.abspath(os.path.join(WORK, 'in_catalog'))
+    shutil.rmtree(in_dir, ignore_errors=True)
+    shutil.copytree(IN_DIR, in_dir)
+    index_json = os.path.join(WORK, 'ms_catalog.json')
+    ms_catalog.build([in_dir], index_json)
+
+    print('- Adding a new version of a SWORD file')
+    sword_dir = os.path.join(in_dir, 'SWORD')
+    sword_v16 = sorted(glob.glob(os.path.join(sword_dir, '*_v16.shp')))
+    pfaf = ms_catalog.pfaf_of(sword_v16[0])
+    for x in glob.glob(sword_v16[0][:-4] + '.*'):
+        shutil.copyfile(x, x.replace('_v16.', '_v17.'))
+    sword_v17 = sword_v16[0].replace('_v16.', '_v17.')
+
+    print('- Comparing refreshed and new catalogs')
+    catalog = ms_catalog.Catalog.load(index_json)
+    for folder in sorted(catalog.folders):
+        catalog.refresh(folder)
+    new = ms_catalog.build([in_dir])
+    keys = ['dataset', 'pfaf', 'path', 'stamp']
+    if sorted(catalog.files) != sorted(new.files) or \
+            any([catalog.files[x][y] for y in keys] !=
+                [new.files[x][y] for y in keys] for x in new.files):
+        fail('refreshed catalog')
+
+    print('- Resolving files of each version')
+    files = catalog.regions(sword_dir)
+    if list(files) != [x for _, x in REGIONS] or files.ambiguous() != [pfaf]:
+        fail('ambiguous regions of catalog')
+    try:
+        files[pfaf]
+        fail('ambiguous region '+pfaf+' of catalog')
+    except ValueError:
+        pass
+    if [files[x] for x in files if x != pfaf] != sword_v16[1:]:
+        fail('unambiguous regions of catalog')
+    if list(catalog.like(sword_v16[0]).values()) != sword_v16 or \
+            dict(catalog.like(sword_v17)) != {pfaf: sword_v17}:
+        fail('files of each version in catalog')
+
+
+def tst_shared():
+    """Read a layer published in shared memory, which must be views of the
+    segment equal to the layer, and process the dataset with the layers read
+    by several regions in shared memory."""
+
+    print('- Reading a layer published in shared memory')
+    shp = sorted(glob.glob(os.path.join(IN_DIR, 'SWORD', '*.shp')))[0]
+    meta, fields, geometry = ms_io.read_layer(shp, use_cache=False)
+    shm = ms_shared.publish(shp)
+    os.environ['MS_SHARED'] = '1'
+    try:
+        meta_shm, fields_shm, geometry_shm = ms_io.read_layer(shp)
+        if list(meta_shm['fields']) != list(meta['fields']) or \
+                any(not np.array_equal(fields_shm[x], fields[x]) or
+                    fields_shm[x].flags.writeable for x in fields):
+            fail('fields of shared layer')
+        if not isinstance(geometry_shm, ms_geom_store.WkbArray) or \
+                geometry_shm.blob.flags.writeable or \
+                list(geometry_shm) != list(geometry):
+            fail('geometries of shared layer')
+    finally:
+        del os.environ['MS_SHARED']
+        ms_shared.release([shm])
+
+    print('- Processing synthetic dataset with shared layers')
+    out_dir = os.path.join(WORK, 'out_shared')
+    shutil.rmtree(out_dir, ignore_errors=True)
+    pipeline(IN_DIR, out_dir, EDITS_CSV, {'MS_SHARED': '1'})
+
+    print('- Comparing files')
+    compare(OUT_FULL, out_dir)
+
+
+def tst_geom_store():
+    """Look up geometries by ID in a geometry store remapped after it was
+    rebuilt, and process the dataset with geometry stores in a given folder
+    mapped one at a time."""
+
+    print('- Looking up geometries of a rebuilt store')
+    store_dir = os.path.join(WORK, 'stores')
+    shutil.rmtree(store_dir, ignore_errors=True)
+    lay_dir = os.path.join(WORK, 'in_store')
+    shutil.rmtree(lay_dir, ignore_errors=True)
+    shutil.copytree(os.path.join(IN_DIR, 'MB', 'riv'), lay_dir)
+    shp = sorted(glob.glob(os.path.join(lay_dir, '*.shp')))
+    _, fields, geometry = ms_io.read_layer(shp[0], ['COMID'], use_cache=False)
+
+    pool = ms_geom_store.StorePool(1)
+    store = ms_geom_store.GeometryStore(
+        ms_geom_store.open_store(shp[0], 'COMID', store_dir).prefix, pool)
+    ms_geom_store.GeometryStore(
+        ms_geom_store.open_store(shp[1], 'COMID', store_dir).prefix, pool)
+    stat = os.stat(shp[0])
+    os.utime(shp[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    ms_geom_store.build_store(shp[0], 'COMID', store_dir)
+
+    rng = np.random.default_rng(0)
+    rows = rng.permutation(len(geometry))
+    if not np.array_equal(store.rows(fields['COMID'][rows]), rows) or \
+            [store.wkb_array()[x] for x in rows] != list(geometry[rows]):
+        fail('geometries of rebuilt store')
+
+    print('- Processing synthetic dataset with geometry stores')
+    out_dir = os.path.join(WORK, 'out_store')
+    shutil.rmtree(out_dir, ignore_errors=True)
+    pipeline(IN_DIR, out_dir, EDITS_CSV, {'MS_STORE_DIR': store_dir,
+                                          'MS_MAX_OPEN': '1'})
+
+    print('- Comparing files')
+    compare(OUT_FULL, out_dir)
+
+
+def tst_cache():
+    """Read layers cached with ms_cache.py, which must be equal to the
+    layers and keep the fiona schema, and process the dataset with all input
+    layers cached."""
+
+    print('- Caching input layers')
+    cache_dir = os.path.join(WORK, 'cache')
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    run('ms_cache.py', [IN_DIR, cache_dir])
+
+    print('- Reading cached layers')
+    for shp in sorted(glob.glob(os.path.join(IN_DIR, '*', '*.shp'))):
+        meta, fields, geometry = ms_io.read_layer(shp, use_cache=False)
+        meta_c, fields_c, geometry_c = ms_cache.read_cached(
+            shp, cache_dir=cache_dir)
+        if list(meta_c['fields']) != list(meta['fields']) or \
+                any(not np.array_equal(fields_c[x], fields[x]) for x in
+                    fields) or list(geometry_c) != list(geometry):
+            fail('cached layer '+shp)
+
+    shp = sorted(glob.glob(os.path.join(IN_DIR, 'SWORD', '*.shp')))[0]
+    cache_fiona = os.path.join(WORK, 'cache_fiona')
+    backend = ms_io.get_backend().name
+    ms_io.set_backend('fiona')
+    try:
+        meta = ms_io.read_layer(shp, use_cache=False)[0]
+        ms_cache.ingest(shp, cache_fiona)
+        meta_c = ms_cache.read_cached(shp, ['reach_id'],
+                                      cache_dir=cache_fiona)[0]
+    finally:
+        ms_io.set_backend(backend)
+    if meta_c.get('schema') != {'geometry': meta['schema']['geometry'],
+                                'properties': {'reach_id': meta['schema']
+                                               ['properties']['reach_id']}}:
+        fail('schema of cached layer')
+
+    print('- Processing synthetic dataset with cached layers')
+    out_dir = os.path.join(WORK, 'out_cache')
+    shutil.rmtree(out_dir, ignore_errors=True)
+    pipeline(IN_DIR, out_dir, EDITS_CSV, {'MS_CACHE_DIR': cache_dir})
+
+    print('- Comparing files')
+    compare(OUT_FULL, out_dir)
+
+
+def tst_threads():
+    """Process the dataset with the pairs of reaches and catchments found
+    with bulk queries and intersected in threads, in tiles."""
+
+    print('- Processing synthetic dataset with threads')
+    out_dir = os.path.join(WORK, 'out_threads')
+    shutil.rmtree(out_dir, ignore_errors=True)
+    pipeline(IN_DIR, out_dir, EDITS_CSV, {'MS_THREADS': '3',
+                                          'MS_TILE_DEG': '0.3'})
+
+    print('- Comparing files')
+    compare(OUT_FULL, out_dir)
+
+
+UNITS = [('Update translations after new manual deletions', tst_upd_edits),
+         ('Remove reaches of all regions in batch mode',
+          tst_rch_delete_batch),
+         ('Update networks and translations after SWORD changes',
+          tst_upd_sword),
+         ('Look up translations in the translation stores',
+          tst_trans_store),
+         ('Query translations from the translation server',
+          tst_trans_server),
+         ('Refresh the catalog and resolve files of each version',
+          tst_catalog),
+         ('Process the dataset with layers in shared memory', tst_shared),
+         ('Process the dataset with rebuilt geometry stores',
+          tst_geom_store),
+         ('Process the dataset with cached layers', tst_cache),
+         ('Process the dataset with pairs intersected in threads',
+          tst_threads)]
+
+
+# ******************************************************************************
+# Select and run unit tests
+# ******************************************************************************
+if __name__ == '__main__':
+
+    # --------------------------------------------------------------------------
+    # Get command line arguments
+    # --------------------------------------------------------------------------
+    IS_arg = len(sys.argv)
+    if IS_arg > 3:
+        print('A maximum of two options can be used', file=sys.stderr)
+        raise SystemExit(22)
+
+    tot = len(UNITS)
+    fst = int(sys.argv[1]) if IS_arg > 1 else 1
+    lst = int(sys.argv[2]) if IS_arg > 2 else fst if IS_arg > 1 else tot
+    if not 1 <= fst <= lst <= tot:
+        print('Unit tests must be between 1 and '+str(tot), file=sys.stderr)
+        raise SystemExit(22)
+
+    print('********************')
+    print('Performing unit tests: '+str(fst)+'-'+str(lst))
+    print('********************')
+
+    # --------------------------------------------------------------------------
+    # Run unit tests
+    # --------------------------------------------------------------------------
+    dataset()
+    for unt in range(fst, lst + 1):
+        print('Running unit test '+str(unt)+'/'+str(tot))
+        print(UNITS[unt - 1][0])
+        UNITS[unt - 1][1]()
+        print('Success')
+        print('********************')
+
+    # --------------------------------------------------------------------------
+    # Clean up
+    # --------------------------------------------------------------------------
+    shutil.rmtree(WORK)